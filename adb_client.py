@@ -0,0 +1,271 @@
+import logging
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import metrics
+
+# ADB server connection details
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = 5037
+ADB_PATH = 'adb'  # Only used to start the adb server when it is not running
+
+DEFAULT_TIMEOUT = 10.0  # Seconds allowed for a single command
+MAX_CONNECTIONS = 16  # Concurrent sockets opened against one adb server
+
+
+class AdbError(Exception):
+    """Raised when the adb server rejects a request or cannot be reached."""
+
+
+class AdbTimeout(AdbError):
+    """Raised when an adb command does not finish within its timeout."""
+
+
+class AdbRejected(AdbError):
+    """Raised when the adb server answers a request with FAIL."""
+
+
+def _encode_request(request):
+    """Frame a request as the adb server expects: 4 hex digit length + payload."""
+    data = request.encode('utf-8')
+    return f"{len(data):04x}".encode('ascii') + data
+
+
+def _recv_exact(sock, size):
+    """Read exactly `size` bytes from the socket."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            raise AdbError(f"adb server closed the connection with {remaining} bytes still expected")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_all(sock, deadline=None):
+    """Read until the adb server closes the stream or the deadline passes."""
+    chunks = []
+    while True:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout('deadline exceeded')
+            sock.settimeout(remaining)
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def _read_length_prefixed(sock):
+    """Read one 4 hex digit length prefixed message."""
+    length = int(_recv_exact(sock, 4), 16)
+    return _recv_exact(sock, length).decode('utf-8', errors='ignore')
+
+
+def _read_status(sock, request):
+    """Consume the OKAY/FAIL status that answers every request."""
+    status = _recv_exact(sock, 4)
+    if status == b'OKAY':
+        return
+    if status == b'FAIL':
+        raise AdbRejected(f"adb request '{request}' failed: {_read_length_prefixed(sock)}")
+    raise AdbError(f"Unexpected adb status {status!r} for request '{request}'")
+
+
+class AdbConnectionPool:
+    """Bounds the number of sockets opened against one adb server.
+
+    The adb server closes a socket once a host service has answered or a shell
+    stream has ended, so sockets cannot be reused across commands; the pool
+    caps concurrency so a large fleet does not flood the server.
+    """
+
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT, max_connections=MAX_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._server_started = False
+        self._start_lock = threading.Lock()
+
+    def _start_server(self):
+        """Start the local adb server once if nothing is listening yet."""
+        with self._start_lock:
+            if self._server_started:
+                return
+            self._server_started = True
+            logging.info(f"Starting adb server on port {self.port}")
+            subprocess.run([ADB_PATH, '-P', str(self.port), 'start-server'],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def open_socket(self, timeout):
+        """Open a socket to the adb server without taking a slot, starting the server if needed."""
+        try:
+            return socket.create_connection((self.host, self.port), timeout=timeout)
+        except ConnectionRefusedError:
+            if self._server_started or self.host not in ('127.0.0.1', 'localhost'):
+                raise
+        self._start_server()
+        return socket.create_connection((self.host, self.port), timeout=timeout)
+
+    @contextmanager
+    def connection(self, timeout=DEFAULT_TIMEOUT):
+        """Yield a fresh socket to the adb server, waiting for a free slot first."""
+        deadline = time.monotonic() + timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise AdbTimeout(f"No free adb connection slot within {timeout}s")
+        try:
+            try:
+                sock = self.open_socket(max(deadline - time.monotonic(), 0.1))
+            except socket.timeout as e:
+                raise AdbTimeout(f"Timed out connecting to adb server {self.host}:{self.port}") from e
+            except OSError as e:
+                raise AdbError(f"Cannot reach adb server {self.host}:{self.port}: {e}") from e
+            try:
+                sock.settimeout(max(deadline - time.monotonic(), 0.1))
+                yield sock
+            finally:
+                sock.close()
+        finally:
+            self._slots.release()
+
+
+class AdbClient:
+    """Talks to the adb server socket directly instead of spawning `adb` processes."""
+
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT,
+                 max_connections=MAX_CONNECTIONS, timeout=DEFAULT_TIMEOUT):
+        self.pool = AdbConnectionPool(host, port, max_connections)
+        self.timeout = timeout
+
+    def _request(self, sock, request):
+        sock.sendall(_encode_request(request))
+        _read_status(sock, request)
+
+    def host_request(self, service, timeout=None, op='adb.host', device=''):
+        """Run a host service that answers with one length prefixed message."""
+        try:
+            with metrics.timed(op, device, (AdbTimeout, socket.timeout)), \
+                    self.pool.connection(timeout or self.timeout) as sock:
+                self._request(sock, service)
+                return _read_length_prefixed(sock)
+        except socket.timeout as e:
+            raise AdbTimeout(f"adb request '{service}' timed out") from e
+        except OSError as e:
+            raise AdbError(f"adb request '{service}' failed: {e}") from e
+
+    def devices(self, timeout=None):
+        """Return a list of (serial, state) tuples for every device the server knows."""
+        return parse_device_list(self.host_request('host:devices', timeout, 'adb.devices'))
+
+    def connect(self, address, port=5555, timeout=None):
+        """Ask the adb server to connect to a network device; returns (success, message)."""
+        message = self.host_request(f"host:connect:{address}:{port}", timeout, 'adb.connect', address)
+        return 'connected to' in message.lower() and 'failed' not in message.lower(), message
+
+    def disconnect(self, address, port=5555, timeout=None):
+        """Ask the adb server to drop a network device."""
+        return self.host_request(f"host:disconnect:{address}:{port}", timeout, 'adb.disconnect', address)
+
+    def get_state(self, serial, timeout=None):
+        """Return the device state ('device', 'offline', ...) or None if unknown."""
+        try:
+            return self.host_request(f"host-serial:{serial}:get-state", timeout, 'adb.get-state', serial)
+        except AdbError as e:
+            logging.debug(f"get-state for {serial} failed: {e}")
+            return None
+
+    def shell(self, serial, command, timeout=None):
+        """Run a shell command on the device and return its output."""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        try:
+            with metrics.timed('adb.shell', serial, (AdbTimeout, socket.timeout)), self.pool.connection(timeout) as sock:
+                self._request(sock, f"host:transport:{serial}")
+                self._request(sock, f"shell:{command}")
+                return _recv_all(sock, deadline).decode('utf-8', errors='ignore')
+        except socket.timeout as e:
+            raise AdbTimeout(f"adb shell '{command}' on {serial} timed out after {timeout}s") from e
+        except OSError as e:
+            raise AdbError(f"adb shell '{command}' on {serial} failed: {e}") from e
+
+    def open_stream(self, serial, command, timeout=None):
+        """Start a long-running shell command and return its socket for the caller to read.
+
+        Streams do not take a pool slot, since they stay open for as long as
+        the device is connected; the caller is responsible for closing them.
+        """
+        timeout = timeout or self.timeout
+        try:
+            sock = self.pool.open_socket(timeout)
+        except OSError as e:
+            raise AdbError(f"Cannot reach adb server {self.pool.host}:{self.pool.port}: {e}") from e
+        try:
+            self._request(sock, f"host:transport:{serial}")
+            self._request(sock, f"shell:{command}")
+        except (OSError, AdbError) as e:
+            sock.close()
+            if isinstance(e, AdbError):
+                raise
+            raise AdbError(f"adb shell '{command}' on {serial} failed: {e}") from e
+        sock.settimeout(None)
+        return sock
+
+    def track_devices(self, timeout=None):
+        """Open a host:track-devices stream; read updates from it with read_device_list()."""
+        timeout = timeout or self.timeout
+        try:
+            sock = self.pool.open_socket(timeout)
+        except OSError as e:
+            raise AdbError(f"Cannot reach adb server {self.pool.host}:{self.pool.port}: {e}") from e
+        try:
+            self._request(sock, 'host:track-devices')
+        except (OSError, AdbError) as e:
+            sock.close()
+            if isinstance(e, AdbError):
+                raise
+            raise AdbError(f"adb request 'host:track-devices' failed: {e}") from e
+        sock.settimeout(None)
+        return sock
+
+
+def parse_device_list(output):
+    """Turn `serial<TAB>state` lines into a list of (serial, state) tuples."""
+    devices = []
+    for line in output.splitlines():
+        parts = line.split('\t')
+        if len(parts) == 2:
+            devices.append((parts[0], parts[1]))
+    return devices
+
+
+def read_device_list(sock):
+    """Block until the next full device list arrives on a track-devices stream."""
+    return parse_device_list(_read_length_prefixed(sock))
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process wide AdbClient."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = AdbClient()
+        return _default_client
+
+
+def use_server(host=ADB_SERVER_HOST, port=ADB_SERVER_PORT):
+    """Point the process wide AdbClient at another adb server, e.g. one per sharded worker."""
+    global _default_client
+    with _default_client_lock:
+        _default_client = AdbClient(host, port)
+        return _default_client
@@ -0,0 +1,235 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from logcat_capture import safe_name
+
+DATA_FOLDER = 'data'
+INDEX_NAME = 'artifacts.sqlite'
+MAX_BYTES = 20 * 1024 ** 3  # Total size of all artifacts before the oldest are deleted
+MAX_AGE = 30 * 86400  # Seconds an artifact is kept at most
+TEXT_SUFFIXES = ('.txt', '.log')  # Artifacts gzipped when they are filed
+HASH_CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    host TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_host ON artifacts (host, kind, ended);
+CREATE INDEX IF NOT EXISTS artifacts_device ON artifacts (device, kind, ended);
+CREATE INDEX IF NOT EXISTS artifacts_hash ON artifacts (sha256);
+CREATE INDEX IF NOT EXISTS artifacts_ended ON artifacts (ended);
+"""
+COLUMNS = 'id, device, host, kind, path, size, started, ended, sha256, added'
+
+
+class Artifact:
+    """One indexed file: a logcat segment or a bugreport."""
+
+    __slots__ = ('id', 'device', 'host', 'kind', 'path', 'size', 'started', 'ended', 'sha256', 'added')
+
+    def __init__(self, id, device, host, kind, path, size, started, ended, sha256, added):
+        self.id = id
+        self.device = device
+        self.host = host
+        self.kind = kind
+        self.path = path  # Absolute path of the stored file
+        self.size = size
+        self.started = started  # Epoch seconds covered by the artifact
+        self.ended = ended
+        self.sha256 = sha256  # Of the uncompressed payload
+        self.added = added
+
+    def __repr__(self):
+        return f"Artifact(kind={self.kind!r}, host={self.host!r}, path={self.path!r}, size={self.size})"
+
+
+def payload_hash(path):
+    """SHA-256 of a file's payload, read through gzip for .gz files so the gzip header does not count."""
+    digest = hashlib.sha256()
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compress_file(path):
+    """Gzip a text file next to itself, remove the original and return the new path and payload hash."""
+    digest = hashlib.sha256()
+    compressed_path = f"{path}.gz"
+    with open(path, 'rb') as source, gzip.open(compressed_path, 'wb', compresslevel=6) as target:
+        for chunk in iter(lambda: source.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+            target.write(chunk)
+    os.remove(path)
+    return compressed_path, digest.hexdigest()
+
+
+class ArtifactStore:
+    """Files artifacts under <root>/<kind>/<device>/<YYYY-MM-DD>/ and indexes them in SQLite.
+
+    Identical payloads of the same device and kind are stored once. Size and
+    age retention run on every add, oldest artifacts first.
+    """
+
+    def __init__(self, root=DATA_FOLDER, max_bytes=MAX_BYTES, max_age=MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, INDEX_NAME), timeout=30, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _artifact(self, row):
+        artifact = Artifact(*row)
+        artifact.path = os.path.join(self.root, artifact.path)
+        return artifact
+
+    def add(self, path, device, kind, host='', started=None, ended=None):
+        """Move a finished file into the store and index it; returns its Artifact, None if it was empty."""
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+            return None
+        ended = ended if ended is not None else os.path.getmtime(path)
+        started = started if started is not None else ended
+        if path.endswith(TEXT_SUFFIXES):
+            path, sha256 = compress_file(path)
+        else:
+            sha256 = payload_hash(path)
+
+        with self._lock:
+            row = self._db.execute(f"SELECT {COLUMNS} FROM artifacts WHERE sha256 = ? AND device = ? AND kind = ?",
+                                   (sha256, device, kind)).fetchone()
+            if row is not None:
+                os.remove(path)
+                logging.info(f"Skipped {kind} of {device}, identical to {row[4]}")
+                return self._artifact(row)
+
+            day = datetime.date.fromtimestamp(ended).isoformat()
+            relative = os.path.join(kind, safe_name(device), day, os.path.basename(path))
+            target = os.path.join(self.root, relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+            size = os.path.getsize(target)
+            added = time.time()
+            with self._db:
+                cursor = self._db.execute(
+                    "INSERT OR REPLACE INTO artifacts (device, host, kind, path, size, started, ended, sha256, added) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (device, host, kind, relative, size, started, ended, sha256, added))
+            artifact = Artifact(cursor.lastrowid, device, host, kind, target, size, started, ended, sha256, added)
+        self.enforce_retention()
+        return artifact
+
+    def latest(self, kind, host=None, device=None):
+        """Newest artifact of a kind for a host or device, None if there is none."""
+        column, value = ('host', host) if host is not None else ('device', device)
+        with self._lock:
+            row = self._db.execute(f"SELECT {COLUMNS} FROM artifacts WHERE {column} = ? AND kind = ? "
+                                   "ORDER BY ended DESC LIMIT 1", (value, kind)).fetchone()
+        return self._artifact(row) if row is not None else None
+
+    def find(self, kind=None, host=None, device=None, since=None, until=None):
+        """Artifacts matching every given filter and overlapping [since, until], oldest first."""
+        clauses, params = [], []
+        for column, value in (('kind', kind), ('host', host), ('device', device)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("ended >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("started <= ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._db.execute(f"SELECT {COLUMNS} FROM artifacts{where} ORDER BY ended", params).fetchall()
+        return [self._artifact(row) for row in rows]
+
+    def total_size(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+    def enforce_retention(self):
+        """Delete artifacts past max_age, then the oldest ones until the store fits in max_bytes."""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            removed = self._db.execute("SELECT id, path FROM artifacts WHERE ended < ?", (cutoff,)).fetchall()
+            excess = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts WHERE ended >= ?",
+                                      (cutoff,)).fetchone()[0] - self.max_bytes
+            if excess > 0:
+                rows = self._db.execute("SELECT id, path, size FROM artifacts WHERE ended >= ? ORDER BY ended",
+                                        (cutoff,)).fetchall()
+                for artifact_id, path, size in rows:
+                    if excess <= 0:
+                        break
+                    removed.append((artifact_id, path))
+                    excess -= size
+            if not removed:
+                return 0
+            with self._db:
+                self._db.executemany("DELETE FROM artifacts WHERE id = ?", [(artifact_id,) for artifact_id, _ in removed])
+        for _, path in removed:
+            path = os.path.join(self.root, path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Failed to delete expired artifact {path}: {e}")
+            try:
+                os.rmdir(os.path.dirname(path))  # Drop the day folder once it is empty
+            except OSError:
+                pass
+        logging.info(f"Retention removed {len(removed)} artifacts from {self.root}")
+        return len(removed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the artifact index.")
+    parser.add_argument('command', choices=('latest', 'list', 'prune'))
+    parser.add_argument('--root', default=DATA_FOLDER)
+    parser.add_argument('--kind', help="logcat or bugreport")
+    parser.add_argument('--host')
+    parser.add_argument('--device')
+    args = parser.parse_args()
+    store = ArtifactStore(args.root)
+    if args.command == 'latest':
+        artifact = store.latest(args.kind or 'bugreport', host=args.host, device=args.device)
+        if artifact is None:
+            return 1
+        print(artifact.path)
+    elif args.command == 'list':
+        for artifact in store.find(args.kind, args.host, args.device):
+            print(f"{artifact.kind}\t{artifact.host}\t{artifact.size}\t{artifact.path}")
+    else:
+        print(f"{store.enforce_retention()} artifacts removed, {store.total_size()} bytes kept")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
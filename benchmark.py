@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Fleet sizes swept by default
+DEFAULT_SIZES = (100, 500, 1000, 5000)
+DEFAULT_DURATION = 60  # Seconds of polling measured per fleet size
+REGRESSION_TOLERANCE = 0.2  # Allowed relative worsening against a baseline report
+
+# Report columns: (result key, header, format)
+COLUMNS = (
+    ('devices', 'devices', '{:>8}'),
+    ('sweep_seconds', 'sweep s', '{:>8.1f}'),
+    ('cycle_p50', 'cyc p50', '{:>8.3f}'),
+    ('cycle_p95', 'cyc p95', '{:>8.3f}'),
+    ('memory_cycle_p95', 'mem p95', '{:>8.3f}'),
+    ('lag_p95', 'lag p95', '{:>8.3f}'),
+    ('missed', 'missed', '{:>7}'),
+    ('items_per_second', 'items/s', '{:>9.1f}'),
+    ('adb_errors', 'adb err', '{:>8}'),
+    ('cpu_percent', 'cpu %', '{:>7.1f}'),
+    ('peak_rss_mb', 'rss MB', '{:>7.1f}'),
+)
+LOWER_IS_BETTER = ('cycle_p95', 'memory_cycle_p95', 'cpu_percent', 'peak_rss_mb')
+HIGHER_IS_BETTER = ('items_per_second',)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, None where it cannot be measured."""
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_monitor(size, adb_port, trapper_port, inventory_path, duration, workdir, logcat):
+    """Run the real polling code against the simulated fleet and measure it (child process)."""
+    os.chdir(workdir)
+    import adb_client
+    import connect_to_adb
+    import monitoring_adb
+    from bugreport_queue import BugreportQueue
+    from fleet_sim import trapper_stats
+    from instrumentation import metrics
+    from logcat_capture import LogcatCaptureManager
+    from scheduler import PollScheduler
+    from zabbix_sender import ZabbixSender
+
+    data_folder = os.path.join(workdir, 'data')
+    adb_client._default_client = adb_client.AdbClient(port=adb_port)
+    monitoring_adb.CSV_FILE_PATH = inventory_path
+    monitoring_adb.DATA_FOLDER = data_folder
+    monitoring_adb.SPOOL_FOLDER = os.path.join(data_folder, 'spool')
+    monitoring_adb.LEAK_SNAPSHOT_PATH = os.path.join(data_folder, 'memory_leak.snapshot')
+    monitoring_adb.STATS_PORT = None
+    monitoring_adb.logcat_captures = LogcatCaptureManager(data_folder)
+    monitoring_adb.bugreport_queue = BugreportQueue(data_folder)
+    monitoring_adb.zabbix_sender = ZabbixSender('127.0.0.1', trapper_port)
+    if not logcat:
+        monitoring_adb.POLL_INTERVALS['logs'] = 10 ** 9  # Never due within the run
+    monitoring_adb.setup()
+    monitoring_adb.bugreport_queue.stop()  # Triggers still queue, but no `adb bugreport` is spawned
+
+    cache = connect_to_adb.PortCache(os.path.join(workdir, 'adb_port_cache.json'))
+    sweep = connect_to_adb.sweep('adb', connect_to_adb.read_devices(inventory_path), cache)
+
+    before = trapper_stats(trapper_port)
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    scheduler = PollScheduler()
+    scheduler.add_job('*', 'zabbix-flush', monitoring_adb.flush_zabbix, monitoring_adb.ZABBIX_FLUSH_INTERVAL)
+    monitoring_adb.sync_devices(scheduler, monitoring_adb.read_devices(inventory_path))
+
+    async def run():
+        asyncio.get_running_loop().call_later(duration, scheduler.stop)
+        await scheduler.run()
+
+    asyncio.run(run())
+    monitoring_adb.shutdown()
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    after = trapper_stats(trapper_port)
+
+    def quantile(name, q):
+        histogram = metrics.histogram(name)
+        return histogram.quantile(q) if histogram is not None else 0.0
+
+    adb_errors = sum(count for (name, device), count in metrics.counters.items()
+                     if not device and name.startswith('adb.'))
+    return {
+        'devices': size,
+        'duration': round(elapsed, 1),
+        'sweep_seconds': round(sweep.duration, 2),
+        'connected': len(sweep.connected) + len(sweep.neat),
+        'cycle_p50': quantile('cycle.metrics', 0.5),
+        'cycle_p95': quantile('cycle.metrics', 0.95),
+        'memory_cycle_p95': quantile('cycle.memory', 0.95),
+        'lag_p95': quantile('scheduler.lag', 0.95),
+        'missed': metrics.counter('scheduler.missed'),
+        'items': after['items'] - before['items'],
+        'items_per_second': (after['items'] - before['items']) / elapsed,
+        'adb_errors': adb_errors,
+        'cpu_seconds': round(cpu, 2),
+        'cpu_percent': cpu * 100.0 / elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def benchmark_size(size, args):
+    """Start a simulated fleet of `size` devices and measure the monitor against it in a fresh process."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix=f"zbx-bench-{size}-") as workdir:
+        inventory_path = os.path.join(workdir, 'fleet.csv')
+        fleet = subprocess.Popen(
+            [sys.executable, os.path.join(here, 'fleet_sim.py'), '--devices', str(size),
+             '--latency', str(args.latency), '--jitter', str(args.jitter),
+             '--failure-rate', str(args.failure_rate), '--offline-rate', str(args.offline_rate),
+             '--logcat-rate', str(args.logcat_rate), '--inventory', inventory_path, '--seed', str(args.seed)],
+            stdout=subprocess.PIPE, text=True)
+        try:
+            ports = json.loads(fleet.stdout.readline())
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', '--sizes', str(size),
+                 '--adb-port', str(ports['adb_port']), '--trapper-port', str(ports['trapper_port']),
+                 '--inventory', inventory_path, '--workdir', workdir, '--duration', str(args.duration)]
+                + (['--logcat'] if args.logcat else []),
+                cwd=here, stdout=subprocess.PIPE, text=True, timeout=args.duration * 10 + 300)
+        finally:
+            fleet.terminate()
+            fleet.wait()
+        if child.returncode != 0:
+            raise RuntimeError(f"Benchmark of {size} devices failed with exit code {child.returncode}")
+        return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def format_table(results):
+    widths = [len(fmt.format(0)) for _, _, fmt in COLUMNS]
+    lines = [' '.join(f"{header:>{width}}" for (_, header, _), width in zip(COLUMNS, widths))]
+    for result in results:
+        cells = []
+        for (key, _, fmt), width in zip(COLUMNS, widths):
+            value = result.get(key)
+            cells.append(fmt.format(value) if value is not None else f"{'-':>{width}}")
+        lines.append(' '.join(cells))
+    return '\n'.join(lines)
+
+
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Compare against an earlier report, fleet size by fleet size."""
+    regressions = []
+    previous = {result['devices']: result for result in baseline}
+    for result in results:
+        old = previous.get(result['devices'])
+        if old is None:
+            continue
+        for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            new_value, old_value = result.get(key), old.get(key)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if key in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(f"{result['devices']} devices: {key} {old_value:.3f} -> {new_value:.3f} "
+                                   f"({change * 100:+.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the monitor against simulated fleets of growing size.")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma separated fleet sizes")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="Seconds of polling per size")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per simulated adb shell round-trip")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--failure-rate', type=float, default=0.01)
+    parser.add_argument('--offline-rate', type=float, default=0.02)
+    parser.add_argument('--logcat-rate', type=float, default=1.0, help="Logcat lines per second per device")
+    parser.add_argument('--logcat', action='store_true', help="Also run the per-device logcat streams")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write the report to this file")
+    parser.add_argument('--baseline', help="Earlier --json report to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    # Internal: one measurement run in a fresh process
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--adb-port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--trapper-port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--inventory', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    if args.child:
+        result = run_monitor(sizes[0], args.adb_port, args.trapper_port, args.inventory, args.duration,
+                             args.workdir, args.logcat)
+        print(json.dumps(result))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = []
+    for size in sizes:
+        logging.info(f"Benchmarking {size} simulated devices for {args.duration:.0f}s")
+        results.append(benchmark_size(size, args))
+    print(format_table(results))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import datetime
+import glob
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import adb_client
+from logcat_capture import safe_name
+
+MAX_CONCURRENT = 2  # Bugreports running at once on this collector
+PER_SERVER_CONCURRENT = 1  # Bugreports running at once through one adb server
+MAX_PENDING = 50  # Queued bugreports beyond this are dropped, e.g. when a whole site comes back at once
+COOLDOWN = 6 * 3600  # Seconds before the same device may produce another bugreport
+RETRY_DELAY = 10 * 60  # Seconds before a device whose bugreport failed may be tried again
+BUGREPORT_TIMEOUT = 15 * 60  # Seconds allowed for a single `adb bugreport`
+
+
+def server_args(adb_server):
+    """adb CLI options that select the given "host:port" server; none for the default one."""
+    host, _, port = adb_server.rpartition(':')
+    if not host or not port.isdigit():
+        return []
+    return ['-H', host, '-P', port]
+
+
+class BugreportJob:
+    """One pending or running bugreport for a device."""
+
+    def __init__(self, udid, hostname, reason, adb_server):
+        self.udid = udid
+        self.hostname = hostname
+        self.reason = reason
+        self.adb_server = adb_server  # "host:port" of the adb server the device is attached to, or 'default'
+        self.queued_at = time.time()
+
+
+class BugreportQueue:
+    """Runs bugreports one job per device with global and per-adb-server limits and a cooldown.
+
+    Each job writes into its own temporary directory and the resulting zip is
+    renamed atomically into data/bugreport/<device>/, so concurrent jobs and
+    logcat files can never be mistaken for each other's output.
+    """
+
+    def __init__(self, data_folder, max_concurrent=MAX_CONCURRENT, per_server_concurrent=PER_SERVER_CONCURRENT,
+                 cooldown=COOLDOWN, on_complete=None, max_pending=MAX_PENDING, retry_delay=RETRY_DELAY):
+        self.data_folder = data_folder
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.per_server_concurrent = per_server_concurrent
+        self.cooldown = cooldown
+        self.retry_delay = retry_delay
+        self.on_complete = on_complete  # Called as on_complete(job, path) after a successful bugreport
+        self._pending = []
+        self._in_flight = {}  # udid -> job, pending or running
+        self._running_per_server = {}
+        self._not_before = {}  # udid -> time before which new triggers are ignored (cooldown or retry delay)
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._workers = []
+
+    def start(self):
+        if self._workers:
+            return
+        self._stopping = False
+        for i in range(self.max_concurrent):
+            worker = threading.Thread(target=self._work, name=f"bugreport-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Let running bugreports finish and stop picking up queued ones."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._workers = []
+
+    def request(self, udid, hostname, reason, adb_server='default'):
+        """Queue a bugreport unless one is already in flight, the device is cooling down or the queue is full."""
+        with self._condition:
+            if udid in self._in_flight:
+                logging.debug(f"Bugreport for {udid} already in flight, ignoring trigger '{reason}'")
+                return False
+            if time.time() < self._not_before.get(udid, 0.0):
+                logging.debug(f"Bugreport for {udid} in cooldown, ignoring trigger '{reason}'")
+                return False
+            if len(self._pending) >= self.max_pending:
+                logging.warning(f"Bugreport queue full ({self.max_pending} pending), dropping trigger '{reason}' "
+                                f"for {udid}")
+                return False
+            job = BugreportJob(udid, hostname, reason, adb_server)
+            self._in_flight[udid] = job
+            self._pending.append(job)
+            self._condition.notify()
+        logging.info(f"Bugreport queued for {hostname} ({udid}): {reason}")
+        return True
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending)
+
+    def _next_job(self):
+        """Pop the oldest job whose adb server has a free slot (condition lock held)."""
+        for index, job in enumerate(self._pending):
+            if self._running_per_server.get(job.adb_server, 0) < self.per_server_concurrent:
+                return self._pending.pop(index)
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = None
+                while not self._stopping:
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    self._condition.wait()
+                if job is None:
+                    return
+                self._running_per_server[job.adb_server] = self._running_per_server.get(job.adb_server, 0) + 1
+            path = None
+            try:
+                path = self.run(job)
+                if path and self.on_complete is not None:
+                    self.on_complete(job, path)
+            except Exception as e:
+                logging.error(f"Bugreport for {job.udid} failed: {e}")
+            finally:
+                # Only a captured report starts the cooldown; a failed one may be retried soon
+                delay = self.cooldown if path else self.retry_delay
+                with self._condition:
+                    self._running_per_server[job.adb_server] -= 1
+                    self._in_flight.pop(job.udid, None)
+                    self._not_before[job.udid] = time.time() + delay
+                    self._condition.notify_all()
+
+    def run(self, job):
+        """Collect one bugreport into a private temp directory and move it into place."""
+        device_folder = os.path.join(self.data_folder, 'bugreport', safe_name(job.udid))
+        timestamp = datetime.datetime.now().isoformat().replace(":", "-")  # Replace colons with hyphens
+        tmp_folder = os.path.join(device_folder, f".tmp-{timestamp}")
+        os.makedirs(tmp_folder, exist_ok=True)
+        try:
+            started = time.monotonic()
+            result = subprocess.run([adb_client.ADB_PATH, *server_args(job.adb_server), '-s', job.udid, 'bugreport', tmp_folder],
+                                    capture_output=True, text=True, errors='ignore', timeout=BUGREPORT_TIMEOUT)
+            if result.returncode != 0:
+                logging.error(f"Bugreport for {job.udid} failed: {result.stderr.strip()}")
+                return None
+
+            reports = glob.glob(os.path.join(tmp_folder, '*.zip'))
+            if not reports:
+                logging.error(f"Bugreport for {job.udid} produced no zip file")
+                return None
+
+            new_file_path = os.path.join(device_folder, f"bugreport_{safe_name(job.hostname)}_{timestamp}.zip")
+            os.replace(reports[0], new_file_path)
+            logging.info(f"Bugreport collected for {job.udid} ({job.reason}) in "
+                         f"{time.monotonic() - started:.0f}s and saved to {new_file_path}")
+            return new_file_path
+        except subprocess.TimeoutExpired:
+            logging.error(f"Bugreport for {job.udid} timed out after {BUGREPORT_TIMEOUT}s")
+            return None
+        finally:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
@@ -1,10 +1,51 @@
 import subprocess
-import csv
-import re
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import adb_client
+import inventory
+from adb_client import AdbError, get_client
+from inventory import get_inventory, is_valid_ip
+
+DEFAULT_PORTS = ('5555', '4242')  # Standard adb port first, then Neat devices
+NEAT_PORT = '4242'
+PORT_CACHE_PATH = 'adb_port_cache.json'  # Which port each IP answered on last time
+MAX_WORKERS = 32  # Concurrent connect attempts per sweep
+BACKOFF_BASE = 10  # Seconds before retrying a device after its first failure
+BACKOFF_MAX = 600  # Upper bound for the retry delay of a device that keeps failing
+
+# ADB executable path
+ADB_PATH = r'C:\Users\v-adamarla\AppData\Local\Android\Sdk\platform-tools\adb.exe'
+
+# CSV file path
+CSV_FILE_PATH = inventory.CSV_FILE_PATH
 
 def adb_command(adb_path, command):
-    """Executes an ADB command and returns the output."""
-    full_command = [adb_path] + command.split()
+    """Executes an ADB command through the adb server socket and returns the output."""
+    args = command.split()
+    try:
+        if args[0] == 'connect' and len(args) == 2:
+            address, _, port = args[1].partition(':')
+            success, message = get_client().connect(address, port or '5555')
+            return (message, '') if success else ('', message)
+        if args[0] == 'disconnect' and len(args) == 2:
+            address, _, port = args[1].partition(':')
+            return get_client().disconnect(address, port or '5555'), ''
+        if args[0] == 'devices':
+            devices = get_client().devices()
+            lines = ['List of devices attached'] + [f"{serial}\t{state}" for serial, state in devices]
+            return '\n'.join(lines) + '\n', ''
+        if args[0] == '-s' and len(args) > 3 and args[2] == 'shell':
+            return get_client().shell(args[1], ' '.join(args[3:])), ''
+    except AdbError as e:
+        return None, str(e)
+
+    # Anything the socket client does not cover still goes through the adb binary
+    full_command = [adb_path] + args
     try:
         result = subprocess.run(full_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         return result.stdout, result.stderr
@@ -16,69 +57,210 @@ def connect_to_device(adb_path, ip_address, port='5555'):
     command = f"connect {ip_address}:{port}"
     output, error = adb_command(adb_path, command)
     # Check for a success message in the output
-    if 'connected' in output.lower():
+    if output and 'connected' in output.lower():
         return True, output  # Connected successfully
     else:
         return False, error  # Failed to connect
 
-def is_valid_ip(ip_address):
-    """Validate the IP address format."""
-    pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
-    return re.match(pattern, ip_address) is not None
-
-def main():
-    # ADB executable path
-    adb_path = r'C:\Users\v-adamarla\AppData\Local\Android\Sdk\platform-tools\adb.exe'
-
-    # Lists to hold connected devices
-    connected_devices = []
-    neat_devices = []
-
-    # CSV file path
-    csv_file_path = r'Poly,yealink,logi-host.csv'
-
-    # Read the CSV file
-    with open(csv_file_path, mode='r', encoding='utf-8-sig') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        for row in csv_reader:
-            # Get the IP address from the 'udid' field
-            ip_address = row.get('udid')
-
-            # Validate the IP address
-            if ip_address and is_valid_ip(ip_address):
-                print(f"Connecting to {ip_address} on port 5555...")
-                success, output_or_error = connect_to_device(adb_path, ip_address, '5555')
-
-                if success:
-                    connected_devices.append(f"{row['Host']} - {ip_address} - connected on port 5555")
-                    print(f"Successfully connected to {ip_address} on port 5555: {output_or_error}")
-                else:
-                    print(f"Failed to connect to {ip_address} on port 5555: {output_or_error}")
-                    
-                    # Try connecting on port 4242
-                    print(f"Attempting to connect to {ip_address} on port 4242 (Neat devices)...")
-                    success, output_or_error = connect_to_device(adb_path, ip_address, '4242')
-
-                    if success:
-                        neat_devices.append(f"{row['Host']} - {ip_address} - connected on port 4242 (Neat device)")
-                        print(f"Successfully connected to {ip_address} on port 4242 (Neat device): {output_or_error}")
-                    else:
-                        print(f"Cannot connect to {ip_address} on port 4242: {output_or_error}")
-            else:
-                print(f"Invalid IP address format: {ip_address}")
+class PortCache:
+    """Remembers which port each IP answered on and backs off devices that keep failing."""
+
+    def __init__(self, path=PORT_CACHE_PATH):
+        self.path = path
+        self.entries = {}  # ip -> {'port': str, 'failures': int, 'next_attempt': float}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable port cache {path}: {e}")
+
+    def ports_for(self, ip_address):
+        """Ports to try, the one that worked last time first."""
+        port = self.entries.get(ip_address, {}).get('port')
+        return [port] + [p for p in DEFAULT_PORTS if p != port] if port else list(DEFAULT_PORTS)
+
+    def should_attempt(self, ip_address, now):
+        return self.entries.get(ip_address, {}).get('next_attempt', 0) <= now
+
+    def record_success(self, ip_address, port):
+        with self._lock:
+            self.entries[ip_address] = {'port': port, 'failures': 0, 'next_attempt': 0}
+
+    def record_failure(self, ip_address, now):
+        with self._lock:
+            entry = self.entries.setdefault(ip_address, {'port': None, 'failures': 0, 'next_attempt': 0})
+            entry['failures'] += 1
+            delay = min(BACKOFF_BASE * 2 ** (entry['failures'] - 1), BACKOFF_MAX)
+            entry['next_attempt'] = now + delay
+            return delay
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+class ConnectResult:
+    """Outcome of one device in a connection sweep."""
+
+    def __init__(self, host, ip_address, status, port=None, latency=0.0, message=''):
+        self.host = host
+        self.ip_address = ip_address
+        self.status = status  # 'connected', 'already_connected', 'failed', 'backoff' or 'invalid'
+        self.port = port
+        self.latency = latency  # Seconds spent on connect attempts
+        self.message = message
+
+    @property
+    def neat(self):
+        return self.port == NEAT_PORT
+
+    def __repr__(self):
+        return f"ConnectResult({self.host!r}, {self.ip_address!r}, {self.status!r}, port={self.port!r})"
+
+
+class SweepReport:
+    """Structured result of a connection sweep."""
+
+    def __init__(self, results, duration):
+        self.results = results
+        self.duration = duration
+
+    def _with_status(self, *statuses):
+        return [result for result in self.results if result.status in statuses]
+
+    @property
+    def connected(self):
+        """Devices reachable on the default port (newly or already connected)."""
+        return [r for r in self._with_status('connected', 'already_connected') if not r.neat]
+
+    @property
+    def neat(self):
+        """Neat devices reachable on port 4242."""
+        return [r for r in self._with_status('connected', 'already_connected') if r.neat]
+
+    @property
+    def failed(self):
+        return self._with_status('failed')
+
+    @property
+    def backoff(self):
+        return self._with_status('backoff')
+
+    @property
+    def invalid(self):
+        return self._with_status('invalid')
+
+    def summary(self):
+        return (f"{len(self.connected)} connected, {len(self.neat)} neat, {len(self.failed)} failed, "
+                f"{len(self.backoff)} backing off, {len(self.invalid)} invalid in {self.duration:.1f}s")
+
+
+def device_states():
+    """{serial: state} of every device the adb server knows, from one `adb devices` listing."""
+    try:
+        return dict(get_client().devices())
+    except AdbError as e:
+        logging.error(f"Could not list adb devices: {e}")
+        return {}
+
+def drop_offline(ip_address, states):
+    """Disconnect the serials of an IP the adb server holds as offline.
+
+    Connecting to a serial the server still lists answers "already connected",
+    so without this an offline device would never really be reconnected.
+    """
+    for serial, state in states.items():
+        address, _, port = serial.rpartition(':')
+        if address != ip_address or state == 'device':
+            continue
+        try:
+            get_client().disconnect(address, port)
+            logging.info(f"Disconnected {serial} ({state}) before reconnecting it")
+        except AdbError as e:
+            logging.warning(f"Could not disconnect {serial}: {e}")
+
+def connect_one(adb_path, host, ip_address, cache, now, states=None):
+    """Try the memoized port first, then the others, and record the outcome in the cache.
+
+    `states` is a device_states() listing taken by the caller, read here if not given.
+    """
+    if not cache.should_attempt(ip_address, now):
+        return ConnectResult(host, ip_address, 'backoff')
+    drop_offline(ip_address, states if states is not None else device_states())
+
+    started = time.monotonic()
+    error = ''
+    for port in cache.ports_for(ip_address):
+        success, output_or_error = connect_to_device(adb_path, ip_address, port)
+        if success:
+            cache.record_success(ip_address, port)
+            return ConnectResult(host, ip_address, 'connected', port, time.monotonic() - started,
+                                 (output_or_error or '').strip())
+        error = (output_or_error or '').strip()
+
+    delay = cache.record_failure(ip_address, now)
+    return ConnectResult(host, ip_address, 'failed', None, time.monotonic() - started,
+                         f"{error} (next attempt in {delay:.0f}s)")
+
+def sweep(adb_path, devices, cache=None, max_workers=MAX_WORKERS):
+    """Connect every (host, ip) pair concurrently, skipping devices the adb server already has."""
+    started = time.monotonic()
+    now = time.time()
+    cache = cache or PortCache()
+    states = device_states()
+    already = {serial for serial, state in states.items() if state == 'device'}
+    results = []
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for host, ip_address in devices:
+            if not ip_address or not is_valid_ip(ip_address):
+                results.append(ConnectResult(host, ip_address, 'invalid', message='Invalid IP address format'))
+                continue
+            port = next((p for p in cache.ports_for(ip_address) if f"{ip_address}:{p}" in already), None)
+            if port:
+                cache.record_success(ip_address, port)
+                results.append(ConnectResult(host, ip_address, 'already_connected', port))
+                continue
+            futures.append(executor.submit(connect_one, adb_path, host, ip_address, cache, now, states))
+        results.extend(future.result() for future in futures)
+
+    try:
+        cache.save()
+    except OSError as e:
+        logging.error(f"Failed to save port cache {cache.path}: {e}")
+    return SweepReport(results, time.monotonic() - started)
+
+def read_devices(csv_file_path=CSV_FILE_PATH):
+    """(Host, udid) pairs from the device inventory."""
+    return [(device.host, device.udid) for device in get_inventory(csv_file_path).devices()]
+
+def main(adb_path=ADB_PATH, csv_file_path=CSV_FILE_PATH):
+    adb_client.ADB_PATH = adb_path  # Used if the adb server has to be started
+
+    report = sweep(adb_path, read_devices(csv_file_path))
+
+    for result in report.failed + report.invalid:
+        print(f"Cannot connect to {result.host} - {result.ip_address}: {result.message}")
 
     # Print the connected devices
-    if connected_devices:
+    if report.connected:
         print("\nSuccessfully connected devices (Port 5555):")
-        for device in connected_devices:
-            print(device)
+        for result in report.connected:
+            print(f"{result.host} - {result.ip_address} - connected on port {result.port}")
 
-    if neat_devices:
+    if report.neat:
         print("\nSuccessfully connected Neat devices (Port 4242):")
-        for device in neat_devices:
-            print(device)
+        for result in report.neat:
+            print(f"{result.host} - {result.ip_address} - connected on port {result.port} (Neat device)")
 
-    print("ADB connection attempts complete.")
+    print(f"ADB connection attempts complete: {report.summary()}")
+    return report
 
 if __name__ == "__main__":
     main()
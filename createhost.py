@@ -1,83 +1,170 @@
-import csv
+import argparse
 from pyzabbix import ZabbixAPI
 
+from inventory import get_inventory
+
 # Zabbix API connection details
 ZABBIX_URL = 'http://Zabbix_ip/zabbix'
 ZABBIX_USER = 'Admin'
 ZABBIX_PASSWORD = '#giveurpassword'
 
+CSV_FILE_PATH = 'Poly,yealink,logi-host.csv'
+BATCH_SIZE = 500  # Hosts per host.create call
+API_TIMEOUT = 30  # Seconds allowed for one API request, so a hung server cannot block the caller forever
+
 # Connect to Zabbix API
-zapi = ZabbixAPI(ZABBIX_URL)
-zapi.login(ZABBIX_USER, ZABBIX_PASSWORD)
-
-# Function to get group ID by name
-def get_group_id(group_name):
-    groups = zapi.hostgroup.get(filter={"name": group_name})
-    if groups:
-        return groups[0]['groupid']
-    return None
-
-# Function to get template ID by name
-def get_template_id(template_name):
-    templates = zapi.template.get(filter={"host": template_name})
-    if templates:
-        return templates[0]['templateid']
-    return None
-
-# Function to create a new host
-def create_host(hostname, group_id, template_id):
-    result = zapi.host.create(
-        host=hostname,
-        groups=[{"groupid": group_id}],
-        templates=[{"templateid": template_id}],
-        interfaces=[]  # No interfaces specified
-    )
-    if 'hostids' not in result:
-        print(f"Failed to create host {hostname}. Response: {result}")
-        return None
-    return result['hostids'][0]
-
-# Open CSV file
-with open('Poly,yealink,logi-host.csv', mode='r', encoding='utf-8-sig') as file:
-    reader = csv.DictReader(file)
-    
-    # Print the header to verify
-    print("CSV Header:", reader.fieldnames)
-    
-    for row in reader:
-        hostname = row.get('Host', '').strip()
-        group_name = row.get('Group', '').strip()
-        template_name = row.get('Template', '').strip()
+def connect():
+    """Log in to the Zabbix API and return the session."""
+    zapi = ZabbixAPI(ZABBIX_URL, timeout=API_TIMEOUT)
+    zapi.login(ZABBIX_USER, ZABBIX_PASSWORD)
+    return zapi
 
+def read_rows(csv_file_path=CSV_FILE_PATH):
+    """Read (hostname, group, template) rows from the device inventory, skipping incomplete ones."""
+    rows = []
+    for device in get_inventory(csv_file_path).devices():
         # Skip empty rows
-        if not hostname or not group_name or not template_name:
-            print(f"Skipping row due to missing data: {row}")
+        if not device.group or not device.template:
+            print(f"Skipping host due to missing data: {device}")
+            continue
+        rows.append((device.host, device.group, device.template))
+    return rows
+
+# Fetch every referenced group in one call
+def get_group_ids(zapi, group_names):
+    groups = zapi.hostgroup.get(output=['groupid', 'name'], filter={"name": sorted(group_names)})
+    return {group['name']: group['groupid'] for group in groups}
+
+# Fetch every referenced template in one call
+def get_template_ids(zapi, template_names):
+    templates = zapi.template.get(output=['templateid', 'host'], filter={"host": sorted(template_names)})
+    return {template['host']: template['templateid'] for template in templates}
+
+def get_existing_hosts(zapi, hostnames):
+    """Fetch every listed host that already exists as {host: (hostid, group_ids, template_ids)}."""
+    # Zabbix 6.2 renamed selectGroups to selectHostGroups and 7.0 dropped the old name
+    version = tuple(int(part) for part in str(zapi.api_version()).split('.')[:2])
+    groups_param, groups_key = ('selectHostGroups', 'hostgroups') if version >= (6, 2) else ('selectGroups', 'groups')
+    hosts = zapi.host.get(output=['hostid', 'host'], filter={"host": sorted(hostnames)},
+                          selectParentTemplates=['templateid'], **{groups_param: ['groupid']})
+    return {
+        host['host']: (host['hostid'],
+                       {group['groupid'] for group in host.get(groups_key, [])},
+                       {template['templateid'] for template in host.get('parentTemplates', [])})
+        for host in hosts
+    }
+
+class SyncReport:
+    """What a provisioning run did (or would do, in dry-run mode)."""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.created = []
+        self.updated = []
+        self.skipped = []  # Already exist with the right group and template
+        self.missing_group = []
+        self.missing_template = []
+        self.failed = []
+        self.requested = []  # Hostnames listed in the CSV
+        self.existing_hosts = set()  # Hosts seen by host.get or created in this run
+
+    def summary(self):
+        prefix = "Dry run: would have " if self.dry_run else ""
+        return (f"{prefix}created {len(self.created)}, updated {len(self.updated)}, skipped {len(self.skipped)}, "
+                f"missing group {len(self.missing_group)}, missing template {len(self.missing_template)}, "
+                f"failed {len(self.failed)}")
+
+def sync_hosts(zapi, rows, dry_run=False, batch_size=BATCH_SIZE):
+    """Create missing hosts and add missing groups/templates to existing ones in batched calls."""
+    report = SyncReport(dry_run)
+    report.requested = [hostname for hostname, _, _ in rows]
+    if not rows:
+        return report  # An empty filter would make every get call return everything
+    group_ids = get_group_ids(zapi, {group for _, group, _ in rows})
+    template_ids = get_template_ids(zapi, {template for _, _, template in rows})
+    existing = get_existing_hosts(zapi, {hostname for hostname, _, _ in rows})
+    report.existing_hosts.update(existing)
+
+    to_create = []
+    to_update = {}  # (group_id to add, template_id to add) -> [(hostname, hostid), ...]
+    for hostname, group_name, template_name in rows:
+        group_id = group_ids.get(group_name)
+        template_id = template_ids.get(template_name)
+        if not group_id:
+            print(f"Group '{group_name}' not found. Skipping host {hostname}.")
+            report.missing_group.append(hostname)
+            continue
+        if not template_id:
+            print(f"Template '{template_name}' not found. Skipping host {hostname}.")
+            report.missing_template.append(hostname)
+            continue
+
+        if hostname not in existing:
+            to_create.append({
+                "host": hostname,
+                "groups": [{"groupid": group_id}],
+                "templates": [{"templateid": template_id}],
+                "interfaces": [],  # No interfaces specified
+            })
             continue
 
-        # Debugging: Print fields
-        print(f"Processing hostname: '{hostname}'")
-        print(f"Group: '{group_name}'")
-        print(f"Template: '{template_name}'")
+        host_id, host_groups, host_templates = existing[hostname]
+        if group_id in host_groups and template_id in host_templates:
+            report.skipped.append(hostname)
+        else:
+            add_group = group_id if group_id not in host_groups else None
+            add_template = template_id if template_id not in host_templates else None
+            to_update.setdefault((add_group, add_template), []).append((hostname, host_id))
 
+    if dry_run:
+        report.created = [host['host'] for host in to_create]
+        report.updated = [hostname for hosts in to_update.values() for hostname, _ in hosts]
+        return report
+
+    for start in range(0, len(to_create), batch_size):
+        batch = to_create[start:start + batch_size]
+        names = [host['host'] for host in batch]
         try:
-            # Get group ID
-            group_id = get_group_id(group_name) if group_name else None
-
-            # Get template ID
-            template_id = get_template_id(template_name) if template_name else None
-
-            if group_id and template_id:
-                # Create the host with specified group and template
-                host_id = create_host(hostname, group_id, template_id)
-                if host_id:
-                    print(f"Created host {hostname} with ID {host_id}")
-                else:
-                    print(f"Failed to create host {hostname}")
-            else:
-                if not group_id:
-                    print(f"Group '{group_name}' not found. Skipping host creation.")
-                if not template_id:
-                    print(f"Template '{template_name}' not found. Skipping host creation.")
-        
+            result = zapi.host.create(*batch)
+            report.created.extend(names)
+            report.existing_hosts.update(names)
+            print(f"Created {len(result.get('hostids', []))} hosts")
         except Exception as e:
-            print(f"Error while processing {hostname}: {e}")
+            print(f"Failed to create hosts {names[0]}..{names[-1]}: {e}")
+            report.failed.extend(names)
+
+    for (add_group, add_template), hosts in to_update.items():
+        params = {"hosts": [{"hostid": host_id} for _, host_id in hosts]}
+        if add_group:
+            params["groups"] = [{"groupid": add_group}]
+        if add_template:
+            params["templates"] = [{"templateid": add_template}]
+        names = [hostname for hostname, _ in hosts]
+        try:
+            zapi.host.massadd(**params)
+            report.updated.extend(names)
+        except Exception as e:
+            print(f"Failed to update hosts {', '.join(names)}: {e}")
+            report.failed.extend(names)
+
+    return report
+
+def verify_hosts(report):
+    """Hostnames from the CSV that do not exist in Zabbix according to the sync result."""
+    return [hostname for hostname in report.requested if hostname not in report.existing_hosts]
+
+def main(csv_file_path=CSV_FILE_PATH, zapi=None, dry_run=False):
+    """Provision every host listed in the CSV file and return the SyncReport."""
+    zapi = zapi or connect()
+    rows = read_rows(csv_file_path)
+    print(f"Provisioning {len(rows)} hosts from {csv_file_path}")
+    report = sync_hosts(zapi, rows, dry_run=dry_run)
+    print(report.summary())
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or update the Zabbix hosts listed in the CSV file.")
+    parser.add_argument('--csv', default=CSV_FILE_PATH, help="CSV file with Host, Group and Template columns")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would change")
+    args = parser.parse_args()
+    main(args.csv, dry_run=args.dry_run)
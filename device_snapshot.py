@@ -0,0 +1,112 @@
+import time
+
+# Marker echoed on the device before each section so one output stream can be split again
+SECTION_MARKER = '@@ZBXSNAP@@'
+
+# Shell command for every snapshot section; meminfo sections are added per package
+SECTION_COMMANDS = {
+    'net': 'cat /proc/net/dev',
+    'uptime': 'cat /proc/uptime',
+    'cpu': 'dumpsys cpuinfo',
+    'battery': 'dumpsys battery',
+}
+MEMINFO_PREFIX = 'meminfo:'
+# System-wide `dumpsys meminfo`: the PSS of every running process in one call
+PROCESS_MEMINFO_SECTION = 'meminfo'
+
+# Fetch each section every N cycles; cheap procfs reads every cycle, heavy dumpsys less often
+SECTION_EVERY_CYCLES = {
+    'net': 1,
+    'uptime': 1,
+    'cpu': 1,
+    'meminfo': 1,
+    'battery': 6,
+}
+
+
+def meminfo_section(package_id):
+    """Section name for the `dumpsys meminfo` output of one package."""
+    return f"{MEMINFO_PREFIX}{package_id}"
+
+
+def section_command(name):
+    """Shell command that produces the given section."""
+    if name.startswith(MEMINFO_PREFIX):
+        return f"dumpsys meminfo {name[len(MEMINFO_PREFIX):]}"
+    if name == PROCESS_MEMINFO_SECTION:
+        return 'dumpsys meminfo'
+    return SECTION_COMMANDS[name]
+
+
+def build_script(sections):
+    """Build one composite shell script that prints every section behind a marker line."""
+    parts = []
+    for name in sections:
+        parts.append(f"echo '{SECTION_MARKER}{name}'")
+        parts.append(f"{section_command(name)} 2>&1")
+    return '; '.join(parts)
+
+
+def split_output(output):
+    """Split the composite script output back into {section: text}."""
+    sections = {}
+    current = None
+    lines = []
+    for line in output.splitlines():
+        if line.startswith(SECTION_MARKER):
+            if current is not None:
+                sections[current] = '\n'.join(lines).strip()
+            current = line[len(SECTION_MARKER):].strip()
+            lines = []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        sections[current] = '\n'.join(lines).strip()
+    return sections
+
+
+def sections_due(cycle, package_ids, every_cycles=None):
+    """Sections to fetch on the given cycle number according to their configured period."""
+    every_cycles = every_cycles or SECTION_EVERY_CYCLES
+    due = []
+    for name in SECTION_COMMANDS:
+        if cycle % every_cycles.get(name, 1) == 0:
+            due.append(name)
+    if cycle % every_cycles.get('meminfo', 1) == 0:
+        due.extend(meminfo_section(package_id) for package_id in package_ids)
+    return due
+
+
+class DeviceSnapshot:
+    """Parsed metrics from one composite `adb shell` round-trip.
+
+    Attributes stay None when their section was not fetched in this snapshot,
+    so callers can tell "not collected" apart from a real zero.
+    """
+
+    def __init__(self, udid, sections, taken_at=None):
+        self.udid = udid
+        self.sections = sections  # Raw section text keyed by section name
+        self.taken_at = taken_at if taken_at is not None else time.time()
+        self.network = None  # (rx_bytes, tx_bytes)
+        self.network_interface = None  # Interface the network counters were read from
+        self.uptime = None  # Seconds
+        self.cpu = None  # Total CPU percent
+        self.battery_health = None
+        self.memory = {}  # package_id -> PSS total in KB
+        # Full parser results behind the values above, see parsers.py
+        self.interfaces = None  # Interface name -> InterfaceCounters
+        self.cpu_info = None  # CpuInfo with per-process usage
+        self.battery = None  # BatteryInfo
+        self.meminfo = {}  # package_id -> Meminfo breakdown
+        self.processes = None  # process name -> PSS in KB, from the system-wide meminfo
+
+    def has(self, name):
+        return name in self.sections
+
+    def raw(self, name):
+        return self.sections.get(name)
+
+    def __repr__(self):
+        return (f"DeviceSnapshot(udid={self.udid!r}, network={self.network}, uptime={self.uptime}, "
+                f"cpu={self.cpu}, battery_health={self.battery_health}, memory={self.memory})")
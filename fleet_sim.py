@@ -0,0 +1,511 @@
+import argparse
+import csv
+import json
+import logging
+import random
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+from zabbix_sender import ZBX_HEADER, ZBX_HEADER_LEN, pack_packet, read_packet
+
+# Simulated fleet used by benchmark.py; nothing here talks to real devices or a real Zabbix server
+VENDORS = ('Poly', 'Yealink', 'Logi', 'Neat')
+NEAT_PORT = 4242
+DEFAULT_PORT = 5555
+PACKAGES = (
+    'com.microsoft.skype.teams.ipphone',
+    'com.microsoft.teams.ipphone.admin.agent',
+    'com.microsoft.windowsintune.companyportal',
+)
+OFFLINE_PERIOD = 60  # Seconds a device stays in its rolled online/offline state
+LEAKING_SHARE = 0.05  # Share of package processes whose memory grows steadily
+LOGCAT_TAGS = ('ActivityManager', 'Teams', 'WifiStateMachine', 'chromium', 'AdminAgent', 'PackageManager')
+CRASH_SHARE = 0.001  # Share of logcat lines that are a crash or ANR report of a package
+
+
+class SimulatedDevice:
+    """Counters and process state of one fake device, rendered as real command output."""
+
+    def __init__(self, index, rng):
+        self.index = index
+        self.ip_address = f"10.{100 + index // 65536}.{index // 256 % 256}.{index % 256}"
+        self.vendor = VENDORS[index % len(VENDORS)]
+        self.port = NEAT_PORT if self.vendor == 'Neat' else DEFAULT_PORT
+        self.host = f"{self.vendor.lower()}-{index:05d}"
+        self.rng = random.Random(rng.random())
+        self.lock = threading.Lock()
+        self.booted_at = time.time() - self.rng.uniform(600, 30 * 86400)
+        self.rx_bytes = self.rng.randrange(10 ** 6, 10 ** 10)
+        self.tx_bytes = self.rng.randrange(10 ** 6, 10 ** 10)
+        self.rx_rate = self.rng.uniform(2e3, 2e6)  # Bytes per second
+        self.tx_rate = self.rng.uniform(1e3, 5e5)
+        self.last_update = time.time()
+        self.cpu = self.rng.uniform(5, 40)
+        self.battery_level = self.rng.randint(20, 100)
+        self.memory = {package: self.rng.randint(60000, 400000) for package in PACKAGES}
+        self.leaking = {package for package in PACKAGES if self.rng.random() < LEAKING_SHARE}
+        self.pids = {package: self.rng.randint(1000, 30000) for package in PACKAGES}
+        self.offline = False
+        self.offline_until = 0.0
+
+    def serial_matches(self, serial):
+        return serial in (self.ip_address, f"{self.ip_address}:{self.port}")
+
+    def _advance(self):
+        """Move counters and gauges forward to the current time (lock held)."""
+        now = time.time()
+        elapsed = now - self.last_update
+        self.last_update = now
+        self.rx_bytes += int(self.rx_rate * elapsed * self.rng.uniform(0.5, 1.5))
+        self.tx_bytes += int(self.tx_rate * elapsed * self.rng.uniform(0.5, 1.5))
+        self.cpu = min(max(self.cpu + self.rng.gauss(0, 3), 1.0), 99.0)
+        for package in PACKAGES:
+            drift = self.rng.gauss(0, 200) + (elapsed * 2 if package in self.leaking else 0)
+            self.memory[package] = max(int(self.memory[package] + drift), 20000)
+
+    def net_dev(self):
+        with self.lock:
+            self._advance()
+            wired = self.vendor != 'Yealink'
+            eth_rx, eth_tx = (self.rx_bytes, self.tx_bytes) if wired else (0, 0)
+            wlan_rx, wlan_tx = (0, 0) if wired else (self.rx_bytes, self.tx_bytes)
+        rows = [('lo', 81234, 81234), ('dummy0', 0, 0), ('eth0', eth_rx, eth_tx), ('wlan0', wlan_rx, wlan_tx),
+                ('p2p0', 0, 0)]
+        lines = ["Inter-|   Receive                                                |  Transmit",
+                 " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop "
+                 "fifo colls carrier compressed"]
+        for name, rx, tx in rows:
+            lines.append(f"{name:>6}: {rx:>8} {rx // 900:>7}    0    0    0     0          0         0 "
+                         f"{tx:>8} {tx // 700:>7}    0    0    0     0       0          0")
+        return '\n'.join(lines)
+
+    def proc_uptime(self):
+        uptime = time.time() - self.booted_at
+        return f"{uptime:.2f} {uptime * 3.7:.2f}"
+
+    def cpuinfo(self):
+        with self.lock:
+            self._advance()
+            total = self.cpu
+        user, kernel = total * 0.65, total * 0.3
+        lines = ["Load: 3.12 / 3.05 / 2.98",
+                 "CPU usage from 61020ms to 1018ms ago (2024-05-01 10:12:05.120 to 2024-05-01 10:13:05.122):"]
+        for package in PACKAGES:
+            share = total * self.rng.uniform(0.05, 0.3)
+            lines.append(f"  {share:.1f}% {self.pids[package]}/{package}: {share * 0.7:.1f}% user + "
+                         f"{share * 0.3:.1f}% kernel / faults: {self.rng.randint(10, 5000)} minor")
+        lines.append(f"  1.2% 612/surfaceflinger: 0.8% user + 0.4% kernel")
+        lines.append(f"{total:.0f}% TOTAL: {user:.1f}% user + {kernel:.1f}% kernel + 0.8% iowait + 0.2% irq + "
+                     f"0.1% softirq")
+        return '\n'.join(lines)
+
+    def battery(self):
+        return '\n'.join([
+            "Current Battery Service state:",
+            "  AC powered: true",
+            "  USB powered: false",
+            "  Wireless powered: false",
+            "  Max charging current: 500000",
+            "  Max charging voltage: 5000000",
+            "  Charge counter: 2600000",
+            "  status: 5",
+            "  health: 2",
+            "  present: true",
+            f"  level: {self.battery_level}",
+            "  scale: 100",
+            "  voltage: 4321",
+            f"  temperature: {self.rng.randint(250, 330)}",
+            "  technology: Li-ion",
+        ])
+
+    def meminfo(self, package):
+        if package not in self.memory:
+            return f"No process found for: {package}"
+        with self.lock:
+            self._advance()
+            total = self.memory[package]
+        native, dalvik = total * 30 // 100, total * 25 // 100
+        other = total - native - dalvik
+        return '\n'.join([
+            "Applications Memory Usage (in Kilobytes):",
+            f"Uptime: {int((time.time() - self.booted_at) * 1000)} Realtime: {int((time.time() - self.booted_at) * 1000)}",
+            "",
+            f"** MEMINFO in pid {self.pids[package]} [{package}] **",
+            "                   Pss  Private  Private  SwapPss      Rss     Heap     Heap     Heap",
+            "                 Total    Dirty    Clean    Dirty    Total     Size    Alloc     Free",
+            "                ------   ------   ------   ------   ------   ------   ------   ------",
+            f"  Native Heap {native:>8} {native - 120:>8}        0        0 {native + 400:>8} {native + 8000:>8} "
+            f"{native:>8} {8000:>8}",
+            f"  Dalvik Heap {dalvik:>8} {dalvik - 200:>8}        0        0 {dalvik + 900:>8} {dalvik + 4000:>8} "
+            f"{dalvik:>8} {4000:>8}",
+            f"        Other {other:>8} {other // 2:>8} {other // 4:>8}        0 {other + 2000:>8}",
+            f"        TOTAL {total:>8} {total * 8 // 10:>8} {total // 10:>8}        0 {total + 3000:>8} "
+            f"{native + dalvik + 12000:>8} {native + dalvik:>8} {12000:>8}",
+            "",
+            " App Summary",
+            "                       Pss(KB)                        Rss(KB)",
+            "                        ------                         ------",
+            f"           Java Heap:   {dalvik:>7}                        {dalvik + 900:>7}",
+            f"         Native Heap:   {native:>7}                        {native + 400:>7}",
+            f"               TOTAL:   {total:>7}       TOTAL RSS:   {total + 3000:>7}       TOTAL SWAP PSS:        0",
+        ])
+
+    def meminfo_summary(self):
+        """System-wide `dumpsys meminfo`, reduced to the per-process PSS block the monitor reads."""
+        with self.lock:
+            self._advance()
+            processes = [(total, package, self.pids[package]) for package, total in self.memory.items()]
+        processes += [(182334, 'system', 1120), (95210, 'com.android.systemui', 1460),
+                      (41872, 'surfaceflinger', 612), (20118, 'zygote', 540)]
+        lines = ["Applications Memory Usage (in Kilobytes):",
+                 f"Uptime: {int((time.time() - self.booted_at) * 1000)} Realtime: "
+                 f"{int((time.time() - self.booted_at) * 1000)}",
+                 "",
+                 "Total PSS by process:"]
+        for total, name, pid in sorted(processes, reverse=True):
+            lines.append(f"{total:>13,}K: {name} (pid {pid})")
+        lines += ["", "Total PSS by OOM adjustment:",
+                  f"{sum(total for total, _, _ in processes):>13,}K: Native", "",
+                  "Total RAM: 3,881,624K (status normal)"]
+        return '\n'.join(lines)
+
+    def logcat_line(self):
+        if self.rng.random() < CRASH_SHARE:
+            return self.crash_lines()
+        tag = self.rng.choice(LOGCAT_TAGS)
+        level = self.rng.choice('VDIIIWE')
+        pid = self.rng.choice(list(self.pids.values()))
+        return f"{time.time():.3f}  {pid:>5}  {pid + self.rng.randint(0, 40):>5} {level} {tag}: event {self.rng.randint(0, 10 ** 6)}"
+
+    def crash_lines(self):
+        package = self.rng.choice(PACKAGES)
+        pid = self.pids[package]
+        now = time.time()
+        if self.rng.random() < 0.5:
+            return (f"{now:.3f}  {pid:>5}  {pid:>5} E AndroidRuntime: FATAL EXCEPTION: main\n"
+                    f"{now:.3f}  {pid:>5}  {pid:>5} E AndroidRuntime: Process: {package}, PID: {pid}\n"
+                    f"{now:.3f}  {pid:>5}  {pid:>5} E AndroidRuntime: java.lang.IllegalStateException: simulated")
+        return f"{now:.3f}  1120  1187 E ActivityManager: ANR in {package} ({package}/.MainActivity)"
+
+    def run(self, command):
+        """Output of one command of a composite `adb shell` script."""
+        command = command.strip()
+        if command.endswith('2>&1'):
+            command = command[:-4].strip()
+        if command.startswith('echo '):
+            return command[5:].strip().strip("'\"")
+        if command == 'cat /proc/net/dev':
+            return self.net_dev()
+        if command == 'cat /proc/uptime':
+            return self.proc_uptime()
+        if command == 'dumpsys cpuinfo':
+            return self.cpuinfo()
+        if command == 'dumpsys battery':
+            return self.battery()
+        if command == 'dumpsys meminfo':
+            return self.meminfo_summary()
+        if command.startswith('dumpsys meminfo '):
+            return self.meminfo(command.split()[-1])
+        return f"/system/bin/sh: {command.split()[0] if command else ''}: not found"
+
+
+class FleetBehaviour:
+    """Latency, failure and offline settings shared by every simulated device."""
+
+    def __init__(self, latency=0.05, jitter=0.02, failure_rate=0.0, offline_rate=0.0, logcat_rate=1.0):
+        self.latency = latency  # Seconds per shell round-trip
+        self.jitter = jitter
+        self.failure_rate = failure_rate  # Share of requests answered with FAIL
+        self.offline_rate = offline_rate  # Share of devices offline at any time
+        self.logcat_rate = logcat_rate  # Lines per second per logcat stream
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """adb server speaking the host protocol for a fleet of SimulatedDevices."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, devices, behaviour, port=0, preconnected=False, seed=0):
+        super().__init__(('127.0.0.1', port), _AdbHandler)
+        self.devices = devices
+        self.behaviour = behaviour
+        self.by_ip = {device.ip_address: device for device in devices}
+        self.connected = {f"{device.ip_address}:{device.port}" for device in devices} if preconnected else set()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def find(self, serial):
+        device = self.by_ip.get(serial.rsplit(':', 1)[0]) or self.by_ip.get(serial)
+        return device if device is not None and device.serial_matches(serial) else None
+
+    def is_offline(self, device):
+        now = time.time()
+        with device.lock:
+            if now >= device.offline_until:
+                device.offline = device.rng.random() < self.behaviour.offline_rate
+                device.offline_until = now + OFFLINE_PERIOD
+            return device.offline
+
+    def delay(self):
+        behaviour = self.behaviour
+        time.sleep(max(behaviour.latency + self.rng.uniform(-behaviour.jitter, behaviour.jitter), 0))
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            return self.rng.random() < self.behaviour.failure_rate
+
+
+class _AdbHandler(socketserver.BaseRequestHandler):
+
+    def _read_request(self):
+        length = self._recv(4)
+        return self._recv(int(length, 16)).decode('utf-8', errors='replace') if length else None
+
+    def _recv(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return b''
+            data += chunk
+        return data
+
+    def _okay(self, message=None):
+        if message is None:
+            self.request.sendall(b'OKAY')
+        else:
+            data = message.encode('utf-8')
+            self.request.sendall(b'OKAY' + b'%04x' % len(data) + data)
+
+    def _fail(self, message):
+        data = message.encode('utf-8')
+        self.request.sendall(b'FAIL' + b'%04x' % len(data) + data)
+
+    def handle(self):
+        server = self.server
+        request = self._read_request()
+        if not request:
+            return
+        if server.should_fail():
+            server.delay()
+            self._fail('protocol fault (simulated)')
+            return
+
+        if request == 'host:devices':
+            self._okay(self._device_list())
+        elif request == 'host:track-devices':
+            self._track_devices()
+        elif request.startswith('host:connect:'):
+            address = request[len('host:connect:'):]
+            device = server.find(address)
+            server.delay()
+            if device is None or server.is_offline(device):
+                self._okay(f"failed to connect to '{address}': Connection refused")
+            else:
+                with server.lock:
+                    server.connected.add(address)
+                self._okay(f"connected to {address}")
+        elif request.startswith('host:disconnect:'):
+            address = request[len('host:disconnect:'):]
+            with server.lock:
+                server.connected.discard(address)
+            self._okay(f"disconnected {address}")
+        elif request.startswith('host-serial:') and request.endswith(':get-state'):
+            serial = request[len('host-serial:'):-len(':get-state')]
+            device = server.find(serial)
+            if device is None:
+                self._fail(f"device '{serial}' not found")
+            else:
+                self._okay('offline' if server.is_offline(device) else 'device')
+        elif request.startswith('host:transport:'):
+            serial = request[len('host:transport:'):]
+            device = server.find(serial)
+            if device is None:
+                self._fail(f"device '{serial}' not found")
+            elif server.is_offline(device):
+                self._fail('device offline')
+            else:
+                self._okay()
+                self._shell(device)
+        else:
+            self._fail(f"unknown host service '{request}'")
+
+    def _device_list(self):
+        server = self.server
+        with server.lock:
+            serials = sorted(server.connected)
+        return ''.join(f"{serial}\t{'offline' if server.is_offline(server.find(serial)) else 'device'}\n"
+                       for serial in serials)
+
+    def _track_devices(self):
+        """Send the device list now and again every time it changes, like the real server."""
+        self.request.sendall(b'OKAY')
+        last = None
+        try:
+            while True:
+                current = self._device_list()
+                if current != last:
+                    data = current.encode('utf-8')
+                    self.request.sendall(b'%04x' % len(data) + data)
+                    last = current
+                time.sleep(1)
+        except OSError:
+            pass  # Tracker went away
+
+    def _shell(self, device):
+        request = self._read_request()
+        if not request or not request.startswith('shell:'):
+            self._fail('unsupported service')
+            return
+        command = request[len('shell:'):]
+        self._okay()
+        if command.startswith('logcat'):
+            self._stream_logcat(device)
+            return
+        self.server.delay()
+        output = '\n'.join(device.run(part) for part in command.split('; '))
+        self.request.sendall(output.encode('utf-8') + b'\n')
+
+    def _stream_logcat(self, device):
+        rate = self.server.behaviour.logcat_rate
+        try:
+            self.request.sendall(b'--------- beginning of main\n')
+            while True:
+                time.sleep(device.rng.expovariate(rate) if rate > 0 else 60)
+                self.request.sendall(device.logcat_line().encode('utf-8') + b'\n')
+        except OSError:
+            pass  # Reader went away
+
+
+class FakeTrapper(socketserver.ThreadingTCPServer):
+    """Zabbix trapper stand-in that accepts sender data and counts the items.
+
+    A {"request": "sim.stats"} packet returns the counters instead.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), _TrapperHandler)
+        self.lock = threading.Lock()
+        self.items = 0
+        self.requests = 0
+        self.bytes = 0
+        self.hosts = set()
+        self.down = False  # Refuse data, to exercise the sender's spool
+
+    def stats(self):
+        with self.lock:
+            return {'items': self.items, 'requests': self.requests, 'bytes': self.bytes, 'hosts': len(self.hosts)}
+
+
+class _TrapperHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        header = self._recv(ZBX_HEADER_LEN)
+        if not header.startswith(ZBX_HEADER[:4]):
+            return
+        (length,) = struct.unpack('<Q', header[5:13])
+        payload = json.loads(self._recv(length).decode('utf-8'))
+        server = self.server
+        if payload.get('request') == 'sim.stats':
+            self.request.sendall(pack_packet(server.stats()))
+            return
+        if server.down:
+            return  # Close without answering, like an unreachable server
+        data = payload.get('data', [])
+        with server.lock:
+            server.items += len(data)
+            server.requests += 1
+            server.bytes += length
+            server.hosts.update(item.get('host') for item in data)
+        self.request.sendall(pack_packet({
+            'response': 'success',
+            'info': f"processed: {len(data)}; failed: 0; total: {len(data)}; seconds spent: 0.000050",
+        }))
+
+    def _recv(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+
+def trapper_stats(port, host='127.0.0.1', timeout=5.0):
+    """Ask a FakeTrapper for its counters."""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(pack_packet({'request': 'sim.stats'}))
+        return read_packet(sock)
+
+
+def build_fleet(size, seed=0):
+    rng = random.Random(seed)
+    return [SimulatedDevice(index, rng) for index in range(size)]
+
+
+def write_inventory(devices, path):
+    """Write the fleet as an inventory CSV the monitor can read."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Host', 'udid', 'Group', 'Template', 'Vendor'])
+        for device in devices:
+            writer.writerow([device.host, device.ip_address, f"{device.vendor} Devices",
+                             f"Template {device.vendor} Android", device.vendor])
+
+
+def serve(size, behaviour, inventory_path=None, adb_port=0, trapper_port=0, preconnected=False, seed=0):
+    """Start the fake adb server and trapper in background threads; returns both servers."""
+    devices = build_fleet(size, seed)
+    if inventory_path:
+        write_inventory(devices, inventory_path)
+    adb_server = FakeAdbServer(devices, behaviour, adb_port, preconnected, seed)
+    trapper = FakeTrapper(trapper_port)
+    for server, name in ((adb_server, 'fake-adb'), (trapper, 'fake-trapper')):
+        threading.Thread(target=server.serve_forever, name=name, daemon=True).start()
+    return adb_server, trapper
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a simulated device fleet and Zabbix trapper on localhost.")
+    parser.add_argument('--devices', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per adb shell round-trip")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--offline-rate', type=float, default=0.0)
+    parser.add_argument('--logcat-rate', type=float, default=1.0, help="Logcat lines per second per device")
+    parser.add_argument('--adb-port', type=int, default=0)
+    parser.add_argument('--trapper-port', type=int, default=0)
+    parser.add_argument('--inventory', help="Write the fleet inventory CSV here")
+    parser.add_argument('--preconnected', action='store_true', help="List every device in host:devices from the start")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    behaviour = FleetBehaviour(args.latency, args.jitter, args.failure_rate, args.offline_rate, args.logcat_rate)
+    adb_server, trapper = serve(args.devices, behaviour, args.inventory, args.adb_port, args.trapper_port,
+                                args.preconnected, args.seed)
+    # benchmark.py reads the ports from this line
+    print(json.dumps({'adb_port': adb_server.server_address[1], 'trapper_port': trapper.server_address[1]}))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
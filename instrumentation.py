@@ -0,0 +1,223 @@
+import bisect
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket catches everything slower
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STATS_HOST = '127.0.0.1'  # The stats endpoint is only meant for the collector itself
+PROFILE_INTERVAL = 0.01  # Seconds between stack samples while profiling
+PROFILE_MAX_SECONDS = 60
+PROFILE_TOP = 25  # Hot paths listed in a profile dump
+
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(LATENCY_BUCKETS[index], self.max) if index < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+
+class Metrics:
+    """Process-wide latency histograms, counters and gauges of the monitor itself.
+
+    Histograms and counters are kept per (name, device) and, under device '',
+    for the name across all devices. Gauges are callables evaluated on render.
+    """
+
+    def __init__(self):
+        self.histograms = {}  # (name, device) -> Histogram
+        self.counters = collections.Counter()  # (name, device) -> count
+        self.gauges = {}  # name -> callable returning a number
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, device=''):
+        with self._lock:
+            for key in ((name, ''), (name, device)) if device else ((name, ''),):
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.observe(seconds)
+
+    def increment(self, name, device='', amount=1):
+        with self._lock:
+            self.counters[(name, '')] += amount
+            if device:
+                self.counters[(name, device)] += amount
+
+    def register_gauge(self, name, func):
+        self.gauges[name] = func
+
+    @contextmanager
+    def timed(self, name, device='', timeout_types=(TimeoutError,)):
+        """Time the block into the `name` histogram and count its failures and timeouts."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.increment(f"{name}.timeouts" if isinstance(e, timeout_types) else f"{name}.failures", device)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, device)
+
+    def histogram(self, name, device=''):
+        with self._lock:
+            return self.histograms.get((name, device))
+
+    def counter(self, name, device=''):
+        with self._lock:
+            return self.counters.get((name, device), 0)
+
+    def render(self, per_device=True):
+        """Text exposition (Prometheus format) of every metric."""
+        lines = [f"monitor_uptime_seconds {time.time() - self.started:.0f}"]
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        for (name, device), histogram in histograms:
+            if device and not per_device:
+                continue
+            labels = f'op="{name}"' + (f',device="{device}"' if device else '')
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'monitor_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"monitor_latency_seconds_sum{{{labels}}} {histogram.total:.6f}")
+            lines.append(f"monitor_latency_seconds_count{{{labels}}} {histogram.count}")
+        for (name, device), count in counters:
+            if device and not per_device:
+                continue
+            labels = f'name="{name}"' + (f',device="{device}"' if device else '')
+            lines.append(f"monitor_events_total{{{labels}}} {count}")
+        for name, func in sorted(self.gauges.items()):
+            try:
+                lines.append(f'monitor_gauge{{name="{name}"}} {func()}')
+            except Exception as e:
+                logging.debug(f"Gauge {name} failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+    def zabbix_items(self):
+        """Fleet-wide (key, value) pairs for the monitor's own Zabbix host."""
+        items = []
+        with self._lock:
+            histograms = [(name, histogram) for (name, device), histogram in self.histograms.items() if not device]
+            counters = [(name, count) for (name, device), count in self.counters.items() if not device]
+        for name, histogram in histograms:
+            items.append((f"monitor.latency.p95[{name}]", round(histogram.quantile(0.95), 3)))
+            items.append((f"monitor.latency.max[{name}]", round(histogram.max, 3)))
+            items.append((f"monitor.count[{name}]", histogram.count))
+        for name, count in counters:
+            items.append((f"monitor.events[{name}]", count))
+        for name, func in self.gauges.items():
+            try:
+                items.append((f"monitor.gauge[{name}]", func()))
+            except Exception as e:
+                logging.debug(f"Gauge {name} failed: {e}")
+        return items
+
+
+# Shared by every module of the monitor
+metrics = Metrics()
+
+
+def sample_profile(seconds, interval=PROFILE_INTERVAL, top=PROFILE_TOP):
+    """Sample the stacks of all threads for a while and return the hottest paths as text."""
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    own_thread = threading.get_ident()
+    stacks = collections.Counter()
+    leaves = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            summary = traceback.extract_stack(frame, limit=8)
+            if not summary:
+                continue
+            leaves[f"{summary[-1].filename}:{summary[-1].lineno} {summary[-1].name}"] += 1
+            stacks[' <- '.join(f"{entry.name}" for entry in reversed(summary))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    total = sum(leaves.values()) or 1
+    lines = [f"{samples} samples over {seconds}s", "", "Hot lines:"]
+    lines += [f"{count * 100.0 / total:6.2f}%  {leaf}" for leaf, count in leaves.most_common(top)]
+    lines += ["", "Hot stacks:"]
+    lines += [f"{count * 100.0 / total:6.2f}%  {stack}" for stack, count in stacks.most_common(top)]
+    return '\n'.join(lines) + '\n'
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    server_version = 'ZabbixAdbMonitor'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path in ('/', '/metrics'):
+            body = metrics.render(per_device=query.get('devices', ['1'])[0] != '0')
+        elif url.path == '/profile':
+            if not self.server.profiling:
+                self.send_error(403, "Profiling is disabled")
+                return
+            try:
+                seconds = float(query.get('seconds', ['10'])[0])
+            except ValueError:
+                self.send_error(400, "Invalid seconds")
+                return
+            body = sample_profile(seconds)
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Stats endpoint: {format % args}")
+
+
+def start_stats_server(port, host=STATS_HOST, profiling=False):
+    """Serve /metrics (and /profile?seconds=N when profiling is enabled) from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _StatsHandler)
+    server.daemon_threads = True
+    server.profiling = profiling
+    thread = threading.Thread(target=server.serve_forever, name='stats-endpoint', daemon=True)
+    thread.start()
+    logging.info(f"Stats endpoint listening on http://{host}:{server.server_address[1]}/metrics")
+    return server
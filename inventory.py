@@ -0,0 +1,185 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import re
+import sys
+import threading
+
+CSV_FILE_PATH = r'Poly,yealink,logi-host.csv'
+
+# Vendor names recognised in the Vendor column or, failing that, in the Template/Group names
+KNOWN_VENDORS = ('Poly', 'Yealink', 'Logi', 'Neat')
+
+IP_PATTERN = re.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
+
+
+def is_valid_ip(ip_address):
+    """Validate the IP address format."""
+    return IP_PATTERN.match(ip_address) is not None
+
+
+def detect_vendor(*names):
+    """First known vendor mentioned in any of the given names, or '' if none is."""
+    for name in names:
+        lowered = name.lower()
+        for vendor in KNOWN_VENDORS:
+            if vendor.lower() in lowered:
+                return vendor
+    return ''
+
+
+class Device:
+    """One row of the device inventory."""
+
+    __slots__ = ('host', 'udid', 'group', 'template', 'vendor', 'model')
+
+    def __init__(self, host, udid, group='', template='', vendor='', model=''):
+        self.host = host
+        self.udid = udid
+        # Repeated strings are interned so large inventories share one copy of each
+        self.group = sys.intern(group)
+        self.template = sys.intern(template)
+        self.vendor = sys.intern(vendor)
+        self.model = sys.intern(model)
+
+    def _key(self):
+        return (self.host, self.udid, self.group, self.template, self.vendor, self.model)
+
+    def __eq__(self, other):
+        return isinstance(other, Device) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"Device(host={self.host!r}, udid={self.udid!r}, vendor={self.vendor!r}, model={self.model!r})"
+
+
+class InventoryDiff:
+    """Devices added, removed or changed by a reload."""
+
+    def __init__(self, added=(), removed=(), changed=()):
+        self.added = list(added)
+        self.removed = list(removed)
+        self.changed = list(changed)  # (old Device, new Device)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return f"InventoryDiff(added={len(self.added)}, removed={len(self.removed)}, changed={len(self.changed)})"
+
+
+def parse_devices(text):
+    """Parse CSV text into (devices by host, invalid rows)."""
+    devices = {}
+    invalid = []
+    reader = csv.DictReader(io.StringIO(text))
+    for row in reader:
+        host = (row.get('Host') or '').strip()
+        udid = (row.get('udid') or '').strip()
+        if not host:
+            invalid.append(row)
+            continue
+        group = (row.get('Group') or '').strip()
+        template = (row.get('Template') or '').strip()
+        vendor = (row.get('Vendor') or '').strip() or detect_vendor(template, group, host)
+        model = (row.get('Model') or '').strip()
+        devices[host] = Device(host, udid, group, template, vendor, model)
+    return devices, invalid
+
+
+class Inventory:
+    """Device inventory loaded from the CSV file, indexed by host, udid and vendor/model.
+
+    reload() only re-parses the file when its mtime/size changed and its content
+    hash differs, and returns the resulting InventoryDiff.
+    """
+
+    def __init__(self, path=CSV_FILE_PATH):
+        self.path = path
+        self.by_host = {}
+        self.by_udid = {}
+        self.by_vendor = {}  # vendor -> {host: Device}
+        self.by_model = {}  # (vendor, model) -> {host: Device}
+        self.invalid = []
+        self._stat = None
+        self._digest = None
+        self._lock = threading.Lock()
+
+    def reload(self, force=False):
+        """Re-read the file if it changed and return the InventoryDiff (empty if nothing changed)."""
+        with self._lock:
+            stat = os.stat(self.path)
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            if not force and stat_key == self._stat:
+                return InventoryDiff()
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            if not force and digest == self._digest:
+                self._stat = stat_key
+                return InventoryDiff()
+            self._digest = digest
+
+            devices, invalid = parse_devices(data.decode('utf-8-sig', errors='replace'))
+            diff = InventoryDiff(
+                added=[device for host, device in devices.items() if host not in self.by_host],
+                removed=[device for host, device in self.by_host.items() if host not in devices],
+                changed=[(self.by_host[host], device) for host, device in devices.items()
+                         if host in self.by_host and self.by_host[host] != device],
+            )
+            self._index(devices)
+            self.invalid = invalid
+            # Set last: get_inventory() treats a stat as "loaded" without taking the lock
+            self._stat = stat_key
+
+        for row in invalid:
+            logging.warning(f"Skipping inventory row with missing Host: {row}")
+        if diff:
+            logging.info(f"Inventory {self.path} reloaded: {len(self.by_host)} devices, {diff}")
+        return diff
+
+    def _index(self, devices):
+        self.by_host = devices
+        self.by_udid = {device.udid: device for device in devices.values() if device.udid}
+        self.by_vendor = {}
+        self.by_model = {}
+        for host, device in devices.items():
+            self.by_vendor.setdefault(device.vendor, {})[host] = device
+            self.by_model.setdefault((device.vendor, device.model), {})[host] = device
+
+    def devices(self):
+        return list(self.by_host.values())
+
+    def get(self, host):
+        return self.by_host.get(host)
+
+    def get_by_udid(self, udid):
+        return self.by_udid.get(udid)
+
+    def with_vendor(self, vendor, model=None):
+        if model is None:
+            return list(self.by_vendor.get(vendor, {}).values())
+        return list(self.by_model.get((vendor, model), {}).values())
+
+    def __len__(self):
+        return len(self.by_host)
+
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+
+def get_inventory(path=CSV_FILE_PATH):
+    """Return the shared Inventory for a file, loading it on first use."""
+    with _inventories_lock:
+        inventory = _inventories.get(path)
+        if inventory is None:
+            inventory = Inventory(path)
+            _inventories[path] = inventory
+    if inventory._stat is None:
+        inventory.reload()
+    return inventory
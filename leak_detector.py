@@ -0,0 +1,211 @@
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+WINDOW_SAMPLES = 240  # Samples kept per series (4 hours at one sample per minute)
+MAX_SERIES = 20000  # Device x package series kept in memory; least recently used are dropped
+EWMA_ALPHA = 0.1  # Weight of the newest sample in the moving average
+MIN_SAMPLES = 5  # Samples needed before a slope is reported
+DEFAULT_CEILING_KB = 1024 * 1024  # Memory level at which a package is considered exhausted
+SNAPSHOT_INTERVAL = 300  # Seconds between on-disk snapshots
+
+SNAPSHOT_MAGIC = b'ZBXLEAK1'
+_SERIES_HEADER = struct.Struct('<dddIII4d')  # t0, last_time, ewma, count, head, n, sums
+
+
+class LeakStats:
+    """Leak indicators for one series after the latest sample."""
+
+    def __init__(self, samples, slope, ewma, hours_to_ceiling):
+        self.samples = samples  # Samples currently in the window
+        self.slope = slope  # KB per hour from least-squares regression over the window
+        self.ewma = ewma  # Smoothed memory usage in KB
+        self.hours_to_ceiling = hours_to_ceiling  # -1 when usage is not growing
+
+    def __repr__(self):
+        return (f"LeakStats(samples={self.samples}, slope={self.slope:.2f}, ewma={self.ewma:.1f}, "
+                f"hours_to_ceiling={self.hours_to_ceiling:.1f})")
+
+
+class MemorySeries:
+    """Fixed-size ring buffer with running regression sums for one device/package."""
+
+    __slots__ = ('times', 'values', 'head', 'n', 'count', 't0', 'last_time', 'ewma',
+                 'sx', 'sy', 'sxx', 'sxy')
+
+    def __init__(self, window, t0):
+        self.times = array('f', bytes(4 * window))  # Hours since t0
+        self.values = array('f', bytes(4 * window))  # KB
+        self.head = 0  # Next slot to write
+        self.n = 0  # Samples in the window
+        self.count = 0  # Samples ever seen
+        self.t0 = t0
+        self.last_time = 0.0
+        self.ewma = 0.0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def add(self, timestamp, value, alpha=EWMA_ALPHA):
+        """Add one sample in O(1), evicting the oldest one when the window is full."""
+        window = len(self.values)
+        x = (timestamp - self.t0) / 3600.0
+        if self.n == window:
+            old_x, old_y = self.times[self.head], self.values[self.head]
+            self.sx -= old_x
+            self.sy -= old_y
+            self.sxx -= old_x * old_x
+            self.sxy -= old_x * old_y
+        else:
+            self.n += 1
+        self.times[self.head] = x
+        self.values[self.head] = value
+        # Use the stored (float32) values so evictions subtract exactly what was added
+        x, y = self.times[self.head], self.values[self.head]
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+        self.head = (self.head + 1) % window
+        if self.head == 0:
+            self._resum()
+        self.ewma = value if self.count == 0 else alpha * value + (1 - alpha) * self.ewma
+        self.count += 1
+        self.last_time = timestamp
+
+    def _resum(self):
+        """Recompute the sums once per wrap to stop rounding drift.
+
+        Times are re-based on the oldest sample so the regression keeps working
+        on small numbers however long the series has been running.
+        """
+        shift = self.times[self.head]
+        for i in range(self.n):
+            self.times[i] -= shift
+        self.t0 += shift * 3600.0
+        xs, ys = self.times[:self.n], self.values[:self.n]
+        self.sx = sum(xs)
+        self.sy = sum(ys)
+        self.sxx = sum(x * x for x in xs)
+        self.sxy = sum(x * y for x, y in zip(xs, ys))
+
+    def slope(self):
+        """Least-squares slope over the window in KB per hour."""
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if self.n < 2 or denominator <= 0:
+            return 0.0
+        return (self.n * self.sxy - self.sx * self.sy) / denominator
+
+
+class LeakDetector:
+    """Streaming memory leak detector over many device x package series.
+
+    Memory use is bounded by max_series x window samples; the least recently
+    updated series is dropped when a new one would exceed the budget.
+    """
+
+    def __init__(self, snapshot_path=None, window=WINDOW_SAMPLES, max_series=MAX_SERIES,
+                 alpha=EWMA_ALPHA, ceilings=None, default_ceiling=DEFAULT_CEILING_KB,
+                 snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.window = window
+        self.max_series = max_series
+        self.alpha = alpha
+        self.ceilings = ceilings or {}  # package_id -> ceiling in KB
+        self.default_ceiling = default_ceiling
+        self.snapshot_interval = snapshot_interval
+        self.series = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                self.load(snapshot_path)
+            except (OSError, ValueError, struct.error) as e:
+                logging.error(f"Ignoring unreadable leak detector snapshot {snapshot_path}: {e}")
+                self.series.clear()
+
+    def add(self, udid, package_id, value, timestamp=None):
+        """Add one memory sample (KB) and return the updated LeakStats."""
+        timestamp = timestamp if timestamp is not None else time.time()
+        key = (udid, package_id)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = MemorySeries(self.window, timestamp)
+                self.series[key] = series
+                if len(self.series) > self.max_series:
+                    self.series.popitem(last=False)
+            else:
+                self.series.move_to_end(key)
+            series.add(timestamp, value, self.alpha)
+            stats = self._stats(series, package_id)
+        self.maybe_save()
+        return stats
+
+    def stats(self, udid, package_id):
+        """Current LeakStats for a series, or None if it has no samples."""
+        with self._lock:
+            series = self.series.get((udid, package_id))
+            return self._stats(series, package_id) if series else None
+
+    def _stats(self, series, package_id):
+        slope = series.slope() if series.n >= MIN_SAMPLES else 0.0
+        ceiling = self.ceilings.get(package_id, self.default_ceiling)
+        hours_to_ceiling = -1.0
+        if slope > 0:
+            hours_to_ceiling = max(ceiling - series.ewma, 0.0) / slope
+        return LeakStats(series.n, slope, series.ewma, hours_to_ceiling)
+
+    def maybe_save(self):
+        """Write a snapshot if the snapshot interval has elapsed."""
+        if not self.snapshot_path or time.monotonic() - self._last_save < self.snapshot_interval:
+            return
+        self._last_save = time.monotonic()
+        try:
+            self.save(self.snapshot_path)
+        except OSError as e:
+            logging.error(f"Failed to write leak detector snapshot {self.snapshot_path}: {e}")
+
+    def save(self, path):
+        """Write every series to a compact binary snapshot, replacing the file atomically."""
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(struct.pack('<II', self.window, len(self.series)))
+                for (udid, package_id), series in self.series.items():
+                    key = f"{udid}\t{package_id}".encode('utf-8')
+                    f.write(struct.pack('<H', len(key)))
+                    f.write(key)
+                    f.write(_SERIES_HEADER.pack(series.t0, series.last_time, series.ewma, series.count,
+                                                series.head, series.n, series.sx, series.sy,
+                                                series.sxx, series.sxy))
+                    series.times.tofile(f)
+                    series.values.tofile(f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Restore series from a snapshot written by save()."""
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError('bad snapshot header')
+            window, count = struct.unpack('<II', f.read(8))
+            if window != self.window:
+                raise ValueError(f"snapshot window {window} does not match configured window {self.window}")
+            for _ in range(count):
+                (key_length,) = struct.unpack('<H', f.read(2))
+                udid, package_id = f.read(key_length).decode('utf-8').split('\t', 1)
+                fields = _SERIES_HEADER.unpack(f.read(_SERIES_HEADER.size))
+                series = MemorySeries(window, fields[0])
+                (series.last_time, series.ewma, series.count, series.head, series.n,
+                 series.sx, series.sy, series.sxx, series.sxy) = fields[1:]
+                series.times = array('f')
+                series.times.fromfile(f, window)
+                series.values = array('f')
+                series.values.fromfile(f, window)
+                self.series[(udid, package_id)] = series
+        while len(self.series) > self.max_series:
+            self.series.popitem(last=False)
+        logging.info(f"Restored {len(self.series)} memory series from {path}")
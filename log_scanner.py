@@ -0,0 +1,144 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import threading
+
+LOG_SIGNATURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log_signatures.json')
+ANY_PACKAGE = 'all'  # Package key of signatures not tied to one package
+SCAN_CHUNK = 1024 * 1024  # Bytes read per step when scanning a file
+MAX_LINE_LENGTH = 1024  # Characters of the latest matching line kept for Zabbix
+
+
+class SignatureRule:
+    """One crash/ANR signature; `{package}` in the pattern is expanded for every watched package."""
+
+    def __init__(self, name, pattern):
+        self.name = name
+        self.pattern = pattern
+
+    def expand(self, packages):
+        """Literal byte patterns of this rule as [(pattern, package)]."""
+        if '{package}' not in self.pattern:
+            return [(self.pattern.encode('utf-8'), ANY_PACKAGE)]
+        return [(self.pattern.replace('{package}', package).encode('utf-8'), package) for package in packages]
+
+
+def load_rules(path=LOG_SIGNATURES_PATH):
+    """Read the rule file: {"packages": {label: package}, "signatures": [{"name", "pattern"}]}."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    packages = list(data.get('packages', {}).values())
+    rules = [SignatureRule(entry['name'], entry['pattern']) for entry in data.get('signatures', [])]
+    return SignatureMatcher(rules, packages)
+
+
+class SignatureMatcher:
+    """Single-pass multi-pattern matcher over raw log bytes.
+
+    All literal signatures are compiled into one alternation, longest first, so
+    the regex engine walks each chunk once whatever the number of signatures.
+    """
+
+    def __init__(self, rules, packages):
+        self.rules = rules
+        self.packages = packages
+        self._targets = {}  # pattern bytes -> (signature name, package)
+        for rule in rules:
+            for pattern, package in rule.expand(packages):
+                self._targets[pattern] = (rule.name, package)
+        alternation = b'|'.join(re.escape(pattern) for pattern in sorted(self._targets, key=len, reverse=True))
+        self._regex = re.compile(alternation) if self._targets else None
+
+    def keys(self):
+        """Every (signature, package) pair the matcher can report."""
+        return sorted(set(self._targets.values()))
+
+    def scan(self, data):
+        """Yield (signature, package, line) for every match in a buffer of complete lines."""
+        if self._regex is None:
+            return
+        last_line_start = -1
+        for match in self._regex.finditer(data):
+            start = data.rfind(b'\n', 0, match.start()) + 1
+            if start == last_line_start:
+                continue  # One report per line, the first signature on it wins
+            last_line_start = start
+            end = data.find(b'\n', match.end())
+            line = data[start:end if end >= 0 else len(data)]
+            name, package = self._targets[match.group()]
+            yield name, package, line
+
+
+class SignatureCounts:
+    """Per-signature match counts and latest line of one device's log."""
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.total = {key: 0 for key in matcher.keys()}  # (signature, package) -> matches since start
+        self.latest = {}  # (signature, package) -> last matching line
+        self.bytes_scanned = 0
+        self._reported = {}
+        self._lock = threading.Lock()
+
+    def feed(self, data):
+        """Scan a chunk of complete log lines."""
+        hits = list(self.matcher.scan(data))
+        with self._lock:
+            self.bytes_scanned += len(data)
+            for name, package, line in hits:
+                key = (name, package)
+                self.total[key] = self.total.get(key, 0) + 1
+                self.latest[key] = line.decode('utf-8', 'replace').rstrip('\r')[:MAX_LINE_LENGTH]
+
+    def take_new(self):
+        """Matches per (signature, package) since the previous call and in total, with the latest lines."""
+        with self._lock:
+            new = {key: count - self._reported.get(key, 0) for key, count in self.total.items()}
+            self._reported = dict(self.total)
+            return new, dict(self.total), dict(self.latest)
+
+
+def scan_file(path, matcher, chunk_size=SCAN_CHUNK):
+    """Scan a (possibly gzipped) log file chunk by chunk and return its SignatureCounts."""
+    counts = SignatureCounts(matcher)
+    opener = gzip.open if path.endswith('.gz') else open
+    pending = b''
+    with opener(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            data = pending + chunk
+            cut = data.rfind(b'\n') + 1
+            pending = data[cut:]
+            if cut:
+                counts.feed(data[:cut])
+    if pending:
+        counts.feed(pending)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count crash and ANR signatures in captured logcat files.")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--rules', default=LOG_SIGNATURES_PATH)
+    args = parser.parse_args()
+    matcher = load_rules(args.rules)
+    for path in args.files:
+        try:
+            counts = scan_file(path, matcher)
+        except OSError as e:
+            logging.error(f"Cannot scan {path}: {e}")
+            continue
+        for (name, package), count in sorted(counts.total.items()):
+            if count:
+                print(f"{path}\t{name}\t{package}\t{count}\t{counts.latest[(name, package)]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
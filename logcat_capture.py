@@ -0,0 +1,351 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import zlib
+
+from adb_client import AdbError, get_client
+from instrumentation import metrics
+from log_scanner import SignatureCounts
+
+LOGCAT_COMMAND = 'logcat -v epoch'  # Epoch timestamps make the resume cursor unambiguous
+ROTATE_MAX_BYTES = 32 * 1024 * 1024  # Uncompressed bytes per file before rotating
+ROTATE_MAX_AGE = 3600  # Seconds per file before rotating
+FLUSH_INTERVAL = 5.0  # Seconds between flushes of the write buffer and cursor
+READ_CHUNK = 64 * 1024
+RECONNECT_MIN_DELAY = 5.0
+RECONNECT_MAX_DELAY = 300.0
+# Seconds a device folder must go untouched before a capture takes it over; the previous owner (another
+# worker the device moved away from) flushes every FLUSH_INTERVAL and lets go within a shard heartbeat
+HANDOFF_QUIET = 30.0
+
+EPOCH_PATTERN = re.compile(rb'^\s*(\d{9,11}\.\d{3,9})\s')
+
+
+def safe_name(udid):
+    """Make a device serial (e.g. 10.0.0.5:5555) usable in file names."""
+    return re.sub(r'[^A-Za-z0-9._-]', '-', udid)
+
+
+def salvage_gzip(path):
+    """Rewrite a gzip file cut short by a crash so it ends cleanly; returns the bytes recovered."""
+    recovered = 0
+    tmp_path = f"{path}.tmp"
+    with gzip.open(path, 'rb') as source, gzip.open(tmp_path, 'wb', compresslevel=6) as target:
+        try:
+            # read1 hands out what is decompressed so far instead of losing it when the stream ends early
+            for chunk in iter(lambda: source.read1(READ_CHUNK), b''):
+                target.write(chunk)
+                recovered += len(chunk)
+        except (EOFError, OSError, zlib.error):
+            pass  # Everything up to the last flush is readable
+    os.replace(tmp_path, path)
+    return recovered
+
+
+def line_time(line):
+    """Epoch seconds of a `logcat -v epoch` line, or None for continuation/banner lines."""
+    match = EPOCH_PATTERN.match(line)
+    return float(match.group(1)) if match else None
+
+
+class LogcatCursor:
+    """Resume position of one device: last line timestamp and lines already seen at it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.last_time = None
+        self.seen_at_last_time = 0
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+                self.last_time = data.get('last_time')
+                self.seen_at_last_time = data.get('seen_at_last_time', 0)
+            except (OSError, ValueError) as e:
+                logging.error(f"Ignoring unreadable logcat cursor {path}: {e}")
+
+    def advance(self, timestamp):
+        if timestamp == self.last_time:
+            self.seen_at_last_time += 1
+        else:
+            self.last_time = timestamp
+            self.seen_at_last_time = 1
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_time': self.last_time, 'seen_at_last_time': self.seen_at_last_time}, f)
+        os.replace(tmp_path, self.path)
+
+
+class RotatingLogWriter:
+    """Writes log chunks to gzip files, rotating on size or age."""
+
+    def __init__(self, directory, prefix, max_bytes=ROTATE_MAX_BYTES, max_age=ROTATE_MAX_AGE, compress=True,
+                 on_rotate=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.on_rotate = on_rotate  # Called as on_rotate(path, opened, closed) with every finished file
+        self.path = None
+        self._file = None
+        self._opened_at = 0.0
+        self._opened_time = 0.0
+        self._written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        timestamp = datetime.datetime.now().isoformat().replace(":", "-")  # Replace colons with hyphens
+        suffix = '.txt.gz' if self.compress else '.txt'
+        self.path = os.path.join(self.directory, f"{self.prefix}_{timestamp}{suffix}")
+        self._file = gzip.open(self.path, 'ab', compresslevel=6) if self.compress else open(self.path, 'ab')
+        self._opened_at = time.monotonic()
+        self._opened_time = time.time()
+        self._written = 0
+
+    def write(self, data):
+        if self._file is None:
+            self._open()
+        self._file.write(data)
+        self._written += len(data)
+        if self._written >= self.max_bytes or time.monotonic() - self._opened_at >= self.max_age:
+            self.rotate()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def rotate(self):
+        """Close the current file; the next write starts a new one."""
+        if self._file is not None:
+            self._file.close()
+            logging.info(f"Rotated logcat file {self.path} after {self._written} bytes")
+            self._file = None
+            if self.on_rotate is not None:
+                try:
+                    self.on_rotate(self.path, self._opened_time, time.time())
+                except Exception as e:
+                    logging.error(f"Failed to file rotated logcat {self.path}: {e}")
+
+    def close(self):
+        self.rotate()
+
+
+class LogcatCapture:
+    """Continuously streams logcat of one device to disk, resuming after disconnects."""
+
+    def __init__(self, udid, data_folder, compress=True, matcher=None, store=None, hostname=''):
+        self.udid = udid
+        self.hostname = hostname
+        self.store = store  # ArtifactStore receiving every rotated file, None keeps them in place
+        directory = os.path.join(data_folder, 'logcat', safe_name(udid))
+        self.writer = RotatingLogWriter(directory, f"logcat_{safe_name(udid)}", compress=compress,
+                                        on_rotate=self._file_rotated if store is not None else None)
+        self.cursor = LogcatCursor(os.path.join(directory, 'cursor.json'))
+        self.last_line_time = self.cursor.last_time  # Epoch seconds of the newest line on disk
+        self.lines_written = 0
+        # Crash/ANR signatures found in the lines as they are written, None without a rule file
+        self.signatures = SignatureCounts(matcher) if matcher is not None else None
+        self._stop = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        if self.running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"logcat-{self.udid}", daemon=True)
+        self._thread.start()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, wait=True):
+        """Stop streaming; with wait=False the thread closes its file on its own shortly after."""
+        self._stop.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if wait and self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _file_rotated(self, path, opened, closed):
+        self.store.add(path, self.udid, 'logcat', self.hostname, opened, closed)
+
+    def wait_for_previous_writer(self):
+        """Wait until no other process has touched the device folder for HANDOFF_QUIET; False if stopped."""
+        while True:
+            newest = 0.0
+            for name in os.listdir(self.writer.directory):
+                try:
+                    newest = max(newest, os.path.getmtime(os.path.join(self.writer.directory, name)))
+                except OSError:
+                    continue  # Filed or replaced meanwhile
+            quiet = time.time() - newest
+            if quiet >= HANDOFF_QUIET:
+                return True
+            logging.info(f"Logcat folder of {self.udid} still in use, waiting {HANDOFF_QUIET - quiet:.0f}s")
+            if self._stop.wait(HANDOFF_QUIET - quiet):
+                return False
+
+    def file_orphans(self):
+        """File the segments a crashed run left open into the store before a new one is started."""
+        prefix = f"{self.writer.prefix}_"
+        for name in sorted(os.listdir(self.writer.directory)):
+            path = os.path.join(self.writer.directory, name)
+            if not name.startswith(prefix) or not name.endswith(('.txt', '.txt.gz')) or path == self.writer.path:
+                continue
+            try:
+                # The name carries the local time the segment was opened, colons replaced with hyphens
+                date, _, clock = name[len(prefix):].split('.txt')[0].partition('T')
+                opened = datetime.datetime.fromisoformat(f"{date}T{clock.replace('-', ':')}").timestamp()
+            except ValueError:
+                opened = None
+            try:
+                closed = os.path.getmtime(path)  # Last flush before the crash
+                if name.endswith('.gz'):
+                    salvage_gzip(path)
+                self.store.add(path, self.udid, 'logcat', self.hostname, opened, closed)
+                logging.info(f"Filed logcat segment {path} left over from a previous run")
+            except OSError as e:
+                logging.error(f"Failed to file leftover logcat segment {path}: {e}")
+
+    def command(self):
+        """Logcat command resuming from the cursor, or dumping the buffer on first start."""
+        if self.cursor.last_time is None:
+            return LOGCAT_COMMAND
+        return f"{LOGCAT_COMMAND} -T '{self.cursor.last_time:.3f}'"
+
+    def _run(self):
+        if not self.wait_for_previous_writer():
+            return
+        # The previous writer may have advanced the cursor since it was read
+        self.cursor = LogcatCursor(self.cursor.path)
+        self.last_line_time = self.cursor.last_time
+        if self.store is not None:
+            self.file_orphans()
+        delay = RECONNECT_MIN_DELAY
+        while not self._stop.is_set():
+            try:
+                self._sock = get_client().open_stream(self.udid, self.command())
+                logging.info(f"Logcat stream started for {self.udid}")
+                delay = RECONNECT_MIN_DELAY
+                self._consume(self._sock)
+            except (AdbError, OSError) as e:
+                logging.warning(f"Logcat stream for {self.udid} failed: {e}")
+            finally:
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+                self._flush()
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        self.writer.close()
+
+    def _consume(self, sock):
+        """Read the stream in chunks and append complete, not yet seen lines to disk."""
+        pending = b''
+        skip_before = self.cursor.last_time
+        skip_at_cursor = self.cursor.seen_at_last_time
+        out = []
+        last_flush = time.monotonic()
+        sock.settimeout(FLUSH_INTERVAL)
+        try:
+            while not self._stop.is_set():
+                try:
+                    chunk = sock.recv(READ_CHUNK)
+                except socket.timeout:
+                    # Quiet device: still get buffered lines to disk on time
+                    if out:
+                        self._write(out)
+                        out = []
+                        last_flush = time.monotonic()
+                    continue
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    timestamp = line_time(line)
+                    if skip_before is not None:
+                        # Drop lines the previous connection already wrote, including the banners and
+                        # continuation lines between them, until the first line past the cursor
+                        if timestamp is None or timestamp < skip_before:
+                            continue
+                        if timestamp == skip_before and skip_at_cursor > 0:
+                            skip_at_cursor -= 1
+                            continue
+                        skip_before = None
+                    if timestamp is not None:
+                        self.cursor.advance(timestamp)
+                        self.last_line_time = timestamp
+                    out.append(line)
+                    out.append(b'\n')
+                if out and (len(out) > 2048 or time.monotonic() - last_flush >= FLUSH_INTERVAL):
+                    self._write(out)
+                    out = []
+                    last_flush = time.monotonic()
+        finally:
+            # The cursor already covers these lines, so they must reach disk before it is saved
+            if out:
+                self._write(out)
+
+    def _write(self, out):
+        data = b''.join(out)
+        self.writer.write(data)
+        self.lines_written += len(out) // 2
+        if self.signatures is not None:
+            with metrics.timed('parse.logcat', self.udid):
+                self.signatures.feed(data)
+        self._flush()
+
+    def _flush(self):
+        self.writer.flush()
+        if self.cursor.last_time is not None:
+            try:
+                self.cursor.save()
+            except OSError as e:
+                logging.error(f"Failed to save logcat cursor for {self.udid}: {e}")
+
+
+class LogcatCaptureManager:
+    """Keeps one LogcatCapture running per device."""
+
+    def __init__(self, data_folder, compress=True, matcher=None):
+        self.data_folder = data_folder
+        self.compress = compress
+        self.matcher = matcher  # SignatureMatcher applied to every capture started afterwards
+        self.store = None  # ArtifactStore the captures file their rotated files into
+        self.captures = {}
+        self._lock = threading.Lock()
+
+    def ensure(self, udid, hostname=''):
+        """Start (or restart) the capture of a device and return it."""
+        with self._lock:
+            capture = self.captures.get(udid)
+            if capture is None:
+                capture = LogcatCapture(udid, self.data_folder, self.compress, self.matcher, self.store, hostname)
+                self.captures[udid] = capture
+        capture.start()
+        return capture
+
+    def stop(self, udid, wait=True):
+        with self._lock:
+            capture = self.captures.pop(udid, None)
+        if capture is not None:
+            capture.stop(wait)
+
+    def stop_all(self):
+        for udid in list(self.captures):
+            self.stop(udid)
@@ -1,60 +1,303 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
 import subprocess
+import sys
 import time
-import csv
-import os
 
-# Path to the scripts
-CREATE_HOST_SCRIPT = 'createhost.py'
-CONNECT_ADB_SCRIPT = 'connect_to_adb.py'
-MONITORING_ADB_SCRIPT = 'monitoring_adb.py'
-
-def run_script(script_name):
-    """Run a Python script and return its output."""
-    result = subprocess.run(['python', script_name], capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"Error running {script_name}: {result.stderr.strip()}")
-    else:
-        print(f"{script_name} output:\n{result.stdout.strip()}")
-
-def check_hosts_created():
-    """Check if hosts have been created successfully by reading the CSV."""
-    csv_file_path = 'Poly,yealink,logi-host.csv'
-    if not os.path.exists(csv_file_path):
-        print(f"CSV file not found: {csv_file_path}")
-        return False
-    
-    with open(csv_file_path, mode='r', encoding='utf-8-sig') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            hostname = row.get('Host', '').strip()
-            if not hostname:
-                print(f"Skipping row due to missing hostname: {row}")
+import connect_to_adb
+import createhost
+import monitoring_adb
+from adb_client import ADB_SERVER_PORT
+from inventory import get_inventory
+from scheduler import PollScheduler
+from sharding import HEARTBEAT_INTERVAL, LEASE_FOLDER, LeaseDirectory, ShardMember
+
+CONNECT_INTERVAL = 30  # Seconds between ADB connection sweeps
+FLEET_JOB = '*'  # Scheduler pseudo-device for fleet wide jobs
+WORKER_RESTART_DELAY = 5  # Seconds before the coordinator restarts a worker that exited
+PROVISION_RETRY_MIN = 60  # Seconds before a failed provisioning run is retried, doubling per failure
+PROVISION_RETRY_MAX = 1800
+
+class Provisioning:
+    """Keeps the Zabbix hosts in line with the CSV and leaves hosts Zabbix does not know out of monitoring.
+
+    A failed run (Zabbix API unreachable) is retried on a later inventory
+    reload with a growing delay, and any change of the CSV after a successful
+    one is provisioned on the next reload. With a
+    LeaseDirectory the missing hosts are also published for sharded workers.
+    """
+
+    def __init__(self, csv_file_path=monitoring_adb.CSV_FILE_PATH, leases=None):
+        self.csv_file_path = csv_file_path
+        self.leases = leases
+        self.synced = None  # Inventory rows of the last successful run
+        self.retry_delay = PROVISION_RETRY_MIN
+        self._retry_after = 0.0  # Monotonic time before which a failed run is not retried
+
+    def rows(self):
+        return {(device.host, device.group, device.template) for device in get_inventory(self.csv_file_path).devices()}
+
+    def due(self):
+        return time.monotonic() >= self._retry_after and self.synced != self.rows()
+
+    def run(self):
+        """Provision the hosts; returns False if it has to be retried."""
+        rows = self.rows()
+        try:
+            report = createhost.main(self.csv_file_path)
+        except Exception as e:
+            logging.warning(f"Host provisioning failed, retrying in {self.retry_delay}s: {e}")
+            self._back_off()
+            return False
+        missing = createhost.verify_hosts(report)
+        for hostname in missing:
+            logging.warning(f"Host '{hostname}' does not exist in Zabbix, leaving it out of monitoring")
+        if missing:
+            logging.warning(f"{len(missing)} of {len(report.requested)} hosts are missing in Zabbix")
+        monitoring_adb.unprovisioned_hosts = set(missing)
+        if self.leases is not None:
+            try:
+                self.leases.publish_unprovisioned(missing)
+            except OSError as e:
+                logging.error(f"Failed to share the unprovisioned hosts with the workers: {e}")
+                self._back_off()
+                return False
+        self.synced = rows
+        self.retry_delay = PROVISION_RETRY_MIN
+        return True
+
+    def _back_off(self):
+        self._retry_after = time.monotonic() + self.retry_delay
+        self.retry_delay = min(self.retry_delay * 2, PROVISION_RETRY_MAX)
+
+    async def refresh(self, loop):
+        """Re-run provisioning if it is due; returns True if the set of monitored hosts may have changed."""
+        if not self.due():
+            return False
+        return await loop.run_in_executor(None, self.run)
+
+provisioning = Provisioning()
+
+def keep_connections(owns=None, cache=None):
+    """Connect every device (of this worker's shard) the adb server does not already have."""
+    devices = [(host, udid) for host, udid in connect_to_adb.read_devices()
+               if (owns is None or owns(host)) and host not in monitoring_adb.unprovisioned_hosts]
+    report = connect_to_adb.sweep(connect_to_adb.ADB_PATH, devices, cache)
+    logging.info(f"ADB connection sweep: {report.summary()}")
+    for result in report.failed:
+        logging.info(f"Cannot connect to {result.host} - {result.ip_address}: {result.message}")
+
+class Daemon:
+    """Runs connection upkeep, metric polling and log collection in one process.
+
+    With a ShardMember the daemon is a sharded worker: it only connects and
+    polls the devices the hash ring assigns to it.
+    """
+
+    def __init__(self, shard=None):
+        self.scheduler = None
+        self.loop = None
+        self.shard = shard
+        self.owns = shard.owns if shard is not None else None
+        # Shared with the presence tracker's reconnects, so both back off the same devices
+        self.port_cache = monitoring_adb.port_cache
+
+    def devices(self):
+        """Devices to poll as {udid: hostname}, limited to this worker's shard."""
+        devices = monitoring_adb.read_devices()
+        if self.owns is None:
+            return devices
+        return {udid: hostname for udid, hostname in devices.items() if self.owns(hostname)}
+
+    def follow_provisioning(self):
+        """Pick up the coordinator's list of hosts missing in Zabbix; returns True if it changed."""
+        hosts = self.shard.leases.unprovisioned()
+        if hosts is None or hosts == monitoring_adb.unprovisioned_hosts:
+            return False
+        logging.info(f"Worker {self.shard.worker_id}: {len(hosts)} hosts are not provisioned in Zabbix")
+        monitoring_adb.unprovisioned_hosts = hosts
+        return True
+
+    def add_connect_job(self):
+        self.scheduler.add_job(FLEET_JOB, 'connect', keep_connections, CONNECT_INTERVAL,
+                               args=(self.owns, self.port_cache))
+
+    def reload(self):
+        """Re-read the device list and reschedule devices that were added, changed or removed."""
+        try:
+            get_inventory(monitoring_adb.CSV_FILE_PATH).reload(force=True)
+            added, removed = monitoring_adb.sync_devices(self.scheduler, self.devices())
+        except OSError as e:
+            logging.error(f"Reload failed, keeping the current device list: {e}")
+            return
+        logging.info(f"Reloaded device list: {len(added)} added or changed, {len(removed)} removed")
+        # Connect new devices right away instead of waiting for the next sweep
+        self.add_connect_job()
+
+    async def watch_shard(self):
+        """Renew the lease and follow membership and inventory changes every heartbeat."""
+        inventory = get_inventory(monitoring_adb.CSV_FILE_PATH)
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                moved = await self.loop.run_in_executor(None, self.shard.heartbeat)
+                changed = inventory.reload()
+                provisioned = self.follow_provisioning()
+            except OSError as e:
+                logging.error(f"Shard heartbeat failed: {e}")
+                continue
+            if moved or changed or provisioned:
+                added, removed = monitoring_adb.sync_devices(self.scheduler, self.devices())
+                logging.info(f"Worker {self.shard.worker_id} now owns {len(monitoring_adb.scheduled_devices)} "
+                             f"devices: {len(added)} taken over, {len(removed)} handed off")
+                if added:
+                    self.add_connect_job()
+
+    def stop(self):
+        logging.info("Shutting down")
+        self.scheduler.stop()
+
+    def _install_signal_handlers(self):
+        for name, handler in (('SIGTERM', self.stop), ('SIGINT', self.stop), ('SIGHUP', self.reload)):
+            signum = getattr(signal, name, None)
+            if signum is None:
+                continue  # SIGHUP does not exist on Windows
+            try:
+                self.loop.add_signal_handler(signum, handler)
+            except NotImplementedError:
+                # Event loops without signal support (Windows): hand over from the signal handler
+                signal.signal(signum, lambda *_, handler=handler: self.loop.call_soon_threadsafe(handler))
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.scheduler = PollScheduler()
+        self._install_signal_handlers()
+        if self.shard is not None:
+            self.shard.heartbeat()
+            self.follow_provisioning()
+        self.add_connect_job()
+        if monitoring_adb.MONITOR_HOST:
+            self.scheduler.add_job(FLEET_JOB, 'self-stats', monitoring_adb.report_self_stats,
+                                   monitoring_adb.SELF_STATS_INTERVAL)
+        # Device jobs only queue their values; one fleet job sends them in batches for all hosts
+        self.scheduler.add_job(FLEET_JOB, 'zabbix-flush', monitoring_adb.flush_zabbix,
+                               monitoring_adb.ZABBIX_FLUSH_INTERVAL)
+        monitoring_adb.sync_devices(self.scheduler, self.devices())
+        # Devices added to or removed from the CSV (or moved between workers) are picked up without a restart
+        if self.shard is not None:
+            watcher = asyncio.create_task(self.watch_shard())
+        else:
+            watcher = asyncio.create_task(monitoring_adb.watch_inventory(
+                self.scheduler, on_reload=lambda diff: provisioning.refresh(self.loop)))
+        try:
+            await self.scheduler.run()
+        finally:
+            watcher.cancel()
+            if self.shard is not None:
+                self.shard.leave()
+
+def run_worker(worker_id, adb_port, lease_folder=LEASE_FOLDER, stats_port=None):
+    """Poll the shard of the fleet this worker owns through its own adb server."""
+    monitoring_adb.configure_worker(worker_id, adb_port, stats_port)
+    monitoring_adb.setup()
+    shard = ShardMember(worker_id, LeaseDirectory(lease_folder), adb_port)
+    logging.info(f"Worker {worker_id} starting with adb server port {adb_port}")
+    try:
+        asyncio.run(Daemon(shard).run())
+    finally:
+        monitoring_adb.shutdown()
+
+def worker_command(worker_id, adb_port, lease_folder, stats_port):
+    command = [sys.executable, os.path.abspath(__file__), '--worker-id', worker_id, '--adb-port', str(adb_port),
+               '--lease-folder', lease_folder]
+    if stats_port is not None:
+        command += ['--stats-port', str(stats_port)]
+    return command
+
+def run_coordinator(workers, lease_folder=LEASE_FOLDER, base_adb_port=ADB_SERVER_PORT, worker_prefix=None):
+    """Start `workers` worker processes, each with its own adb server port, and restart any that exit."""
+    worker_prefix = worker_prefix or socket.gethostname()
+    commands = {}
+    for index in range(workers):
+        worker_id = f"{worker_prefix}-{index}"
+        stats_port = monitoring_adb.STATS_PORT + 1 + index if monitoring_adb.STATS_PORT is not None else None
+        commands[worker_id] = worker_command(worker_id, base_adb_port + 1 + index, lease_folder, stats_port)
+
+    processes = {worker_id: subprocess.Popen(command) for worker_id, command in commands.items()}
+    stopping = []
+    for name in ('SIGTERM', 'SIGINT'):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, lambda *_: stopping.append(True))
+    print(f"Coordinator started {workers} workers: {', '.join(processes)}")
+
+    restart_at = {}
+    next_inventory_check = time.monotonic() + monitoring_adb.INVENTORY_CHECK_INTERVAL
+    while not stopping:
+        time.sleep(1)
+        if time.monotonic() >= next_inventory_check:
+            next_inventory_check = time.monotonic() + monitoring_adb.INVENTORY_CHECK_INTERVAL
+            try:
+                get_inventory(monitoring_adb.CSV_FILE_PATH).reload()
+                if provisioning.due():
+                    provisioning.run()
+            except OSError as e:
+                logging.error(f"Inventory reload failed: {e}")
+        for worker_id, process in processes.items():
+            if process.poll() is None or stopping:
                 continue
-            
-            # Here you might want to implement a check to see if the host exists in Zabbix
-            # For now, we will just assume the host exists if the CSV was processed successfully
-            print(f"Host '{hostname}' is to be created.")
-    return True  # Return true for this simplified check
+            # The worker's lease expires on its own, so the others take over its devices meanwhile
+            if worker_id not in restart_at:
+                logging.error(f"Worker {worker_id} exited with code {process.returncode}, restarting")
+                restart_at[worker_id] = time.monotonic() + WORKER_RESTART_DELAY
+            elif time.monotonic() >= restart_at[worker_id]:
+                del restart_at[worker_id]
+                processes[worker_id] = subprocess.Popen(commands[worker_id])
+
+    for process in processes.values():
+        if process.poll() is None:
+            process.terminate()
+    for process in processes.values():
+        process.wait()
 
 def main():
-    # Step 1: Run the createhost.py script
-    print("Running createhost.py...")
-    run_script(CREATE_HOST_SCRIPT)
-    
-    # Step 2: Check if hosts were created successfully
-    if not check_hosts_created():
-        print("Hosts were not created successfully. Exiting.")
+    parser = argparse.ArgumentParser(description="Provision, connect and monitor the devices listed in the CSV.")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Run as coordinator of this many sharded worker processes")
+    parser.add_argument('--worker-id', help="Run as one sharded worker (started by the coordinator)")
+    parser.add_argument('--worker-prefix', help="Prefix of the worker ids started by this coordinator")
+    parser.add_argument('--adb-port', type=int, default=ADB_SERVER_PORT,
+                        help="adb server port of this worker (coordinator: base port)")
+    parser.add_argument('--lease-folder', default=LEASE_FOLDER, help="Folder holding the worker leases")
+    parser.add_argument('--stats-port', type=int, help="Stats endpoint port of this worker")
+    args = parser.parse_args()
+
+    if args.worker_id:
+        run_worker(args.worker_id, args.adb_port, args.lease_folder, args.stats_port)
+        return
+
+    monitoring_adb.setup()
+
+    # Step 1: Create the Zabbix hosts; unknown hosts are left out and an API outage is retried later
+    if args.workers:
+        provisioning.leases = LeaseDirectory(args.lease_folder)
+    print("Running host provisioning...")
+    provisioning.run()
+
+    # Step 2: Keep devices connected and monitored until we are told to stop
+    if args.workers:
+        monitoring_adb.shutdown()  # The workers own polling; the coordinator only supervises them
+        run_coordinator(args.workers, args.lease_folder, args.adb_port, args.worker_prefix)
         return
-    
-    # Step 3: Start connecting to ADB every second
-    print("Starting connect_to_adb.py...")
-    while True:
-        run_script(CONNECT_ADB_SCRIPT)
-        time.sleep(1)  # Wait for 1 second before the next iteration
-
-        # Run monitoring_adb.py once after connecting to ADB
-        print("Running monitoring_adb.py...")
-        run_script(MONITORING_ADB_SCRIPT)
+    print("Starting monitoring daemon...")
+    try:
+        asyncio.run(Daemon().run())
+    finally:
+        monitoring_adb.shutdown()
 
 if __name__ == "__main__":
     main()
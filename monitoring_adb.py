@@ -1,16 +1,52 @@
-import subprocess
+import json
 import logging
-import csv
 import time
-import datetime
 import os
-import glob
+import asyncio
+import random
 import threading
 
+import connect_to_adb
+from adb_client import AdbError, get_client, use_server
+from artifacts import ArtifactStore
+from bugreport_queue import BugreportQueue
+from device_snapshot import (DeviceSnapshot, MEMINFO_PREFIX, PROCESS_MEMINFO_SECTION, build_script,
+                             meminfo_section, section_command, sections_due, split_output)
+from instrumentation import metrics, start_stats_server
+from inventory import get_inventory, is_valid_ip
+from leak_detector import MIN_SAMPLES, LeakDetector
+from log_scanner import LOG_SIGNATURES_PATH, load_rules
+from logcat_capture import LogcatCaptureManager
+from parsers import (parse_battery, parse_cpuinfo, parse_meminfo, parse_net_dev, parse_pss_by_process,
+                     parse_uptime, primary_interface)
+from preprocessing import Preprocessor
+from presence import OfflineBackoff, PresenceTracker
+from scheduler import PollScheduler
+from spool import Spool
+from zabbix_sender import ZabbixSender
+
 # Constants
 CSV_FILE_PATH = r'Poly,yealink,logi-host.csv'  # Your CSV file path
+INVENTORY_CHECK_INTERVAL = 30  # Seconds between checks of the CSV file for changes
 ZABBIX_SERVER = '10.39.1.102'  # Replace with your Zabbix server
 DATA_FOLDER = 'data'  # Folder to store logcat and bugreport files
+LOG_FILE = 'device_monitor.log'
+
+# Self-instrumentation of the monitor
+STATS_PORT = 9108  # Local HTTP endpoint serving /metrics, None to disable
+PROFILING_ENABLED = False  # Allow /profile?seconds=N sampling dumps on the stats endpoint
+MONITOR_HOST = None  # Zabbix host receiving the monitor's own items, None to disable
+SELF_STATS_INTERVAL = 60  # Seconds between reports of the monitor's own items
+ZABBIX_FLUSH_INTERVAL = 5  # Seconds between sends of the values queued by all device jobs
+
+# In-process Zabbix sender, values are buffered and flushed once per device cycle
+zabbix_sender = ZabbixSender(ZABBIX_SERVER)
+
+# Values the Zabbix server could not take are kept here and replayed later, attached by setup()
+SPOOL_FOLDER = os.path.join(DATA_FOLDER, 'spool')
+
+# Rates, reset detection and change suppression, configured per item in preprocessing.ITEMS
+preprocessor = Preprocessor()
 
 #package
  # Collect memory usage for important packages
@@ -20,294 +56,578 @@ packages = {
             "Company Portal": "com.microsoft.windowsintune.companyportal"
         }
 
-# Setup logging
-logging.basicConfig(filename='device_monitor.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Create the data folder if it does not exist
-os.makedirs(DATA_FOLDER, exist_ok=True)
-
-def run_command(command):
-    """Run a shell command and return the output."""
+# Processes whose memory is reported, looked up by (vendor, model), then vendor, then 'default'.
+# An entry ending in '*' matches every process name starting with it.
+PACKAGE_WATCH_LISTS = {
+    'default': list(packages.values()),
+    'Poly': list(packages.values()) + ['com.polycom.*'],
+    'Yealink': list(packages.values()) + ['com.yealink.*'],
+    'Logi': list(packages.values()) + ['com.logitech.*'],
+    'Neat': list(packages.values()),
+}
+
+# Seconds between runs of each per-device job
+POLL_INTERVALS = {
+    'metrics': 10,  # Network, uptime, CPU and battery snapshot
+    'memory': 60,  # One memory sample for every package
+    'logs': 60,  # Logcat collection check and crash/ANR signature report
+}
+
+# Anomalies that trigger a bugreport (subject to the bugreport queue's cooldown)
+BUGREPORT_LEAK_SLOPE = 10 * 1024  # KB per hour of memory growth for any package
+BUGREPORT_CPU_SPIKE = 90.0  # Total CPU percent
+MEMORY_CEILINGS_KB = {}  # Per-package memory ceilings (KB) for the leak ETA, default applies otherwise
+
+# Last known online state per device, used to detect offline -> online transitions
+last_online = {}
+# Devices seen online since start-up; a device that starts out offline has no outage to report on
+seen_online = set()
+
+# Number of snapshot cycles run per device, used to pick the sections due each cycle
+device_cycles = {}
+
+# Continuous per-device logcat streams, written under DATA_FOLDER/logcat/<device>/
+logcat_captures = LogcatCaptureManager(DATA_FOLDER)
+
+# Crash/ANR signatures scanned in the logcat streams, loaded by setup(); None disables scanning
+SIGNATURES_PATH = LOG_SIGNATURES_PATH
+
+# Bugreports run from a bounded queue, written under DATA_FOLDER/bugreport/<device>/
+bugreport_queue = BugreportQueue(DATA_FOLDER)
+
+# Finished logcat files and bugreports are filed under DATA_FOLDER/<kind>/<device>/<date>/ and indexed, set up by setup()
+ARTIFACT_MAX_BYTES = 20 * 1024 ** 3  # Oldest artifacts are deleted beyond this total size
+ARTIFACT_MAX_AGE = 30 * 86400  # Seconds artifacts are kept at most
+artifact_store = None
+
+# Memory series persist across cycles and restarts, loaded by setup()
+LEAK_SNAPSHOT_PATH = os.path.join(DATA_FOLDER, 'memory_leak.snapshot')
+leak_detector = None
+
+# Devices currently registered on the scheduler, udid -> hostname
+scheduled_devices = {}
+unprovisioned_hosts = set()  # Listed in the CSV but missing in Zabbix, so not monitored
+
+# Local stats endpoint, started by setup()
+stats_server = None
+
+# Online set kept up to date from the adb server's device stream, started by setup()
+presence = PresenceTracker()
+
+# Offline devices are held back from polling with a growing delay
+offline_backoff = OfflineBackoff()
+
+# Port memo and connect backoff shared by connection sweeps and presence reconnects, loaded by setup()
+PORT_CACHE_PATH = connect_to_adb.PORT_CACHE_PATH
+port_cache = None
+reconnecting = set()
+reconnecting_lock = threading.Lock()
+
+def setup():
+    """Prepare logging, the data folder and the long-lived components before polling starts."""
+    global leak_detector, stats_server, port_cache, artifact_store
+
+    # Setup logging
+    logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Create the data folder if it does not exist
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+
+    if artifact_store is None:
+        artifact_store = ArtifactStore(DATA_FOLDER, ARTIFACT_MAX_BYTES, ARTIFACT_MAX_AGE)
+        logcat_captures.store = artifact_store
+    if leak_detector is None:
+        leak_detector = LeakDetector(LEAK_SNAPSHOT_PATH, ceilings=MEMORY_CEILINGS_KB)
+    if zabbix_sender.spool is None:
+        zabbix_sender.spool = Spool(SPOOL_FOLDER)
+    bugreport_queue.on_complete = on_bugreport_complete
+    bugreport_queue.start()
+    if port_cache is None:
+        port_cache = connect_to_adb.PortCache(PORT_CACHE_PATH)
+    if SIGNATURES_PATH and logcat_captures.matcher is None:
+        try:
+            logcat_captures.matcher = load_rules(SIGNATURES_PATH)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Logcat signature scanning disabled, cannot load {SIGNATURES_PATH}: {e}")
+    presence.on_change = on_presence_change
+    presence.start()
+
+    metrics.register_gauge('zabbix.pending', zabbix_sender.pending)
+    metrics.register_gauge('spool.depth', lambda: len(zabbix_sender.spool))
+    metrics.register_gauge('spool.age', lambda: round(zabbix_sender.spool.stats().age))
+    metrics.register_gauge('bugreport.pending', bugreport_queue.pending)
+    if STATS_PORT is not None and stats_server is None:
+        try:
+            stats_server = start_stats_server(STATS_PORT, profiling=PROFILING_ENABLED)
+        except OSError as e:
+            logging.error(f"Cannot start stats endpoint on port {STATS_PORT}: {e}")
+
+def configure_worker(worker_id, adb_port, stats_port=None):
+    """Give a sharded worker its own adb server, log, spool, leak snapshot and stats port; call before setup()."""
+    global LOG_FILE, SPOOL_FOLDER, LEAK_SNAPSHOT_PATH, STATS_PORT, PORT_CACHE_PATH
+    worker_folder = os.path.join(DATA_FOLDER, f"worker-{worker_id}")
+    LOG_FILE = f"device_monitor-{worker_id}.log"
+    PORT_CACHE_PATH = f"adb_port_cache-{worker_id}.json"
+    SPOOL_FOLDER = os.path.join(worker_folder, 'spool')
+    LEAK_SNAPSHOT_PATH = os.path.join(worker_folder, 'memory_leak.snapshot')
+    STATS_PORT = stats_port
+    os.makedirs(worker_folder, exist_ok=True)
+    use_server(port=adb_port)
+
+def shutdown():
+    """Stop background components and persist state; safe to call more than once."""
+    global stats_server, artifact_store
+    if stats_server is not None:
+        stats_server.shutdown()
+        stats_server = None
+    presence.stop()
+    logcat_captures.stop_all()
+    bugreport_queue.stop()
+    if artifact_store is not None:
+        artifact_store.close()
+        artifact_store = None
+    if leak_detector is not None:
+        try:
+            leak_detector.save(LEAK_SNAPSHOT_PATH)
+        except OSError as e:
+            logging.error(f"Failed to write leak detector snapshot: {e}")
+    zabbix_sender.flush()
+    if zabbix_sender.spool is not None:
+        zabbix_sender.spool.close()
+
+def adb_shell(udid, command, timeout=None):
+    """Run a shell command on the device through the adb server socket and return the output."""
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, encoding='utf-8', errors='ignore', check=True)
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Command '{command}' failed with error: {e.stderr.strip()}")
+        return get_client().shell(udid, command, timeout).strip()
+    except AdbError as e:
+        logging.error(f"adb shell '{command}' on {udid} failed with error: {e}")
         return None
 
-def get_network_usage(udid):
-    """Get network RX and TX bytes from the device, prioritizing Ethernet over WLAN."""
-    output = run_command(f"adb -s {udid} shell cat /proc/net/dev")
-    if output:
-        eth_rx, eth_tx = 0, 0
-        wlan_rx, wlan_tx = 0, 0
-        
-        for line in output.splitlines():
-            parts = line.split()
-            if "eth0" in line:  # Check for the eth0 interface only
-                eth_rx = int(parts[1])  # Received bytes
-                eth_tx = int(parts[9])  # Transmitted bytes
-            elif "wlan0" in line:  # Check for the wlan0 interface
-                wlan_rx = int(parts[1])  # Received bytes
-                wlan_tx = int(parts[9])  # Transmitted bytes
-
-        # Prioritize Ethernet over WLAN
-        if eth_rx > 0 or eth_tx > 0:
-            return eth_rx, eth_tx
-        elif wlan_rx > 0 or wlan_tx > 0:
-            return wlan_rx, wlan_tx
-
-    logging.warning(f"No network data found for device {udid}")
-    return 0, 0  # Default to 0 if nothing found
-
-def get_memory_usage(udid, package_name):
-    """Get memory usage for the specified package on the device."""
-    output = run_command(f"adb -s {udid} shell dumpsys meminfo {package_name}")
-    if output:
-        for line in output.splitlines():
-            if "TOTAL" in line:
-                memory_usage = int(line.split()[1])
-                return memory_usage
-    logging.warning(f"Memory usage data not found for {package_name} on device {udid}")
-    return 0
-
-def get_cpu_usage(udid):
-    """Get the current CPU usage for the device."""
-    output = run_command(f"adb -s {udid} shell dumpsys cpuinfo")
-    if output:
-        total_cpu_line = [line for line in output.splitlines() if "TOTAL" in line]
-        if total_cpu_line:
-            try:
-                cpu_usage = float(total_cpu_line[0].split('%')[0].strip())
-                return max(cpu_usage, 0.0)  # Ensure no negative CPU usage is returned
-            except ValueError as e:
-                logging.error(f"Error parsing CPU usage for {udid}: {str(e)}")
-                return 0.0
-    logging.warning(f"CPU usage data not found for device {udid}")
-    return 0.0
-
-def get_battery_health(udid):
-    """Get the battery level from the device."""
-    output = run_command(f"adb -s {udid} shell dumpsys battery")
-    if output:
-        for line in output.splitlines():
-            if "health" in line:
-                get_battery_health = int(line.split(":")[1].strip())
-                return get_battery_health
-    logging.warning(f"Battery data not found for device {udid}")
-    return 0
-
-def get_uptime(udid):
-    """Get the network uptime for the device."""
-    output = run_command(f"adb -s {udid} shell cat /proc/uptime")
-    if output:
-        uptime_seconds = float(output.split()[0])
-        return uptime_seconds
-    logging.warning(f"Uptime data not found for device {udid}")
-    return 0.0
-def analyze_memory_data(memory_data, hostname, udid):
-    """Analyze memory data and check for potential leaks, sending results to Zabbix."""
-    print("\n--- Analyzing Memory Data for Potential Leaks ---\n")
-    
-    for name, mem_usages in memory_data.items():
-        print(f"[{name}] Memory Usage Data: {mem_usages} KB")
-        
-        if len(mem_usages) > 1:
-            if mem_usages[-1] > mem_usages[0]:  # Check if there's an increase
-                increase_percentage = ((mem_usages[-1] - mem_usages[0]) / mem_usages[0]) * 100
-                print(f"Memory usage increased by {increase_percentage:.2f}% over the monitoring period.")
-                logging.info(f"Memory usage for {name} increased by {increase_percentage:.2f}%")
-                
-                zabbix_key = f"memory.leak[{packages[name]}]"  # Zabbix key for memory leak
-                send_to_zabbix(hostname, zabbix_key, increase_percentage)  # Send percentage increase
-            else:
-                print(f"No memory leak detected for {name}. Memory usage is stable or decreased.")
-                send_to_zabbix(hostname, f"memory.leak[{packages[name]}]", -1)  # Send -1 or a value to indicate no leak
-        else:
-            logging.warning(f"Insufficient memory data for {name}, unable to analyze.")
-            send_to_zabbix(hostname, f"memory.leak[{packages[name]}]", 0)  # Indicate no analysis could be done
-
+def read_section(udid, snapshot, section):
+    """Return a section's output from the snapshot, falling back to a dedicated adb shell call."""
+    if snapshot is not None and snapshot.has(section):
+        return snapshot.raw(section)
+    return adb_shell(udid, section_command(section))
 
-def send_to_zabbix(hostname, key, value):
-    """Send data to Zabbix."""
+def take_snapshot(udid, sections):
+    """Collect the given sections in one composite adb shell round-trip and parse them."""
+    output = adb_shell(udid, build_script(sections), timeout=60)
+    if output is None:
+        return None
+    with metrics.timed('parse.snapshot', udid):
+        snapshot = DeviceSnapshot(udid, split_output(output))
+        if snapshot.has('net'):
+            snapshot.interfaces = get_interfaces(udid, snapshot)
+            primary = get_network_usage(udid, snapshot.interfaces)
+            snapshot.network = (primary.rx_bytes, primary.tx_bytes) if primary is not None else (0, 0)
+            snapshot.network_interface = primary.name if primary is not None else None
+        if snapshot.has('uptime'):
+            snapshot.uptime = get_uptime(udid, snapshot)
+        if snapshot.has('cpu'):
+            snapshot.cpu_info = get_cpu_info(udid, snapshot)
+            snapshot.cpu = max(snapshot.cpu_info.total, 0.0) if snapshot.cpu_info is not None else 0.0
+        if snapshot.has('battery'):
+            battery = get_battery(udid, snapshot)
+            # Mains-powered devices report a placeholder battery; none of its items mean anything
+            if battery is None or battery.present is not False:
+                snapshot.battery = battery
+                snapshot.battery_health = (battery.health or 0) if battery is not None else 0
+        if snapshot.has(PROCESS_MEMINFO_SECTION):
+            snapshot.processes = get_process_memory(udid, snapshot)
+        for section in snapshot.sections:
+            if section.startswith(MEMINFO_PREFIX):
+                package_id = section[len(MEMINFO_PREFIX):]
+                meminfo = get_meminfo(udid, package_id, snapshot)
+                snapshot.meminfo[package_id] = meminfo
+                snapshot.memory[package_id] = meminfo.total if meminfo is not None else 0
+    return snapshot
+
+def get_interfaces(udid, snapshot=None):
+    """Get the byte and packet counters of every network interface on the device."""
+    return parse_net_dev(read_section(udid, snapshot, 'net') or '')
+
+def get_network_usage(udid, interfaces):
+    """Counters of the interface carrying the device's traffic, prioritizing Ethernet over WLAN."""
+    primary = primary_interface(interfaces)
+    if primary is None:
+        logging.warning(f"No network data found for device {udid}")
+    return primary
+
+def get_meminfo(udid, package_name, snapshot=None):
+    """Get the memory breakdown of the specified package on the device."""
+    meminfo = parse_meminfo(read_section(udid, snapshot, meminfo_section(package_name)) or '')
+    if meminfo is None:
+        logging.warning(f"Memory usage data not found for {package_name} on device {udid}")
+    return meminfo
+
+def get_process_memory(udid, snapshot=None):
+    """Get the PSS (KB) of every running process from one system-wide `dumpsys meminfo`."""
+    processes = parse_pss_by_process(read_section(udid, snapshot, PROCESS_MEMINFO_SECTION) or '')
+    if not processes:
+        logging.warning(f"No per-process memory summary found for device {udid}")
+    return processes
+
+def watched_packages(udid):
+    """Watch list of the device's vendor and model from PACKAGE_WATCH_LISTS."""
+    device = get_inventory(CSV_FILE_PATH).get_by_udid(udid)
+    if device is not None:
+        for key in ((device.vendor, device.model), device.vendor):
+            if key in PACKAGE_WATCH_LISTS:
+                return PACKAGE_WATCH_LISTS[key]
+    return PACKAGE_WATCH_LISTS['default']
+
+def match_packages(watch_list, processes):
+    """PSS of the running processes matched by a watch list, {process: KB}."""
+    matched = {}
+    for entry in watch_list:
+        if entry.endswith('*'):
+            prefix = entry[:-1]
+            matched.update((name, pss) for name, pss in processes.items() if name.startswith(prefix))
+        elif entry in processes:
+            matched[entry] = processes[entry]
+    return matched
+
+def get_cpu_info(udid, snapshot=None):
+    """Get the total and per-process CPU usage of the device."""
+    cpu_info = parse_cpuinfo(read_section(udid, snapshot, 'cpu') or '')
+    if cpu_info is None:
+        logging.warning(f"CPU usage data not found for device {udid}")
+    return cpu_info
+
+def get_battery(udid, snapshot=None):
+    """Get the battery level, temperature and health of the device."""
+    battery = parse_battery(read_section(udid, snapshot, 'battery') or '')
+    if battery is None:
+        logging.warning(f"Battery data not found for device {udid}")
+    return battery
+
+def get_uptime(udid, snapshot=None):
+    """Get the uptime of the device in seconds."""
+    uptime = parse_uptime(read_section(udid, snapshot, 'uptime') or '')
+    if uptime is None:
+        logging.warning(f"Uptime data not found for device {udid}")
+        return 0.0
+    return uptime
+
+def analyze_memory_data(hostname, package_id, stats):
+    """Send the windowed leak indicators of one package to Zabbix."""
+    if stats.samples < MIN_SAMPLES:
+        logging.debug(f"Insufficient memory data for {package_id} on {hostname}, unable to analyze.")
+        return
+
+    if stats.slope > 0:
+        logging.info(f"Memory usage for {package_id} on {hostname} growing by {stats.slope:.1f} KB/h, "
+                     f"ceiling reached in {stats.hours_to_ceiling:.1f} h")
+    send_to_zabbix(hostname, f"memory.leak[{package_id}]", round(stats.slope, 3))  # KB per hour over the window
+    send_to_zabbix(hostname, f"memory.leak.ewma[{package_id}]", round(stats.ewma, 1))
+    send_to_zabbix(hostname, f"memory.leak.eta[{package_id}]", round(stats.hours_to_ceiling, 2))  # -1 if not growing
+
+
+def send_to_zabbix(hostname, key, value, clock=None, source=None):
+    """Preprocess a value and queue it for Zabbix; it is sent with the next batch flush."""
+    if clock is None:
+        clock = time.time()
+    processed = preprocessor.process(hostname, key, value, clock, source)
+    if processed is None:
+        logging.debug(f"Suppressed for Zabbix: {hostname} - {key} = {value}")
+        return
+    key, value = processed
     try:
-        command = f'zabbix_sender -z {ZABBIX_SERVER} -s "{hostname}" -k "{key}" -o {value}'
-        result = run_command(command)
-        if result:
-            logging.info(f"Sent to Zabbix: {hostname} - {key} = {value}")
-        else:
-            logging.error(f"Failed to send data to Zabbix for {hostname}: {key} = {value}")
+        zabbix_sender.add(hostname, key, value, clock)
+        logging.debug(f"Queued for Zabbix: {hostname} - {key} = {value}")
     except Exception as e:
         logging.error(f"Failed to send data to Zabbix for {hostname}: {str(e)}")
 
+def flush_zabbix():
+    """Send the values queued for every host to Zabbix and log the outcome."""
+    result = zabbix_sender.flush()
+    if result.total:
+        logging.info(f"Flushed Zabbix buffer of all hosts: {result.processed} processed, "
+                     f"{result.failed} failed, {result.spooled} spooled of {result.total}")
+    if result.spooled:
+        stats = zabbix_sender.spool.stats()
+        logging.warning(f"Zabbix unreachable, spool backlog {stats.depth} values, oldest {stats.age:.0f}s old")
+    return result
+
+def report_self_stats():
+    """Send the monitor's own latency, failure and backlog figures to its Zabbix host."""
+    if not MONITOR_HOST:
+        return
+    for key, value in metrics.zabbix_items():
+        send_to_zabbix(MONITOR_HOST, key, value)
+    flush_zabbix()
+
 def collect_logcat(udid, hostname):
-    """Collect logcat data from the device."""
-    output = run_command(f"adb -s {udid} logcat -d")
-    if output:
-        timestamp = datetime.datetime.now().isoformat().replace(":", "-")  # Replace colons with hyphens
-        logcat_filename = os.path.join(DATA_FOLDER, f"logcat_{udid}_{timestamp}.txt")
-        
-        with open(logcat_filename, 'w', encoding='utf-8') as log_file:
-            log_file.write(output)
-        logging.info(f"Logcat collected for {udid} and saved to {logcat_filename}")
-
-        # Send logcat collection timestamp to Zabbix
-        timestamp_minutes = int(time.time() / 60)  # Convert to minutes since epoch
+    """Make sure logcat is being streamed to disk and report the time of the last line received."""
+    capture = logcat_captures.ensure(udid, hostname)
+    if capture.last_line_time is not None:
+        # Send the time of the newest captured line to Zabbix
+        timestamp_minutes = int(capture.last_line_time / 60)  # Convert to minutes since epoch
         send_to_zabbix(hostname, "logcat.collection.timestamp", timestamp_minutes)
-
-        return logcat_filename
-    else:
-        logging.warning(f"Failed to collect logcat for {udid}")
+        report_log_signatures(hostname, capture)
+        return capture.writer.path
+    logging.warning(f"No logcat lines captured yet for {udid}")
     return None
 
-def collect_bugreport(udid, hostname):
-    """Collect bugreport data from the device."""
-    # Create the data folder if it doesn't exist
-    if not os.path.exists(DATA_FOLDER):
-        os.makedirs(DATA_FOLDER)
-
-    # Run the bugreport command
-    command = f"adb -s {udid} bugreport {DATA_FOLDER}"  # Specify the data folder as the destination
-    subprocess.run(command, shell=True, check=True)
-
-    # Get the path of the generated bug report
-    list_of_files = glob.glob(os.path.join(DATA_FOLDER, '*'))
-    bugreport_path = max(list_of_files, key=os.path.getctime)  # Get the most recent file
-
-    # Create the new filename based on the current timestamp
-    timestamp = datetime.datetime.now().isoformat().replace(":", "-")  # Replace colons with hyphens
-    new_file_name = f"bugreport_{hostname}_{timestamp}.zip"  # New filename
-    new_file_path = os.path.join(DATA_FOLDER, new_file_name)
-
-    # Rename the bug report file
-    os.rename(bugreport_path, new_file_path)
-
-    logging.info(f"Bugreport collected for {udid} and saved to {new_file_path}")
-
+def report_log_signatures(hostname, capture):
+    """Send the crash/ANR match counts of every discovered signature and the latest matching lines.
+
+    Counts are cumulative since the capture started, so a signature without new
+    matches keeps its value (Zabbix turns it into a rate with "Simple change").
+    """
+    if capture.signatures is None:
+        return
+    new, total, latest = capture.signatures.take_new()
+    discovery = [{'{#SIGNATURE}': name, '{#PACKAGE}': package} for name, package in sorted(total)]
+    send_to_zabbix(hostname, 'logcat.signature.discovery', json.dumps(discovery))
+    for (name, package), count in total.items():
+        send_to_zabbix(hostname, f"logcat.signature.count[{name},{package}]", count)
+        if new.get((name, package)):
+            logging.info(f"{new[(name, package)]} new '{name}' matches for {package} in the logcat of {hostname}")
+            send_to_zabbix(hostname, f"logcat.signature.last[{name},{package}]", latest[(name, package)])
+
+def on_bugreport_complete(job, path):
+    """File a finished bugreport in the artifact store and report it to Zabbix."""
+    if artifact_store is not None:
+        artifact = artifact_store.add(path, job.udid, 'bugreport', job.hostname, started=job.queued_at)
+        if artifact is not None:
+            logging.info(f"Bugreport of {job.hostname} filed as {artifact.path}")
     # Send bugreport collection timestamp to Zabbix
     timestamp_minutes = int(time.time() / 60)  # Convert to minutes since epoch
-    send_to_zabbix(hostname, "bugreport.collection.timestamp", timestamp_minutes)
+    send_to_zabbix(job.hostname, "bugreport.collection.timestamp", timestamp_minutes)
+    flush_zabbix()
 
-    return new_file_path
+def collect_bugreport(udid, hostname, reason):
+    """Queue a bugreport for the device; returns False if one is in flight or cooling down."""
+    adb_server = f"{get_client().pool.host}:{get_client().pool.port}"
+    return bugreport_queue.request(udid, hostname, reason, adb_server)
 
 def send_device_online_status(hostname, is_online):
     """Send device online/offline status to Zabbix."""
     online_status = 1 if is_online else 0
     send_to_zabbix(hostname, "device.online.status", online_status)
 
+def on_presence_change(udid, online):
+    """Report a presence transition right away and try to bring a dropped device back."""
+    hostname = scheduled_devices.get(udid)
+    if hostname is None:
+        return
+    send_device_online_status(hostname, online)
+    flush_zabbix()
+    if online:
+        offline_backoff.clear(udid)  # Resume polling on the next due run
+    else:
+        reconnect_device(udid, hostname)
+
+def reconnect_device(udid, hostname):
+    """Reconnect a network device in the background through the usual 5555/4242 port logic."""
+    if port_cache is None or not is_valid_ip(udid):
+        return  # USB devices come back by themselves
+    with reconnecting_lock:
+        if udid in reconnecting:
+            return
+        reconnecting.add(udid)
+
+    def run():
+        try:
+            result = connect_to_adb.connect_one(connect_to_adb.ADB_PATH, hostname, udid, port_cache, time.time())
+            logging.info(f"Reconnect of {hostname} ({udid}): {result.status} {result.message}")
+        finally:
+            with reconnecting_lock:
+                reconnecting.discard(udid)
+
+    threading.Thread(target=run, name=f"reconnect-{udid}", daemon=True).start()
+
 def is_device_online(udid):
     """Check if the device is online."""
     if not udid:
         logging.error("UDID is missing, cannot check device status")
         return False
 
-    # Check if the device responds to adb get-state
-    device_status = run_command(f"adb -s {udid} get-state")
+    # The presence tracker answers without an adb round-trip once it has a device list
+    if presence.ready:
+        return presence.is_online(udid)
+
+    # Otherwise check if the device responds to adb get-state
+    device_status = get_client().get_state(udid)
     if device_status == "device":
         return True
     else:
         logging.info(f"Device {udid} is offline with status: {device_status}")
         return False
 
-def process_device_main(udid, hostname):
-    """Process network, memory, CPU, and battery usage for a given device."""
-    if is_device_online(udid):
-        # Get network usage
-        rx_bytes, tx_bytes = get_network_usage(udid)
-        if rx_bytes > 0 and tx_bytes > 0:
-            send_to_zabbix(hostname, "network.rx.bytes", rx_bytes)
-            send_to_zabbix(hostname, "network.tx.bytes", tx_bytes)
-
-        # Get network uptime
-        uptime_seconds = get_uptime(udid)
-        if uptime_seconds > 0:
-            send_to_zabbix(hostname, "device.uptime", uptime_seconds)
-
-        # Get CPU usage
-        cpu_usage = get_cpu_usage(udid)
-        if cpu_usage > 0:
-            send_to_zabbix(hostname, "cpu.usage", cpu_usage)
-
-        memory_data = {name: [] for name in packages.keys()}  # To store memory usage over time
-        
-        # Monitor memory usage over the desired period (e.g., 5 intervals, checking every 60 seconds)
-        check_duration = 5  # Number of times to check memory usage
-        check_interval = 60  # Time (in seconds) between each check
-
-        for i in range(check_duration):
-            for package_name, package_id in packages.items():
-                memory_usage = get_memory_usage(udid, package_id)
-                if memory_usage > 0:
-                    memory_data[package_name].append(memory_usage)
-                    send_to_zabbix(hostname, f"memory.usage[{package_id}]", memory_usage)
-            
-            time.sleep(check_interval)
-
-        # Analyze memory data for potential leaks and send results to Zabbix
-        analyze_memory_data(memory_data, hostname, udid)
-
-        # Get battery level
-        battery_level = get_battery_health(udid)
-        if battery_level > 0:
-            send_to_zabbix(hostname, "battery.health", battery_level)
+def poll_device_metrics(udid, hostname):
+    """Process network, CPU, and battery usage for a given device."""
+    if offline_backoff.held_back(udid):
+        return
+    online = is_device_online(udid)
+    was_online = last_online.get(udid)
+    last_online[udid] = online
+    if online:
+        if was_online is False and udid in seen_online:
+            collect_bugreport(udid, hostname, "device came back online")
+        seen_online.add(udid)
+
+        # Fetch every section due this cycle in a single adb shell round-trip
+        cycle = device_cycles.get(udid, 0)
+        device_cycles[udid] = cycle + 1
+        snapshot = take_snapshot(udid, sections_due(cycle, []))
+        if snapshot is None:
+            logging.warning(f"Snapshot collection failed for device {udid}")
+            snapshot = DeviceSnapshot(udid, {})
+
+        # Uptime goes first so a reboot resets the counter baselines before rates are computed
+        samples = [("device.uptime", snapshot.uptime), ("cpu.usage", snapshot.cpu),
+                   ("battery.health", snapshot.battery_health)]
+        if snapshot.battery is not None:
+            samples += [("battery.level", snapshot.battery.level), ("battery.temperature", snapshot.battery.temperature)]
+        for key, value in samples:
+            if value is not None:
+                send_to_zabbix(hostname, key, value, snapshot.taken_at)
+        if snapshot.network is not None:
+            # Tagged with the interface so a fallback from eth0 to wlan0 restarts the rate instead of diffing both
+            send_to_zabbix(hostname, "network.rx.bytes", snapshot.network[0], snapshot.taken_at, snapshot.network_interface)
+            send_to_zabbix(hostname, "network.tx.bytes", snapshot.network[1], snapshot.taken_at, snapshot.network_interface)
+
+        if snapshot.cpu and snapshot.cpu >= BUGREPORT_CPU_SPIKE:
+            collect_bugreport(udid, hostname, f"CPU spike {snapshot.cpu:.0f}%")
 
         # Send device online status
         send_device_online_status(hostname, True)
     else:
         send_device_online_status(hostname, False)
+        delay = offline_backoff.record_offline(udid)
+        logging.info(f"Device {udid} offline, holding back polling for {delay}s")
+
+def poll_device_memory(udid, hostname):
+    """Take one memory sample for every watched package and update the leak detector."""
+    if offline_backoff.held_back(udid) or not is_device_online(udid):
+        return
+
+    # One system-wide meminfo gives the PSS of every process
+    snapshot = take_snapshot(udid, [PROCESS_MEMINFO_SECTION])
+    if snapshot is None:
+        logging.warning(f"Memory snapshot collection failed for device {udid}")
+        return
+
+    watch_list = watched_packages(udid)
+    if snapshot.processes:
+        memory = match_packages(watch_list, snapshot.processes)
+    else:
+        # No per-process summary in this dumpsys: fall back to one meminfo per named package
+        snapshot = take_snapshot(udid, [meminfo_section(entry) for entry in watch_list if not entry.endswith('*')])
+        if snapshot is None:
+            logging.warning(f"Memory snapshot collection failed for device {udid}")
+            return
+        memory = snapshot.memory
+
+    # Low-level discovery: Zabbix creates the memory.usage[...] items of whatever is running
+    discovery = [{'{#PACKAGE}': package_id} for package_id in sorted(memory)]
+    send_to_zabbix(hostname, 'memory.discovery', json.dumps(discovery), snapshot.taken_at)
+
+    for package_id, memory_usage in memory.items():
+        if memory_usage > 0:
+            send_to_zabbix(hostname, f"memory.usage[{package_id}]", memory_usage, snapshot.taken_at)
+
+            # Update the persistent per-package series and report its leak indicators
+            stats = leak_detector.add(udid, package_id, memory_usage, snapshot.taken_at)
+            analyze_memory_data(hostname, package_id, stats)
+            if stats.samples >= MIN_SAMPLES and stats.slope >= BUGREPORT_LEAK_SLOPE:
+                collect_bugreport(udid, hostname, f"{package_id} leaking {stats.slope:.0f} KB/h")
 
 def process_device_logs(udid, hostname):
-    """Collect logcat and bugreport for a given device."""
-    if is_device_online(udid):
+    """Keep logcat collection running for a given device; bugreports are triggered by anomalies."""
+    if not offline_backoff.held_back(udid) and is_device_online(udid):
         collect_logcat(udid, hostname)
-        collect_bugreport(udid, hostname)
 
-def main_loop():
-    """Main function to read devices from CSV and monitor them every 10 seconds."""
-    while True:
-        with open(CSV_FILE_PATH, newline='', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            threads = []
-            for row in reader:
-                if 'Host' in row and 'udid' in row:
-                    udid = row['udid'].strip()
-                    hostname = row['Host'].strip()
-                    if udid and hostname:
-                        thread = threading.Thread(target=process_device_main, args=(udid, hostname))
-                        threads.append(thread)
-                        thread.start()
-
-            # Wait for all threads to complete
-            for thread in threads:
-                thread.join()
-
-        time.sleep(10)  # Wait for 10 seconds before the next iteration
-
-def log_collection_loop():
-    """Function to collect logs every 10 minutes."""
+def schedule_device(scheduler, udid, hostname):
+    """Register the metric, memory and log collection jobs of one device."""
+    adb_server = f"{get_client().pool.host}:{get_client().pool.port}"
+    for metric, func in (('metrics', poll_device_metrics),
+                         ('memory', poll_device_memory),
+                         ('logs', process_device_logs)):
+        interval = POLL_INTERVALS[metric]
+        # Spread the first run over the interval so devices do not all fire at once
+        first_due = time.monotonic() + random.uniform(0, interval)
+        scheduler.add_job(udid, metric, func, interval, adb_server, args=(udid, hostname), first_due=first_due)
+
+def read_devices(csv_file_path=CSV_FILE_PATH):
+    """The devices to monitor from the inventory as {udid: hostname}."""
+    return {device.udid: device.host for device in get_inventory(csv_file_path).devices() if device.udid}
+
+def sync_devices(scheduler, devices):
+    """Schedule new or renamed devices and stop polling devices no longer listed."""
+    devices = {udid: hostname for udid, hostname in devices.items() if hostname not in unprovisioned_hosts}
+    added = [udid for udid, hostname in devices.items() if scheduled_devices.get(udid) != hostname]
+    removed = [udid for udid in scheduled_devices if udid not in devices]
+    for udid in removed:
+        scheduler.remove_device(udid)
+        logcat_captures.stop(udid, wait=False)  # Runs on the event loop; joining would stall every poll
+        preprocessor.forget(scheduled_devices[udid])
+        del scheduled_devices[udid]
+    for udid in added:
+        schedule_device(scheduler, udid, devices[udid])
+        scheduled_devices[udid] = devices[udid]
+    presence.watch(scheduled_devices)
+    return added, removed
+
+def apply_inventory_diff(scheduler, diff):
+    """Start, stop or reschedule polling for the devices an inventory reload changed."""
+    devices = dict(scheduled_devices)
+    for device in diff.removed:
+        devices.pop(device.udid, None)
+    for old, new in diff.changed:
+        devices.pop(old.udid, None)
+        if new.udid:
+            devices[new.udid] = new.host
+    for device in diff.added:
+        if device.udid:
+            devices[device.udid] = device.host
+    return sync_devices(scheduler, devices)
+
+async def watch_inventory(scheduler, interval=INVENTORY_CHECK_INTERVAL, on_reload=None):
+    """Reload the inventory periodically and apply its diffs to the scheduler.
+
+    `on_reload(diff)` is awaited after every reload; when it returns True the
+    whole device list is re-read instead of applying only the diff.
+    """
+    inventory = get_inventory(CSV_FILE_PATH)
     while True:
-        with open(CSV_FILE_PATH, newline='', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            threads = []
-            for row in reader:
-                if 'Host' in row and 'udid' in row:
-                    udid = row['udid'].strip()
-                    hostname = row['Host'].strip()
-                    if udid and hostname:
-                        thread = threading.Thread(target=process_device_logs, args=(udid, hostname))
-                        threads.append(thread)
-                        thread.start()
-
-            # Wait for all threads to complete
-            for thread in threads:
-                thread.join()
-
-        time.sleep(600)  # Wait for 10 minutes before the next iteration
+        await asyncio.sleep(interval)
+        try:
+            diff = inventory.reload()
+        except OSError as e:
+            logging.error(f"Inventory reload failed, keeping the current device list: {e}")
+            continue
+        if on_reload is not None and await on_reload(diff):
+            added, removed = sync_devices(scheduler, read_devices())
+        elif diff:
+            added, removed = apply_inventory_diff(scheduler, diff)
+        else:
+            continue
+        logging.info(f"Inventory change applied: {len(added)} devices scheduled, {len(removed)} stopped")
 
-if __name__ == "__main__":
-    # Start the main monitoring loop in a separate thread
-    main_thread = threading.Thread(target=main_loop)
-    main_thread.start()
+def main_loop():
+    """Main function to read devices from the inventory and poll every device/metric on its own interval."""
+    setup()
+    scheduler = PollScheduler()
+    sync_devices(scheduler, read_devices())
+    if MONITOR_HOST:
+        scheduler.add_job('*', 'self-stats', report_self_stats, SELF_STATS_INTERVAL)
+    scheduler.add_job('*', 'zabbix-flush', flush_zabbix, ZABBIX_FLUSH_INTERVAL)
+
+    async def run():
+        watcher = asyncio.create_task(watch_inventory(scheduler))
+        try:
+            await scheduler.run()
+        finally:
+            watcher.cancel()
+
+    try:
+        asyncio.run(run())
+    finally:
+        shutdown()
 
-    # Start the log collection loop in the main thread
-    log_collection_loop()
\ No newline at end of file
+if __name__ == "__main__":
+    # Metric polling and log collection share one scheduler
+    main_loop()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import parsers
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')  # Synthetic, hand-written samples; see fixtures/README.md
+EXPECTED_FILE = 'expected.json'
+REGRESSION_TOLERANCE = 0.2  # Allowed relative slowdown against a baseline report
+TEAMS = 'com.microsoft.skype.teams.ipphone'
+
+
+def summarize_net(interfaces):
+    primary = parsers.primary_interface(interfaces)
+    return {'interfaces': len(interfaces), 'primary': [primary.rx_bytes, primary.tx_bytes] if primary else []}
+
+
+def summarize_cpu(cpu_info):
+    return {'total': cpu_info.total, 'processes': len(cpu_info.processes)} if cpu_info else None
+
+
+def summarize_battery(battery):
+    return {'level': battery.level, 'health': battery.health, 'temperature': battery.temperature} if battery else None
+
+
+def summarize_meminfo(meminfo):
+    return {'pid': meminfo.pid, 'total': meminfo.total} if meminfo else None
+
+
+def summarize_processes(processes):
+    return {'processes': len(processes), TEAMS: processes.get(TEAMS)}
+
+
+# Fixture file -> (parser, summary compared against expected.json)
+SECTIONS = {
+    'net': (parsers.parse_net_dev, summarize_net),
+    'uptime': (parsers.parse_uptime, lambda uptime: uptime),
+    'cpu': (parsers.parse_cpuinfo, summarize_cpu),
+    'battery': (parsers.parse_battery, summarize_battery),
+    'meminfo_package': (parsers.parse_meminfo, summarize_meminfo),
+    'meminfo': (parsers.parse_pss_by_process, summarize_processes),
+}
+
+# Parses per device per minute at the default poll intervals: metrics every 10s with battery every
+# 6th cycle, memory every 60s
+PARSES_PER_MINUTE = {'net': 6, 'uptime': 6, 'cpu': 6, 'battery': 1, 'meminfo': 1}
+
+
+def load_corpus(folder=FIXTURES_FOLDER):
+    """{vendor: {section: text}} for every vendor folder of the fixture corpus."""
+    corpus = {}
+    for vendor in sorted(os.listdir(folder)):
+        vendor_folder = os.path.join(folder, vendor)
+        if not os.path.isdir(vendor_folder):
+            continue
+        corpus[vendor] = {}
+        for section in SECTIONS:
+            path = os.path.join(vendor_folder, f"{section}.txt")
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    corpus[vendor][section] = f.read()
+    return corpus
+
+
+def check_corpus(corpus, expected):
+    """Mismatches between the parsed fixtures and expected.json, so a faster parser cannot silently parse less."""
+    mismatches = []
+    for vendor, sections in corpus.items():
+        for section, text in sections.items():
+            parser, summarize = SECTIONS[section]
+            want = expected.get(vendor, {}).get(section)
+            got = summarize(parser(text))
+            if want is None:
+                mismatches.append(f"{vendor}/{section}: no expected values, parsed {got}")
+            elif got != want:
+                mismatches.append(f"{vendor}/{section}: expected {want}, parsed {got}")
+    return mismatches
+
+
+def measure(corpus, min_time=0.2):
+    """Microseconds per parse of every fixture."""
+    results = []
+    for vendor, sections in corpus.items():
+        for section, text in sections.items():
+            parser = SECTIONS[section][0]
+            timer = timeit.Timer(lambda: parser(text))
+            number, elapsed = timer.autorange()
+            while elapsed < min_time:
+                number *= 2
+                elapsed = timer.timeit(number)
+            results.append({'vendor': vendor, 'section': section, 'bytes': len(text),
+                            'usec': elapsed / number * 1e6})
+    return results
+
+
+def per_device_cost(results):
+    """Parse time per device per minute in microseconds, by vendor."""
+    costs = {}
+    for result in results:
+        count = PARSES_PER_MINUTE.get(result['section'], 0)
+        costs[result['vendor']] = costs.get(result['vendor'], 0.0) + count * result['usec']
+    return costs
+
+
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    previous = {(result['vendor'], result['section']): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['vendor'], result['section']))
+        if old is None or not old['usec']:
+            continue
+        change = (result['usec'] - old['usec']) / old['usec']
+        if change > tolerance:
+            regressions.append(f"{result['vendor']}/{result['section']}: {old['usec']:.1f} -> "
+                               f"{result['usec']:.1f} us ({change * 100:+.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the output parsers against the fixture corpus.")
+    parser.add_argument('--fixtures', default=FIXTURES_FOLDER)
+    parser.add_argument('--min-time', type=float, default=0.2, help="Seconds spent timing each fixture")
+    parser.add_argument('--json', help="Write the timings to this file")
+    parser.add_argument('--baseline', help="Earlier --json report to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.fixtures)
+    with open(os.path.join(args.fixtures, EXPECTED_FILE), 'r', encoding='utf-8') as f:
+        mismatches = check_corpus(corpus, json.load(f))
+    for mismatch in mismatches:
+        print(f"MISMATCH {mismatch}")
+    if mismatches:
+        return 1
+
+    results = measure(corpus, args.min_time)
+    print(f"{'vendor':<10} {'section':<16} {'bytes':>7} {'us/parse':>9}")
+    for result in results:
+        print(f"{result['vendor']:<10} {result['section']:<16} {result['bytes']:>7} {result['usec']:>9.1f}")
+    print()
+    for vendor, cost in per_device_cost(results).items():
+        print(f"{vendor:<10} {cost:>8.0f} us parsing per device per minute")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
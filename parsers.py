@@ -0,0 +1,222 @@
+import re
+
+# Interfaces whose traffic is reported, in order of preference
+PREFERRED_INTERFACES = ('eth0', 'wlan0')
+
+# /proc/net/dev: "  eth0: rx_bytes rx_packets errs drop fifo frame compressed multicast tx_bytes tx_packets ..."
+NET_DEV_LINE = re.compile(r'^\s*([^\s:]+):\s*(\d+)\s+(\d+)(?:\s+\d+){6}\s+(\d+)\s+(\d+)', re.M)
+
+# dumpsys cpuinfo: "  12.3% 1234/com.foo: 8.1% user + 4.2% kernel ..." and the closing "32% TOTAL: ..." line
+# Process names may contain ':' (com.foo:push), so the name match stops at the first ": <n>% user"
+CPU_LINE = re.compile(r'^\s*[+-]?(\d+(?:\.\d+)?)% (?:(\d+)/(.+?)|TOTAL): (\d+(?:\.\d+)?)% user'
+                      r' \+ (\d+(?:\.\d+)?)% kernel', re.M)
+
+# dumpsys meminfo <package>
+MEMINFO_HEADER = re.compile(r'^\*\* MEMINFO in pid (\d+) \[([^\]]+)\] \*\*', re.M)
+MEMINFO_ROW = re.compile(r'^\s*(\S.*?)\s+(\d+)\s+(\d+)\s+(\d+)')  # Category, Pss Total, Private Dirty, Private Clean
+MEMINFO_SUMMARY_ROW = re.compile(r'^\s*([A-Za-z][\w ]*?):\s+(\d+)')  # App Summary: name, Pss(KB)
+
+# System-wide dumpsys meminfo: "  182,334K: com.foo (pid 1234 / activities)", older releases print "182334 kB:"
+PSS_BY_PROCESS_HEADER = 'Total PSS by process:'
+PSS_LINE = re.compile(r'^\s*([\d,]+)\s*(?:K|kB):\s+(\S+)\s+\(pid\s+\d+')
+
+# dumpsys battery: two-space indented "key: value" lines under "Current Battery Service state:"
+BATTERY_LINE = re.compile(r'^  (\w[\w ]*?): (.*)$')
+
+UPTIME_LINE = re.compile(r'^\s*(\d+(?:\.\d+)?)(?:\s|$)')
+
+
+class InterfaceCounters:
+    """Byte and packet counters of one network interface."""
+
+    __slots__ = ('name', 'rx_bytes', 'rx_packets', 'tx_bytes', 'tx_packets')
+
+    def __init__(self, name, rx_bytes, rx_packets, tx_bytes, tx_packets):
+        self.name = name
+        self.rx_bytes = rx_bytes
+        self.rx_packets = rx_packets
+        self.tx_bytes = tx_bytes
+        self.tx_packets = tx_packets
+
+    def __repr__(self):
+        return f"InterfaceCounters({self.name!r}, rx_bytes={self.rx_bytes}, tx_bytes={self.tx_bytes})"
+
+
+class ProcessCpu:
+    """CPU share of one process over the cpuinfo window, in percent."""
+
+    __slots__ = ('pid', 'name', 'total', 'user', 'kernel')
+
+    def __init__(self, pid, name, total, user, kernel):
+        self.pid = pid
+        self.name = name
+        self.total = total
+        self.user = user
+        self.kernel = kernel
+
+    def __repr__(self):
+        return f"ProcessCpu({self.pid}, {self.name!r}, total={self.total})"
+
+
+class CpuInfo:
+    """Total and per-process CPU usage from `dumpsys cpuinfo`."""
+
+    __slots__ = ('total', 'user', 'kernel', 'processes')
+
+    def __init__(self, total, user, kernel, processes):
+        self.total = total
+        self.user = user
+        self.kernel = kernel
+        self.processes = processes  # Process name -> ProcessCpu
+
+    def __repr__(self):
+        return f"CpuInfo(total={self.total}, user={self.user}, kernel={self.kernel}, processes={len(self.processes)})"
+
+
+class Meminfo:
+    """Memory breakdown of one process from `dumpsys meminfo <package>`, all in KB of PSS."""
+
+    __slots__ = ('pid', 'process', 'total', 'categories', 'summary')
+
+    def __init__(self, pid, process, total, categories, summary):
+        self.pid = pid
+        self.process = process
+        self.total = total
+        self.categories = categories  # Table rows, e.g. 'Native Heap' -> PSS
+        self.summary = summary  # App Summary rows, e.g. 'Java Heap' -> PSS
+
+    def __repr__(self):
+        return f"Meminfo(pid={self.pid}, process={self.process!r}, total={self.total})"
+
+
+class BatteryInfo:
+    """Battery state from `dumpsys battery`."""
+
+    __slots__ = ('level', 'scale', 'health', 'status', 'temperature', 'voltage', 'present')
+
+    def __init__(self, level=None, scale=None, health=None, status=None, temperature=None, voltage=None,
+                 present=None):
+        self.level = level  # Percent of scale
+        self.scale = scale
+        self.health = health  # BatteryManager.BATTERY_HEALTH_* code
+        self.status = status  # BatteryManager.BATTERY_STATUS_* code
+        self.temperature = temperature  # Degrees Celsius
+        self.voltage = voltage  # Millivolts
+        self.present = present
+
+    def __repr__(self):
+        return (f"BatteryInfo(level={self.level}, health={self.health}, status={self.status}, "
+                f"temperature={self.temperature})")
+
+
+def parse_net_dev(output):
+    """Counters of every interface in /proc/net/dev, keyed by exact interface name."""
+    interfaces = {}
+    for match in NET_DEV_LINE.finditer(output):
+        name = match.group(1)
+        interfaces[name] = InterfaceCounters(name, int(match.group(2)), int(match.group(3)),
+                                             int(match.group(4)), int(match.group(5)))
+    return interfaces
+
+
+def primary_interface(interfaces, preferred=PREFERRED_INTERFACES):
+    """Counters of the first preferred interface that carried traffic, None if none did."""
+    for name in preferred:
+        counters = interfaces.get(name)
+        if counters is not None and (counters.rx_bytes or counters.tx_bytes):
+            return counters
+    return None
+
+
+def parse_cpuinfo(output):
+    """Per-process and total CPU usage; None without a TOTAL line."""
+    processes = {}
+    for match in CPU_LINE.finditer(output):
+        total, pid, name, user, kernel = match.groups()
+        if pid is None:
+            # The TOTAL line closes the report
+            return CpuInfo(float(total), float(user), float(kernel), processes)
+        processes[name] = ProcessCpu(int(pid), name, float(total), float(user), float(kernel))
+    return None
+
+
+def parse_meminfo(output):
+    """Breakdown of the first process in a per-package meminfo dump; None if no process was found."""
+    header = MEMINFO_HEADER.search(output)
+    if header is None:
+        return None
+    categories = {}
+    summary = {}
+    total = None
+    in_summary = False
+    for line in output[header.end():].splitlines():
+        if line.startswith('** MEMINFO'):
+            break  # Next process
+        if total is None:
+            match = MEMINFO_ROW.match(line)
+            if match is not None:
+                name = match.group(1)
+                if name == 'TOTAL':
+                    total = int(match.group(2))
+                else:
+                    categories[name] = int(match.group(2))
+        elif not in_summary:
+            in_summary = line.strip() == 'App Summary'
+        else:
+            match = MEMINFO_SUMMARY_ROW.match(line)
+            if match is not None:
+                summary[match.group(1)] = int(match.group(2))
+            elif line[:1] == ' ' and line[1:2].strip():
+                break  # Next one-space indented header (Objects) ends the App Summary
+    if total is None:
+        return None
+    return Meminfo(int(header.group(1)), header.group(2), total, categories, summary)
+
+
+def parse_pss_by_process(output):
+    """PSS in KB of every process from a system-wide `dumpsys meminfo`, {process: KB}."""
+    processes = {}
+    start = output.find(PSS_BY_PROCESS_HEADER)
+    if start < 0:
+        return processes
+    for line in output[start + len(PSS_BY_PROCESS_HEADER):].splitlines():
+        match = PSS_LINE.match(line)
+        if match is None:
+            if processes:
+                break  # End of the per-process block
+            continue
+        name = match.group(2)
+        processes[name] = processes.get(name, 0) + int(match.group(1).replace(',', ''))
+    return processes
+
+
+def parse_battery(output):
+    """Battery state from the service block; None if the block is missing."""
+    start = output.find('Current Battery Service state:')
+    if start < 0:
+        return None
+    values = {}
+    for line in output[start:].splitlines()[1:]:
+        match = BATTERY_LINE.match(line)
+        if match is None:
+            if line and not line.startswith(' '):
+                break  # Next section
+            continue
+        values[match.group(1)] = match.group(2).strip()
+
+    def number(key):
+        try:
+            return int(values[key])
+        except (KeyError, ValueError):
+            return None
+
+    temperature = number('temperature')  # Tenths of a degree
+    return BatteryInfo(level=number('level'), scale=number('scale'), health=number('health'),
+                       status=number('status'), temperature=temperature / 10 if temperature is not None else None,
+                       voltage=number('voltage'), present=values['present'] == 'true' if 'present' in values else None)
+
+
+def parse_uptime(output):
+    """Seconds since boot from /proc/uptime, None if unreadable."""
+    match = UPTIME_LINE.match(output)
+    return float(match.group(1)) if match else None
@@ -0,0 +1,169 @@
+import logging
+import threading
+
+GAUGE = 'gauge'  # Value is sent as is, subject to deadband/heartbeat
+COUNTER = 'counter'  # Cumulative counter, sent as a per-second rate
+UPTIME = 'uptime'  # Monotonic seconds since boot; a decrease means the device rebooted
+
+COUNTER_32_MAX = 2 ** 32
+COUNTER_64_MAX = 2 ** 64
+NETWORK_MAX_RATE = 1000 ** 3 / 8  # Bytes per second; room devices have at most a 1 Gbit/s link
+
+
+class ItemRule:
+    """How one item (or item key prefix) is preprocessed before it is sent to Zabbix."""
+
+    def __init__(self, kind=GAUGE, send_as=None, deadband=0.0, relative_deadband=0.0, heartbeat=0,
+                 skip_zero=False, max_rate=None):
+        self.kind = kind
+        self.send_as = send_as  # Key the processed value is sent under, defaults to the item key
+        self.deadband = deadband  # Absolute change needed before a new value is sent
+        self.relative_deadband = relative_deadband  # Change as a fraction of the last sent value
+        self.heartbeat = heartbeat  # Seconds after which the value is re-sent even if unchanged, 0 = always send
+        self.skip_zero = skip_zero  # Zero usually means "not collected" for this item
+        self.max_rate = max_rate  # Highest realistic rate; anything above it is a counter reset, not traffic
+
+
+# Every item the monitor sends; keys ending in '[' match all items with that prefix
+ITEMS = {
+    'device.uptime': ItemRule(UPTIME, heartbeat=600, skip_zero=True),
+    'network.rx.bytes': ItemRule(COUNTER, send_as='network.rx.rate', deadband=1024, relative_deadband=0.1,
+                                 heartbeat=300, skip_zero=True, max_rate=NETWORK_MAX_RATE),
+    'network.tx.bytes': ItemRule(COUNTER, send_as='network.tx.rate', deadband=1024, relative_deadband=0.1,
+                                 heartbeat=300, skip_zero=True, max_rate=NETWORK_MAX_RATE),
+    'cpu.usage': ItemRule(GAUGE, deadband=5.0, heartbeat=300, skip_zero=True),
+    'battery.health': ItemRule(GAUGE, heartbeat=3600, skip_zero=True),
+    'battery.level': ItemRule(GAUGE, deadband=1, heartbeat=3600),
+    'battery.temperature': ItemRule(GAUGE, deadband=1.0, heartbeat=3600),
+    'memory.usage[': ItemRule(GAUGE, relative_deadband=0.02, heartbeat=300, skip_zero=True),
+    'memory.leak[': ItemRule(GAUGE, deadband=1.0, heartbeat=300),
+    'memory.leak.ewma[': ItemRule(GAUGE, relative_deadband=0.02, heartbeat=300),
+    'memory.leak.eta[': ItemRule(GAUGE, relative_deadband=0.05, heartbeat=300),
+    'device.online.status': ItemRule(GAUGE, heartbeat=300),
+    'memory.discovery': ItemRule(GAUGE, heartbeat=3600),
+    'logcat.signature.discovery': ItemRule(GAUGE, heartbeat=3600),
+    'logcat.signature.count[': ItemRule(GAUGE, heartbeat=3600),  # Cumulative, unchanged while nothing matches
+}
+
+
+def find_rule(key, items=None):
+    """Rule for an item key: exact match first, then the longest matching '[' prefix."""
+    items = ITEMS if items is None else items
+    rule = items.get(key)
+    if rule is not None:
+        return rule
+    bracket = key.find('[')
+    if bracket != -1:
+        return items.get(key[:bracket + 1])
+    return None
+
+
+class _ItemState:
+    __slots__ = ('raw', 'raw_time', 'source', 'sent', 'sent_time')
+
+    def __init__(self):
+        self.raw = None  # Last raw counter value
+        self.raw_time = None
+        self.source = None  # What the counter was read from, e.g. the interface name
+        self.sent = None  # Last value sent to Zabbix
+        self.sent_time = None
+
+
+class Preprocessor:
+    """Turns raw samples into the values worth sending, per host and item key."""
+
+    def __init__(self, items=None):
+        self.items = ITEMS if items is None else items
+        self._state = {}  # (host, key) -> _ItemState
+        self._lock = threading.Lock()
+
+    def process(self, host, key, value, clock, source=None):
+        """Return (key, value) to send for this sample, or None if it should be suppressed.
+
+        `source` names what a counter was read from; when it changes the
+        baseline is dropped instead of diffing two unrelated counters.
+        """
+        rule = find_rule(key, self.items)
+        if rule is None:
+            return key, value
+        if rule.skip_zero and not value:
+            return None
+
+        with self._lock:
+            state = self._state.setdefault((host, key), _ItemState())
+            if rule.kind == UPTIME:
+                if state.raw is not None and value < state.raw:
+                    logging.info(f"Uptime of {host} went from {state.raw:.0f}s to {value:.0f}s, device rebooted")
+                    self._reset_counters(host)
+                state.raw = value
+            elif rule.kind == COUNTER:
+                if source != state.source:
+                    if state.raw is not None:
+                        logging.info(f"Counter {key} of {host} moved from {state.source} to {source}")
+                    state.raw = None
+                    state.raw_time = None
+                    state.source = source
+                value = self._rate(host, key, rule, state, value, clock)
+                if value is None:
+                    return None
+
+            if not self._should_send(rule, state, value, clock):
+                return None
+            state.sent = value
+            state.sent_time = clock
+        return rule.send_as or key, value
+
+    def _reset_counters(self, host):
+        """Forget counter baselines of a rebooted host so no bogus rate is computed."""
+        for (state_host, key), state in self._state.items():
+            rule = find_rule(key, self.items)
+            if state_host == host and rule is not None and rule.kind == COUNTER:
+                state.raw = None
+                state.raw_time = None
+
+    def _rate(self, host, key, rule, state, raw, clock):
+        previous, previous_time = state.raw, state.raw_time
+        state.raw, state.raw_time = raw, clock
+        if previous is None or clock <= previous_time:
+            return None  # First sample (or reset): only establishes the baseline
+
+        elapsed = clock - previous_time
+        delta = raw - previous
+        if delta < 0:
+            # Counter went backwards. It only wrapped if it was close enough to the top to get there
+            # at a realistic rate and restarted no further than that from zero; otherwise it was reset.
+            counter_max = COUNTER_32_MAX if previous < COUNTER_32_MAX else COUNTER_64_MAX
+            headroom = rule.max_rate * elapsed if rule.max_rate is not None else counter_max
+            if counter_max - previous > headroom or raw > headroom:
+                logging.info(f"Counter {key} of {host} reset from {previous} to {raw}")
+                return None
+            delta = raw + counter_max - previous
+        elif rule.max_rate is not None and delta / elapsed > rule.max_rate:
+            logging.info(f"Counter {key} of {host} jumped from {previous} to {raw}, ignoring the sample")
+            return None
+        return round(delta / elapsed, 3)
+
+    @staticmethod
+    def _should_send(rule, state, value, clock):
+        if state.sent is None:
+            return True
+        if not rule.heartbeat or clock - state.sent_time >= rule.heartbeat:
+            return True
+        if rule.kind == UPTIME:
+            return value < state.sent  # Uptime always grows; between heartbeats only a reboot is news
+        if not isinstance(value, (int, float)):
+            return value != state.sent  # Text values (LLD JSON) are only resent when they change
+        change = abs(value - state.sent)
+        if change == 0:
+            return False
+        if rule.deadband and change < rule.deadband:
+            return False
+        if rule.relative_deadband and state.sent and change < abs(state.sent) * rule.relative_deadband:
+            return False
+        return True
+
+    def forget(self, host):
+        """Drop all state of a host, e.g. when it leaves the inventory."""
+        with self._lock:
+            for state_key in [state_key for state_key in self._state if state_key[0] == host]:
+                del self._state[state_key]
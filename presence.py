@@ -0,0 +1,160 @@
+import logging
+import socket
+import threading
+import time
+
+from adb_client import AdbError, AdbRejected, get_client, read_device_list
+
+POLL_INTERVAL = 10  # Seconds between `adb devices` polls when track-devices is unavailable
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+OFFLINE_BACKOFF_MIN = 30  # Seconds an offline device is held back from polling at first
+OFFLINE_BACKOFF_MAX = 600  # Upper bound of the hold-back for a device that stays offline
+
+
+def serial_keys(serial):
+    """Names a serial is known by: the serial itself and, for ip:port serials, the bare IP."""
+    host, _, port = serial.rpartition(':')
+    return (serial, host) if host and port.isdigit() else (serial,)
+
+
+class PresenceTracker:
+    """In-memory online set fed by the adb server's host:track-devices stream.
+
+    Falls back to one `adb devices` poll every POLL_INTERVAL seconds when the
+    server refuses the stream. on_change(udid, online) is called from the
+    tracker thread for every watched device whose state flips.
+    """
+
+    def __init__(self, on_change=None, poll_interval=POLL_INTERVAL):
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.ready = False  # False until the first device list arrived, and while the stream is down
+        self.mode = None  # 'track' or 'poll'
+        self._online = set()  # Serials (and bare IPs) in 'device' state
+        self._watched = set()
+        self._last = {}  # udid -> last reported online state
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._sock = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='presence', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def watch(self, udids):
+        """Set the devices transitions are reported for."""
+        with self._lock:
+            self._watched = set(udids)
+            for udid in list(self._last):
+                if udid not in self._watched:
+                    del self._last[udid]
+
+    def is_online(self, udid):
+        with self._lock:
+            return udid in self._online
+
+    def online(self):
+        with self._lock:
+            return set(self._online)
+
+    def _run(self):
+        delay = RECONNECT_MIN_DELAY
+        while not self._stop.is_set():
+            try:
+                self._sock = get_client().track_devices()
+                self.mode = 'track'
+                logging.info("Tracking device presence through host:track-devices")
+                delay = RECONNECT_MIN_DELAY
+                while not self._stop.is_set():
+                    self._update(read_device_list(self._sock))
+            except AdbRejected as e:
+                # The server does not support tracking: poll instead
+                logging.info(f"host:track-devices unavailable ({e}), polling adb devices instead")
+                self._poll()
+                break
+            except (AdbError, OSError) as e:
+                if self._stop.is_set():
+                    break
+                logging.warning(f"Device presence stream lost: {e}, reconnecting in {delay:.0f}s")
+            finally:
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+            # Presence is unknown until the stream is back
+            self.ready = False
+            self._stop.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def _poll(self):
+        self.mode = 'poll'
+        while not self._stop.is_set():
+            try:
+                self._update(get_client().devices())
+            except AdbError as e:
+                self.ready = False
+                logging.warning(f"adb devices poll failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _update(self, devices):
+        online = set()
+        for serial, state in devices:
+            if state == 'device':
+                online.update(serial_keys(serial))
+        changes = []
+        with self._lock:
+            self._online = online
+            for udid in self._watched:
+                is_online = udid in online
+                was_online = self._last.get(udid)
+                self._last[udid] = is_online
+                if was_online is not None and was_online != is_online:
+                    changes.append((udid, is_online))
+        self.ready = True
+        for udid, is_online in changes:
+            logging.info(f"Device {udid} went {'online' if is_online else 'offline'}")
+            if self.on_change is not None:
+                try:
+                    self.on_change(udid, is_online)
+                except Exception as e:
+                    logging.error(f"Presence callback for {udid} failed: {e}")
+
+
+class OfflineBackoff:
+    """Holds offline devices back from polling with an exponentially growing delay."""
+
+    def __init__(self, min_delay=OFFLINE_BACKOFF_MIN, max_delay=OFFLINE_BACKOFF_MAX):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._until = {}  # udid -> (monotonic time polling resumes, current delay)
+        self._lock = threading.Lock()
+
+    def held_back(self, udid):
+        with self._lock:
+            entry = self._until.get(udid)
+        return entry is not None and time.monotonic() < entry[0]
+
+    def record_offline(self, udid):
+        """Extend the hold-back after another poll found the device offline; returns the delay."""
+        with self._lock:
+            _, delay = self._until.get(udid, (0.0, 0))
+            delay = min(delay * 2, self.max_delay) if delay else self.min_delay
+            self._until[udid] = (time.monotonic() + delay, delay)
+        return delay
+
+    def clear(self, udid):
+        with self._lock:
+            self._until.pop(udid, None)
@@ -0,0 +1,193 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics
+
+MAX_CONCURRENCY = 64  # Blocking jobs running at once across the whole fleet
+PER_SERVER_CONCURRENCY = 16  # Blocking jobs running at once against one adb server
+STATS_INTERVAL = 60  # Seconds between scheduler statistics log lines
+
+
+class PollJob:
+    """One (device, metric) pair polled at its own interval."""
+
+    def __init__(self, key, func, interval, adb_server, args=(), first_due=None):
+        self.key = key  # (udid, metric)
+        self.func = func
+        self.interval = interval
+        self.adb_server = adb_server
+        self.args = args
+        self.next_due = first_due if first_due is not None else time.monotonic()
+        self.running = False
+        self.cancelled = False
+        self.runs = 0
+        self.missed = 0
+
+
+class SchedulerStats:
+    """Lag and deadline counters, reset after each statistics log line."""
+
+    def __init__(self):
+        self.runs = 0
+        self.missed = 0
+        self.failures = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    def record_start(self, lag):
+        self.runs += 1
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+
+    def summary(self):
+        mean_lag = self.lag_total / self.runs if self.runs else 0.0
+        return (f"runs={self.runs} missed={self.missed} failures={self.failures} "
+                f"lag_mean={mean_lag:.3f}s lag_max={self.lag_max:.3f}s")
+
+
+class PollScheduler:
+    """Event-loop scheduler running blocking poll jobs with bounded concurrency.
+
+    Every job has its own interval and deadline. Jobs are executed in worker
+    threads so the existing blocking adb and Zabbix code can be reused, while
+    a global and a per-adb-server semaphore keep the load bounded.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, per_server_concurrency=PER_SERVER_CONCURRENCY,
+                 stats_interval=STATS_INTERVAL):
+        self.max_concurrency = max_concurrency
+        self.per_server_concurrency = per_server_concurrency
+        self.stats_interval = stats_interval
+        self.jobs = {}
+        self.stats = SchedulerStats()
+        self._heap = []
+        self._counter = itertools.count()
+        self._server_limits = {}
+        self._global_limit = None
+        self._executor = None
+        self._wakeup = None
+        self._tasks = set()
+        self._stopping = False
+
+    def add_job(self, udid, metric, func, interval, adb_server='default', args=(), first_due=None):
+        """Register (or replace) the job polling `metric` on device `udid`."""
+        key = (udid, metric)
+        if key in self.jobs:
+            self.jobs[key].cancelled = True
+        job = PollJob(key, func, interval, adb_server, args, first_due)
+        self.jobs[key] = job
+        self._push(job)
+        return job
+
+    def remove_device(self, udid):
+        """Stop polling every metric of a device."""
+        for key in [key for key in self.jobs if key[0] == udid]:
+            self.jobs.pop(key).cancelled = True
+
+    def devices(self):
+        return {key[0] for key in self.jobs}
+
+    def stop(self):
+        """Ask the run loop to finish; running jobs are awaited."""
+        self._stopping = True
+        self._notify()
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.next_due, next(self._counter), job))
+        self._notify()
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _server_limit(self, adb_server):
+        if adb_server not in self._server_limits:
+            self._server_limits[adb_server] = asyncio.Semaphore(self.per_server_concurrency)
+        return self._server_limits[adb_server]
+
+    async def _execute(self, job, due):
+        try:
+            async with self._server_limit(job.adb_server), self._global_limit:  # A job queued on a busy server must not hold a global slot
+                started = time.monotonic()
+                lag = started - due
+                self.stats.record_start(lag)
+                metrics.observe('scheduler.lag', lag)
+                if lag > job.interval:
+                    job.missed += 1
+                    self.stats.missed += 1
+                    metrics.increment('scheduler.missed')
+                    logging.warning(f"Job {job.key} started {lag:.1f}s late (interval {job.interval}s)")
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(self._executor, functools.partial(job.func, *job.args))
+                finally:
+                    udid, metric = job.key
+                    metrics.observe(f"cycle.{metric}", time.monotonic() - started, udid)
+                job.runs += 1
+        except Exception as e:
+            self.stats.failures += 1
+            metrics.increment('scheduler.failures', job.key[0])
+            logging.error(f"Job {job.key} failed: {e}")
+        finally:
+            job.running = False
+
+    def _dispatch(self, job):
+        due = job.next_due
+        now = time.monotonic()
+        # Next deadline keeps the original phase, skipping any slots already missed
+        job.next_due = due + job.interval
+        if job.next_due <= now:
+            skipped = int((now - job.next_due) // job.interval) + 1
+            job.next_due += skipped * job.interval
+        if job.running:
+            job.missed += 1
+            self.stats.missed += 1
+            metrics.increment('scheduler.missed')
+            logging.warning(f"Job {job.key} still running at its next deadline, skipping this run")
+        else:
+            job.running = True
+            task = asyncio.create_task(self._execute(job, due))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._push(job)
+
+    async def run(self):
+        """Run jobs until stop() is called."""
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='poll')
+        self._wakeup = asyncio.Event()
+        metrics.register_gauge('scheduler.jobs', lambda: len(self.jobs))
+        metrics.register_gauge('scheduler.running', lambda: len(self._tasks))
+        next_stats = time.monotonic() + self.stats_interval
+        while not self._stopping:
+            now = time.monotonic()
+            if now >= next_stats:
+                logging.info(f"Scheduler stats ({len(self.jobs)} jobs, {len(self._tasks)} running): "
+                             f"{self.stats.summary()}")
+                self.stats = SchedulerStats()
+                next_stats = now + self.stats_interval
+
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            if self._heap and self._heap[0][0] <= now:
+                _, _, job = heapq.heappop(self._heap)
+                self._dispatch(job)
+                continue
+
+            timeout = next_stats - now
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,153 @@
+import bisect
+import glob
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+
+LEASE_FOLDER = os.path.join('data', 'leases')  # Shared by every worker; put it on a shared mount for several hosts
+LEASE_TTL = 30  # Seconds a lease stays valid without renewal
+HEARTBEAT_INTERVAL = 10  # Seconds between lease renewals and shard recomputations
+UNPROVISIONED_FILE = 'unprovisioned.json'  # Hosts the coordinator found missing in Zabbix, read by the workers
+VIRTUAL_NODES = 128  # Ring positions per worker; more positions give a more even split
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping device keys to workers.
+
+    Adding or removing a worker only moves the keys that hash next to its
+    virtual nodes, so about 1/N of the fleet changes owner.
+    """
+
+    def __init__(self, workers=(), vnodes=VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.workers = sorted(workers)
+        points = sorted((ring_hash(f"{worker}#{index}"), worker) for worker in self.workers for index in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    def owner(self, key):
+        """Worker owning the key, or None on an empty ring."""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class Lease:
+    """A worker's claim to be alive, renewed every heartbeat."""
+
+    def __init__(self, worker_id, expires, adb_port=None, host='', pid=0):
+        self.worker_id = worker_id
+        self.expires = expires
+        self.adb_port = adb_port
+        self.host = host
+        self.pid = pid
+
+    def to_dict(self):
+        return {'worker_id': self.worker_id, 'expires': self.expires, 'adb_port': self.adb_port,
+                'host': self.host, 'pid': self.pid}
+
+    def __repr__(self):
+        return f"Lease(worker_id={self.worker_id!r}, host={self.host!r}, adb_port={self.adb_port})"
+
+
+class LeaseDirectory:
+    """Worker membership kept as one lease file per worker in a shared folder."""
+
+    def __init__(self, folder=LEASE_FOLDER, ttl=LEASE_TTL):
+        self.folder = folder
+        self.ttl = ttl
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, worker_id):
+        return os.path.join(self.folder, f"{worker_id}.lease")
+
+    def renew(self, worker_id, adb_port=None):
+        """Write (or extend) the worker's lease atomically."""
+        lease = Lease(worker_id, time.time() + self.ttl, adb_port, socket.gethostname(), os.getpid())
+        path = self._path(worker_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(lease.to_dict(), f)
+        os.replace(tmp_path, path)
+        return lease
+
+    def release(self, worker_id):
+        """Give up the lease so the other workers take over right away."""
+        try:
+            os.remove(self._path(worker_id))
+        except FileNotFoundError:
+            pass
+
+    def live(self):
+        """Unexpired leases as {worker_id: Lease}."""
+        now = time.time()
+        leases = {}
+        for path in glob.glob(os.path.join(self.folder, '*.lease')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lease = Lease(**json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                logging.debug(f"Ignoring unreadable lease {path}: {e}")
+                continue
+            if lease.expires > now:
+                leases[lease.worker_id] = lease
+        return leases
+
+    def publish_unprovisioned(self, hosts):
+        """Share the hosts that are missing in Zabbix with every worker."""
+        path = os.path.join(self.folder, UNPROVISIONED_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sorted(hosts), f)
+        os.replace(tmp_path, path)
+
+    def unprovisioned(self):
+        """Hosts the coordinator found missing in Zabbix, None if it has not provisioned yet."""
+        try:
+            with open(os.path.join(self.folder, UNPROVISIONED_FILE), 'r', encoding='utf-8') as f:
+                return set(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable unprovisioned host list in {self.folder}: {e}")
+            return None
+
+
+class ShardMember:
+    """This worker's view of the ring: which devices it owns right now.
+
+    Ownership is recomputed on every heartbeat from the live leases, so a
+    joining worker takes its share within one heartbeat and the share of a
+    dead worker is picked up once its lease expires.
+    """
+
+    def __init__(self, worker_id, leases, adb_port=None, vnodes=VIRTUAL_NODES):
+        self.worker_id = worker_id
+        self.leases = leases
+        self.adb_port = adb_port
+        self.vnodes = vnodes
+        self.ring = HashRing([worker_id], vnodes)
+
+    def heartbeat(self):
+        """Renew the lease and rebuild the ring; returns True if membership changed."""
+        self.leases.renew(self.worker_id, self.adb_port)
+        workers = set(self.leases.live()) | {self.worker_id}
+        if workers == set(self.ring.workers):
+            return False
+        logging.info(f"Worker {self.worker_id}: membership changed from {self.ring.workers} to {sorted(workers)}")
+        self.ring = HashRing(workers, self.vnodes)
+        return True
+
+    def owns(self, key):
+        return self.ring.owner(key) == self.worker_id
+
+    def leave(self):
+        self.leases.release(self.worker_id)
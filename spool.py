@@ -0,0 +1,236 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+SEGMENT_BYTES = 8 * 1024 * 1024  # A new segment file is started once the active one reaches this size
+MAX_SPOOL_BYTES = 512 * 1024 * 1024  # Oldest segments are evicted beyond this total size
+FSYNC_INTERVAL = 1.0  # Seconds between fsyncs of the active segment
+SEGMENT_PATTERN = 'segment-*.jsonl'
+
+
+def segment_name(seq):
+    return f"segment-{seq:012d}.jsonl"
+
+
+def segment_seq(path):
+    return int(os.path.basename(path)[len('segment-'):-len('.jsonl')])
+
+
+class SpoolStats:
+    """Backlog of values waiting in the spool."""
+
+    def __init__(self, depth, oldest_clock, size, segments, evicted):
+        self.depth = depth  # Values not yet replayed
+        self.oldest_clock = oldest_clock  # Collection time of the oldest waiting value, None if empty
+        self.size = size  # Bytes on disk
+        self.segments = segments
+        self.evicted = evicted  # Values dropped by the size limit since start-up
+
+    @property
+    def age(self):
+        """Seconds since the oldest waiting value was collected, 0 if the spool is empty."""
+        return max(time.time() - self.oldest_clock, 0.0) if self.oldest_clock is not None else 0.0
+
+    def __repr__(self):
+        return (f"SpoolStats(depth={self.depth}, age={self.age:.0f}s, size={self.size}, "
+                f"segments={self.segments}, evicted={self.evicted})")
+
+
+class Spool:
+    """Append-only segmented write-ahead log of sender items that could not be delivered.
+
+    Items are appended as JSON lines to the newest segment with buffered writes
+    and an fsync at most every FSYNC_INTERVAL seconds. Replay reads from a cursor
+    (segment, byte offset) that is persisted after every committed batch, and a
+    segment is deleted once it has been replayed completely. When the spool
+    outgrows max_bytes the oldest segments are evicted, replayed or not.
+    """
+
+    def __init__(self, folder, segment_bytes=SEGMENT_BYTES, max_bytes=MAX_SPOOL_BYTES,
+                 fsync_interval=FSYNC_INTERVAL):
+        self.folder = folder
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.cursor_path = os.path.join(folder, 'spool.cursor')
+        self.evicted = 0
+        self._segments = {}  # seq -> [size in bytes, number of items]
+        self._cursor_seq = None
+        self._cursor_offset = 0
+        self._cursor_items = 0  # Items of the cursor segment before the cursor offset
+        self._writer = None
+        self._writer_seq = None
+        self._last_fsync = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index existing segments and restore the replay cursor."""
+        for path in sorted(glob.glob(os.path.join(self.folder, SEGMENT_PATTERN))):
+            with open(path, 'rb') as f:
+                data = f.read()
+            self._segments[segment_seq(path)] = [len(data), data.count(b'\n')]
+        try:
+            with open(self.cursor_path, 'r', encoding='utf-8') as f:
+                cursor = json.load(f)
+            seq, offset = cursor['segment'], cursor['offset']
+        except (OSError, ValueError, KeyError):
+            seq, offset = None, 0
+        if seq in self._segments:
+            with open(self._path(seq), 'rb') as f:
+                self._cursor_items = f.read(offset).count(b'\n')
+            self._cursor_seq, self._cursor_offset = seq, offset
+        elif self._segments:
+            self._cursor_seq = min(self._segments)
+        if self._segments:
+            stats = self._stats()
+            logging.info(f"Spool {self.folder} holds {stats.depth} values in {stats.segments} segments")
+
+    def _path(self, seq):
+        return os.path.join(self.folder, segment_name(seq))
+
+    def append(self, items):
+        """Write items (sender item dicts) to the active segment."""
+        if not items:
+            return
+        data = ''.join(json.dumps(item, separators=(',', ':')) + '\n' for item in items).encode('utf-8')
+        with self._lock:
+            if self._writer is None or self._segments[self._writer_seq][0] >= self.segment_bytes:
+                self._rotate()
+            self._writer.write(data)
+            segment = self._segments[self._writer_seq]
+            segment[0] += len(data)
+            segment[1] += len(items)
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                self._sync()
+                self._last_fsync = now
+            self._evict()
+
+    def _rotate(self):
+        """Close the active segment and start a new one (lock held)."""
+        if self._writer is not None:
+            self._sync()
+            self._writer.close()
+        seq = max(self._segments) + 1 if self._segments else 0
+        self._writer = open(self._path(seq), 'ab')
+        self._writer_seq = seq
+        self._segments[seq] = [0, 0]
+        if self._cursor_seq is None:
+            self._cursor_seq, self._cursor_offset, self._cursor_items = seq, 0, 0
+
+    def _sync(self):
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+
+    def _evict(self):
+        """Drop the oldest segments while the spool is over its size limit (lock held)."""
+        while sum(size for size, _ in self._segments.values()) > self.max_bytes and len(self._segments) > 1:
+            seq = min(self._segments)
+            if seq == self._writer_seq:
+                break
+            dropped = self._segments[seq][1] - (self._cursor_items if seq == self._cursor_seq else 0)
+            self.evicted += dropped
+            logging.warning(f"Spool over {self.max_bytes} bytes, evicting {dropped} values in {segment_name(seq)}")
+            self._remove_segment(seq)
+
+    def _remove_segment(self, seq):
+        """Delete a segment and move the cursor past it if needed (lock held)."""
+        del self._segments[seq]
+        try:
+            os.remove(self._path(seq))
+        except OSError as e:
+            logging.error(f"Failed to remove spool segment {segment_name(seq)}: {e}")
+        if seq == self._cursor_seq:
+            self._cursor_seq = min(self._segments) if self._segments else None
+            self._cursor_offset = 0
+            self._cursor_items = 0
+
+    def read_batch(self, max_items):
+        """Return (items, position) of the oldest unreplayed values; pass position to commit()."""
+        with self._lock:
+            if self._cursor_seq is None:
+                return [], None
+            seq, offset = self._cursor_seq, self._cursor_offset
+            if seq == self._writer_seq:
+                self._writer.flush()  # Make buffered appends visible to the reader
+            items = []
+            with open(self._path(seq), 'rb') as f:
+                f.seek(offset)
+                while len(items) < max_items:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        if line and seq != self._writer_seq:
+                            # Line cut short by a crash, nothing will ever complete it
+                            logging.warning(f"Skipping truncated line in spool segment {segment_name(seq)}")
+                            offset += len(line)
+                        break
+                    offset += len(line)
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        logging.warning(f"Skipping corrupt line in spool segment {segment_name(seq)}")
+            return items, (seq, offset, len(items))
+
+    def commit(self, position):
+        """Mark everything up to a read_batch() position as delivered."""
+        if position is None:
+            return
+        seq, offset, count = position
+        with self._lock:
+            if seq != self._cursor_seq:
+                return  # Segment was evicted while the batch was being sent
+            self._cursor_offset = offset
+            self._cursor_items += count
+            # A fully replayed segment is deleted unless it is still being written
+            if seq != self._writer_seq and offset >= self._segments[seq][0]:
+                self._remove_segment(seq)
+            elif seq == self._writer_seq and offset >= self._segments[seq][0]:
+                # Everything has been replayed: start over in a fresh segment
+                self._writer.close()
+                self._writer = None
+                self._writer_seq = None
+                self._remove_segment(seq)
+            self._save_cursor()
+
+    def _save_cursor(self):
+        tmp_path = f"{self.cursor_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'segment': self._cursor_seq, 'offset': self._cursor_offset}, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    def _stats(self):
+        depth = sum(count for _, count in self._segments.values()) - self._cursor_items
+        oldest_clock = None
+        if depth and self._cursor_seq is not None:
+            if self._cursor_seq == self._writer_seq:
+                self._writer.flush()
+            with open(self._path(self._cursor_seq), 'rb') as f:
+                f.seek(self._cursor_offset)
+                try:
+                    oldest_clock = json.loads(f.readline())['clock']
+                except (ValueError, KeyError):
+                    pass
+        return SpoolStats(depth, oldest_clock, sum(size for size, _ in self._segments.values()),
+                          len(self._segments), self.evicted)
+
+    def stats(self):
+        with self._lock:
+            return self._stats()
+
+    def __len__(self):
+        with self._lock:
+            return sum(count for _, count in self._segments.values()) - self._cursor_items
+
+    def close(self):
+        """Flush and fsync the active segment."""
+        with self._lock:
+            if self._writer is not None:
+                self._sync()
+                self._writer.close()
+                self._writer = None
+                self._writer_seq = None
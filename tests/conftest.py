@@ -0,0 +1,46 @@
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class LoopbackServer:
+    """TCP server on an ephemeral 127.0.0.1 port that hands each accepted connection to `handle(server, sock)`."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []  # Filled in by the handler, in arrival order
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            with sock:
+                self.handle(self, sock)
+
+    def close(self):
+        self._server.close()
+
+
+@pytest.fixture
+def loopback_server():
+    """Factory fixture: `loopback_server(handle)` starts a LoopbackServer that is closed after the test."""
+    servers = []
+
+    def start(handle):
+        servers.append(LoopbackServer(handle))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
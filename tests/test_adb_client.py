@@ -0,0 +1,80 @@
+import pytest
+
+from adb_client import AdbClient, AdbError, AdbRejected, read_device_list
+
+
+def message(text):
+    data = text.encode('utf-8')
+    return f"{len(data):04x}".encode('ascii') + data
+
+
+@pytest.fixture
+def adb_server(loopback_server):
+    """Start a fake adb server; `script(request)` returns (reply bytes, close) for each framed request."""
+    def start(script):
+        def handle(server, sock):
+            while True:
+                header = sock.recv(4)
+                if len(header) < 4:
+                    return
+                request = sock.recv(int(header, 16)).decode('utf-8')
+                server.requests.append(request)
+                reply, close = script(request)
+                sock.sendall(reply)
+                if close:
+                    return
+
+        return loopback_server(handle)
+
+    return start
+
+
+def test_host_request_reads_okay_and_length_prefixed_reply(adb_server):
+    server = adb_server(lambda request: (b'OKAY' + message('emulator-5554\tdevice\n10.0.0.2:5555\toffline\n'), True))
+    client = AdbClient('127.0.0.1', server.port, timeout=5)
+    assert client.devices() == [('emulator-5554', 'device'), ('10.0.0.2:5555', 'offline')]
+    assert server.requests == ['host:devices']
+
+
+def test_fail_reply_raises_rejected_with_message(adb_server):
+    server = adb_server(lambda request: (b'FAIL' + message('unknown host service'), True))
+    client = AdbClient('127.0.0.1', server.port, timeout=5)
+    with pytest.raises(AdbRejected, match="unknown host service"):
+        client.host_request('host:bogus')
+
+
+def test_unexpected_status_raises(adb_server):
+    server = adb_server(lambda request: (b'WHAT', True))
+    with pytest.raises(AdbError, match="Unexpected adb status"):
+        AdbClient('127.0.0.1', server.port, timeout=5).host_request('host:version')
+
+
+def test_shell_switches_transport_then_streams_output(adb_server):
+    def script(request):
+        if request.startswith('host:transport:'):
+            return b'OKAY', False
+        return b'OKAY' + b'line one\nline two\n', True
+
+    server = adb_server(script)
+    output = AdbClient('127.0.0.1', server.port, timeout=5).shell('10.0.0.2:5555', 'cat /proc/uptime')
+    assert output == 'line one\nline two\n'
+    assert server.requests == ['host:transport:10.0.0.2:5555', 'shell:cat /proc/uptime']
+
+
+def test_shell_on_unknown_device_raises_rejected(adb_server):
+    server = adb_server(lambda request: (b'FAIL' + message("device '10.0.0.9:5555' not found"), True))
+    with pytest.raises(AdbRejected, match="not found"):
+        AdbClient('127.0.0.1', server.port, timeout=5).shell('10.0.0.9:5555', 'true')
+    assert server.requests == ['host:transport:10.0.0.9:5555']
+
+
+def test_track_devices_reads_successive_lists(adb_server):
+    def script(request):
+        return b'OKAY' + message('a\tdevice\n') + message('a\toffline\nb\tdevice\n'), False
+
+    server = adb_server(script)
+    sock = AdbClient('127.0.0.1', server.port, timeout=5).track_devices()
+    with sock:
+        assert read_device_list(sock) == [('a', 'device')]
+        assert read_device_list(sock) == [('a', 'offline'), ('b', 'device')]
+    assert server.requests == ['host:track-devices']
@@ -0,0 +1,107 @@
+import json
+import socket
+import struct
+
+import pytest
+
+from zabbix_sender import (ZBX_HEADER, ZabbixSender, ZabbixSenderError, pack_packet, parse_response, read_packet)
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def success_reply(processed, failed):
+    return pack_packet({'response': 'success',
+                        'info': f"processed: {processed}; failed: {failed}; total: {processed + failed}; "
+                                f"seconds spent: 0.000123"})
+
+
+@pytest.fixture
+def trapper(loopback_server):
+    """Start a fake Zabbix trapper that records each raw request packet and answers it with `reply`."""
+    def start(reply):
+        def handle(server, sock):
+            header = _recv_exact(sock, 13)
+            (length,) = struct.unpack('<Q', header[5:])
+            server.requests.append(header + _recv_exact(sock, length))
+            sock.sendall(reply)
+
+        return loopback_server(handle)
+
+    return start
+
+
+def test_pack_packet_frames_json_with_little_endian_length():
+    packet = pack_packet({'request': 'sender data', 'data': []})
+    body = b'{"request":"sender data","data":[]}'
+    assert packet[:5] == ZBX_HEADER
+    assert packet[5:13] == struct.pack('<Q', len(body))
+    assert packet[13:] == body
+
+
+def test_parse_response_reads_processed_and_failed():
+    result = parse_response({'response': 'success',
+                             'info': 'processed: 3; failed: 1; total: 4; seconds spent: 0.000055'})
+    assert (result.processed, result.failed, result.total) == (3, 1, 4)
+    assert result.seconds_spent == pytest.approx(0.000055)
+    assert not result.ok
+
+
+def test_parse_response_without_counts_keeps_the_info():
+    result = parse_response({'response': 'failed', 'info': 'unsupported'})
+    assert (result.processed, result.failed, result.response, result.info) == (0, 0, 'failed', 'unsupported')
+
+
+def test_send_frames_request_and_parses_reply(trapper):
+    server = trapper(success_reply(2, 0))
+    sender = ZabbixSender('127.0.0.1', server.port, timeout=5)
+    sender.add('room-1', 'cpu.usage', 12.5, clock=1700000000.25)
+    sender.add('room-1', 'battery.level', 80, clock=1700000000)
+    result = sender.flush()
+
+    assert result.ok and result.processed == 2
+    [packet] = server.requests
+    (length,) = struct.unpack('<Q', packet[5:13])
+    assert packet[:5] == ZBX_HEADER and length == len(packet) - 13
+    request = json.loads(packet[13:])
+    assert request['request'] == 'sender data'
+    assert request['data'][0] == {'host': 'room-1', 'key': 'cpu.usage', 'value': '12.5',
+                                  'clock': 1700000000, 'ns': 250000000}
+    assert request['data'][1]['value'] == '80'
+
+
+def test_send_reports_rejected_items(trapper):
+    server = trapper(success_reply(1, 1))
+    result = ZabbixSender('127.0.0.1', server.port, timeout=5).send([{'host': 'h', 'key': 'k', 'value': '1'}] * 2)
+    assert (result.processed, result.failed, result.total) == (1, 1, 2)
+    assert not result.ok
+
+
+def test_send_raises_on_failed_response(trapper):
+    server = trapper(pack_packet({'response': 'failed', 'info': 'no such host'}))
+    with pytest.raises(ZabbixSenderError, match="no such host"):
+        ZabbixSender('127.0.0.1', server.port, timeout=5).send([{'host': 'h', 'key': 'k', 'value': '1'}])
+
+
+def test_read_packet_rejects_bad_header():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(b'HTTP/1.1 400 ')
+        with pytest.raises(ZabbixSenderError, match="Invalid response header"):
+            read_packet(right)
+
+
+def test_read_packet_rejects_truncated_body():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(ZBX_HEADER + struct.pack('<Q', 100) + b'{"response"')
+        left.shutdown(socket.SHUT_WR)
+        with pytest.raises(ZabbixSenderError, match="still expected"):
+            read_packet(right)
@@ -0,0 +1,247 @@
+import json
+import logging
+import re
+import socket
+import struct
+import threading
+import time
+
+from instrumentation import metrics
+
+# Zabbix sender/trapper protocol constants
+ZABBIX_PORT = 10051
+ZBX_HEADER = b'ZBXD\x01'  # Protocol signature + flags (0x01 = Zabbix protocol)
+ZBX_HEADER_LEN = len(ZBX_HEADER) + 8  # Signature + 8 byte little-endian data length
+
+# Flush thresholds for the in-process buffer
+FLUSH_MAX_ITEMS = 250  # Zabbix server accepts at most 250 values per request by default
+FLUSH_MAX_AGE = 5.0  # Seconds an item may sit in the buffer before a flush is forced
+
+# Spool replay once the server is reachable again
+REPLAY_BATCHES = 20  # Requests replayed per flush, oldest values first
+RETRY_INTERVAL = 30.0  # Seconds after a failed request during which new values go straight to the spool
+
+RESPONSE_INFO_PATTERN = re.compile(
+    r'processed:\s*(\d+);\s*failed:\s*(\d+);\s*total:\s*(\d+);\s*seconds spent:\s*([\d.]+)'
+)
+
+
+class ZabbixSenderError(Exception):
+    """Raised when the Zabbix server cannot be reached or answers with garbage."""
+
+
+class SenderResult:
+    """Outcome of one sender request as reported by the Zabbix server."""
+
+    def __init__(self, processed=0, failed=0, total=0, seconds_spent=0.0, response='', info='', spooled=0):
+        self.processed = processed
+        self.failed = failed
+        self.total = total
+        self.seconds_spent = seconds_spent
+        self.response = response
+        self.info = info
+        self.spooled = spooled  # Values written to the spool for a later retry instead of being sent
+
+    @property
+    def ok(self):
+        return self.response == 'success' and self.failed == 0
+
+    def __add__(self, other):
+        return SenderResult(
+            self.processed + other.processed,
+            self.failed + other.failed,
+            self.total + other.total,
+            self.seconds_spent + other.seconds_spent,
+            other.response or self.response,
+            other.info or self.info,
+            self.spooled + other.spooled,
+        )
+
+    def __repr__(self):
+        return (f"SenderResult(processed={self.processed}, failed={self.failed}, "
+                f"total={self.total}, seconds_spent={self.seconds_spent}, spooled={self.spooled})")
+
+
+def pack_packet(payload):
+    """Wrap a JSON-serialisable payload in a ZBXD header."""
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return ZBX_HEADER + struct.pack('<Q', len(data)) + data
+
+
+def _recv_exact(sock, size):
+    """Read exactly `size` bytes from the socket."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            raise ZabbixSenderError(f"Connection closed with {remaining} bytes still expected")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_packet(sock):
+    """Read one ZBXD framed packet from the socket and decode its JSON body."""
+    header = _recv_exact(sock, ZBX_HEADER_LEN)
+    if not header.startswith(b'ZBXD'):
+        raise ZabbixSenderError(f"Invalid response header: {header!r}")
+    (length,) = struct.unpack('<Q', header[5:13])
+    body = _recv_exact(sock, length)
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError as e:
+        raise ZabbixSenderError(f"Invalid response body: {body[:200]!r}") from e
+
+
+def parse_response(response):
+    """Turn the server's `info` string into a SenderResult."""
+    info = response.get('info', '')
+    match = RESPONSE_INFO_PATTERN.search(info)
+    if not match:
+        return SenderResult(response=response.get('response', ''), info=info)
+    return SenderResult(
+        processed=int(match.group(1)),
+        failed=int(match.group(2)),
+        total=int(match.group(3)),
+        seconds_spent=float(match.group(4)),
+        response=response.get('response', ''),
+        info=info,
+    )
+
+
+class ZabbixSender:
+    """Buffers item values and sends them to a Zabbix trapper in batched requests.
+
+    With a spool, batches that cannot be delivered are written to disk with
+    their original clock and replayed, oldest first, once the server answers again.
+    """
+
+    def __init__(self, server, port=ZABBIX_PORT, timeout=10.0,
+                 max_items=FLUSH_MAX_ITEMS, max_age=FLUSH_MAX_AGE, spool=None):
+        self.server = server
+        self.port = port
+        self.timeout = timeout
+        self.max_items = max_items
+        self.max_age = max_age
+        self.spool = spool
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._retry_after = 0.0  # Monotonic time before which the server is assumed to be down
+
+    def add(self, host, key, value, clock=None):
+        """Queue one value; flushes automatically once a size or age threshold is hit."""
+        now = time.time()
+        if clock is None:
+            clock = now
+        item = {
+            'host': host,
+            'key': key,
+            'value': str(value),
+            'clock': int(clock),
+            'ns': int((clock % 1) * 1e9),
+        }
+        with self._lock:
+            self._buffer.append(item)
+            if self._oldest is None:
+                self._oldest = now
+            due = len(self._buffer) >= self.max_items or now - self._oldest >= self.max_age
+        if due:
+            return self.flush()
+        return None
+
+    def pending(self):
+        """Number of values waiting in the buffer."""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """Send every buffered value; returns the combined SenderResult."""
+        with self._lock:
+            items, self._buffer = self._buffer, []
+            self._oldest = None
+        if not items:
+            result = SenderResult(response='success')
+            return result + self.replay() if self.spool is not None else result
+
+        result = SenderResult()
+        for start in range(0, len(items), self.max_items):
+            batch = items[start:start + self.max_items]
+            if self.spool is not None and time.monotonic() < self._retry_after:
+                # Server failed recently: do not wait for another timeout per batch
+                self.spool.append(batch)
+                result = result + SenderResult(total=len(batch), response='spooled', spooled=len(batch))
+                continue
+            try:
+                batch_result = self.send(batch)
+            except ZabbixSenderError as e:
+                logging.error(str(e))
+                if self.spool is None:
+                    result = result + SenderResult(failed=len(batch), total=len(batch), response='failed', info=str(e))
+                    continue
+                self._retry_after = time.monotonic() + RETRY_INTERVAL
+                self.spool.append(batch)
+                result = result + SenderResult(total=len(batch), response='spooled', info=str(e), spooled=len(batch))
+                continue
+            logging.info(f"Zabbix sender batch of {len(batch)} items to {self.server}: {batch_result.info}")
+            if batch_result.failed:
+                hosts = ', '.join(sorted({item['host'] for item in batch}))
+                logging.warning(f"Zabbix rejected {batch_result.failed} of {batch_result.total} items for hosts: {hosts}")
+            result = result + batch_result
+        if self.spool is not None and not result.spooled:
+            result = result + self.replay()
+        return result
+
+    def replay(self, max_batches=REPLAY_BATCHES):
+        """Send up to max_batches requests of spooled values; returns their combined SenderResult."""
+        result = SenderResult()
+        if self.spool is None or time.monotonic() < self._retry_after:
+            return result
+        if not self._replay_lock.acquire(blocking=False):
+            return result  # Another thread is already replaying
+        try:
+            for _ in range(max_batches):
+                batch, position = self.spool.read_batch(self.max_items)
+                if not batch:
+                    if position is not None:
+                        self.spool.commit(position)  # Skip past corrupt lines
+                    break
+                try:
+                    batch_result = self.send(batch)
+                except ZabbixSenderError as e:
+                    logging.error(f"Spool replay stopped: {e}")
+                    self._retry_after = time.monotonic() + RETRY_INTERVAL
+                    break
+                self.spool.commit(position)
+                result = result + batch_result
+            if result.total:
+                stats = self.spool.stats()
+                logging.info(f"Replayed {result.processed} of {result.total} spooled items to {self.server}, "
+                             f"{stats.depth} left, oldest {stats.age:.0f}s old")
+        finally:
+            self._replay_lock.release()
+        return result
+
+    def send(self, items):
+        """Send a list of item dicts in a single request and parse the reply."""
+        now = time.time()
+        packet = pack_packet({
+            'request': 'sender data',
+            'data': items,
+            'clock': int(now),
+            'ns': int((now % 1) * 1e9),
+        })
+        try:
+            with metrics.timed('zabbix.send', timeout_types=(socket.timeout,)), \
+                    socket.create_connection((self.server, self.port), timeout=self.timeout) as sock:
+                sock.sendall(packet)
+                response = read_packet(sock)
+        except (OSError, socket.timeout) as e:
+            raise ZabbixSenderError(f"Failed to send {len(items)} items to {self.server}:{self.port}: {e}") from e
+
+        result = parse_response(response)
+        if result.response != 'success':
+            raise ZabbixSenderError(f"Zabbix server answered '{result.response}': {result.info}")
+        return result